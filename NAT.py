@@ -6,116 +6,89 @@
 # that arise whan an outward bound TCP connection is formed. This is especially interesting with
 # IoT devices on the LAN to see what incoming traffic they draw.
 #
-# Draws on conntrack, the lnimux utility that tracks linux kernel netwoork connections.
+# Draws on conntrack, the lnimux utility that tracks linux kernel netwoork connections (reading the
+# kernel's table directly from /proc/net/nf_conntrack where available).
 
 import os
+import sys
 import json
+import heapq
 import subprocess
 import argparse
-import pickle
+import lannames
+import conntrack
+import dnsquery
+import namecache
 
 parser = argparse.ArgumentParser(description='Show NAT connection mappings.',
+                                 epilog="Traffic accounting (-a) needs conntrack accounting enabled (sysctl net.netfilter.nf_conntrack_acct=1) " +
+                                        "and counts the traffic of current connections only.",
                                  formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=20))
 parser.add_argument('-i', '--Inward', action='store_true', help='Show inward bound mappings.')
 parser.add_argument('-o', '--Outward', action='store_true', help='Show outward bound mappings')
+parser.add_argument('-w', '--Watch', action='store_true', help='After showing the mappings keep watching, showing new (+) and closed (-) mappings as they happen.')
+parser.add_argument('-a', '--Accounting', action='store_true', help='Show the top talkers by traffic instead of the mappings: per LAN host, per remote host and per LAN host and remote port.')
+parser.add_argument('-n', '--Top', type=int, default=10, help='How many top talkers to show in each list (default: 10).')
+parser.add_argument('-j', '--json', action='store_true', help='Print traffic accounting in JSON format')
+parser.add_argument('-c', '--Concurrency', type=int, default=dnsquery.CONCURRENCY, help='Reverse DNS lookups to run at once (default: %d).' % dnsquery.CONCURRENCY)
+parser.add_argument('-t', '--Timeout', type=float, default=dnsquery.TIMEOUT, help='Seconds to wait for each reverse DNS lookup (default: %d).' % dnsquery.TIMEOUT)
 
 args = parser.parse_args()
 
+if args.Concurrency < 1:
+    parser.error("--Concurrency must be at least 1")
+
 devnull = open(os.devnull, 'w')
 
-connections = subprocess.check_output("conntrack -p tcp -L".split(), stderr=devnull).splitlines()
 WAN_IP = subprocess.check_output("wanip -4".split(), stderr=devnull).strip()
-LAN_names = json.loads(subprocess.check_output(["IPnames", "-j"], stderr=devnull))
+LAN_names = lannames.table("IP")
+
+# Reverse DNS names, looked up as needed (see resolve_names)
+DNS_names = {}
 
-name_cache = {}
-name_cache_file = "/tmp/name_cache.pickle"
 
-# Load a name cahce if we have one
-try:
-    with open(name_cache_file) as f:
-        name_cache = pickle.load(f)
-except:
-    pass  # No worries, start with an empty cache
+def resolve_names(IPs):
+    # Reverse DNS is slow and hence we want to prefer a cache, and do the lookups we need all at
+    # once, in parallel, up front. Local LAN names and the WANIP substution are cheap and we can
+    # look them up live. Ideally we would have the DNS (kresd in my case) keep a cache of names
+    # resolved that could consult to have a better chance at seeing the actual name used by a client
+    # in forming the connection
+    cache = namecache.NameCache()
+    try:
+        IPs = [IP for IP in IPs if not IP in LAN_names and IP != WAN_IP]
+        DNS_names.update(namecache.reverse_names(cache, IPs, timeout=args.Timeout, concurrency=args.Concurrency))
+    finally:
+        cache.close()
 
 
 def Name(IP):
-    # Only use the name cache for the costly dig lookup, local LAN names and the WANIP substution
-    # are cheap and we can look them up live. Reverse DNS is slow and hence we want to prefer a
-    # cache. Ideally we would have the DNS (kresd in my case) keep a cache of names resolved that
-    # could consult to have a better chance at seeing the actual name used by a client in forming
-    # the connection
+    # Only use the name cache for the costly reverse DNS lookup, local LAN names and the WANIP
+    # substution are cheap and we can look them up live.
     if IP in LAN_names:
-        name_cache[IP] = LAN_names[IP]
+        return LAN_names[IP]
     elif IP == WAN_IP:
-        name_cache[IP] = "thumbs.place"
-    elif IP in name_cache:
-        pass
+        return "thumbs.place"
+    elif IP in DNS_names:
+        return DNS_names[IP]
     else:
-        dig = subprocess.check_output("dig +short -x {}".format(IP).split(), stderr=devnull).strip()[:-1]
-        if dig:
-            name_cache[IP] = dig
-        else:
-            name_cache[IP] = "unknown"
-
-    return name_cache[IP]
-
-
-Connections = []
-
-for c in connections:
-    fields = c.split()
-
-    # A sample line from conntrack -L:
-    #   00  tcp
-    #   01  6
-    #   02  7411
-    #   03  ESTABLISHED
-    #   04  src=192.168.0.206
-    #   05  dst=13.56.143.44
-    #   06  sport=30291
-    #   07  dport=443
-    #   08  packets=2717
-    #   09  bytes=193825
-    #   10  src=13.56.143.44
-    #   11  dst=203.63.3.28
-    #   12  sport=443
-    #   13  dport=30291
-    #   14  packets=1402
-    #   15  bytes=142342
-    #   16  [ASSURED]
-    #   17  mark=0
-    #   18  use=1
-
-    status = fields[3]
-
-    OB_src_IP = fields[4][4:]
-    OB_dst_IP = fields[5][4:]
-    OB_src_Port = fields[6][6:]
-    OB_dst_Port = fields[7][6:]
-
-    OB_src_Name = Name(OB_src_IP)
-    OB_dst_Name = Name(OB_dst_IP)
-
-    IB_src_IP = fields[10][4:]
-    IB_dst_IP = fields[11][4:]
-    IB_src_Port = fields[12][6:]
-    IB_dst_Port = fields[13][6:]
-
-    IB_src_Name = Name(IB_src_IP)
-    IB_dst_Name = Name(IB_dst_IP)
-
-    if status == "ESTABLISHED":
-        # Store summary info as a 4 tuple of 3 tuples
-        # Each 3 tuple being IP, Name, Port
-        # The 4 tuple being OB source, OB destination, IB source, IB destination
-        Connections.append(((OB_src_IP, OB_src_Name, OB_src_Port),
-                            (OB_dst_IP, OB_dst_Name, OB_dst_Port),
-                            (IB_src_IP, IB_src_Name, IB_src_Port),
-                            (IB_dst_IP, IB_dst_Name, IB_dst_Port)))
+        return "unknown"
+
+
+def flow(c):
+    # The endpoints of a connection as a 4 tuple of 2 tuples
+    # Each 2 tuple being IP, Port
+    # The 4 tuple being OB source, OB destination, IB source, IB destination
+    return ((c.src, c.sport),
+            (c.dst, c.dport),
+            (c.reply_src, c.reply_sport),
+            (c.reply_dst, c.reply_dport))
 
-CONNECTIONS = []
 
-for c in Connections:
+def summarise(flow):
+    # Summary info as a 4 tuple of 3 tuples
+    # Each 3 tuple being IP, Name, Port
+    c = tuple((IP, Name(IP), Port) for (IP, Port) in flow)
+
     OB_key = c[0][0]
     OB_src = "{1} ({0}):{2}".format(c[0][0], c[0][1], c[0][2])
     OB_dst = "{1} ({0}):{2}".format(c[1][0], c[1][1], c[1][2])
@@ -124,8 +97,139 @@ for c in Connections:
     IB_src = "{1} ({0}):{2}".format(c[2][0], c[2][1], c[2][2])
     IB_dst = "{1} ({0}):{2}".format(c[3][0], c[3][1], c[3][2])
 
-    # Store a formatted (ordered) summary as a 6 tuple (2 sort keys and 4 formatted strings)
-    CONNECTIONS.append((OB_key, IB_key, OB_src, OB_dst, IB_src, IB_dst))
+    # A formatted (ordered) summary as a 6 tuple (2 sort keys and 4 formatted strings)
+    return (OB_key, IB_key, OB_src, OB_dst, IB_src, IB_dst)
+
+
+def byte_fmt(num, precision=1, suffix='B'):
+    for unit in ['', 'Ki', 'Mi', 'Gi', 'Ti', 'Pi', 'Ei', 'Zi']:
+        if abs(num) < 1024.0:
+            return ("%3." + str(precision) + "f %s%s") % (num, unit, suffix)
+        num /= 1024.0
+    return ("%." + str(precision) + "f %s%s") % (num, 'Yi', suffix)
+
+
+def account():
+    # Aggregate the conntrack counters in one pass over the table. Each aggregate is a list of
+    # [packets, bytes up, bytes down] (up being from the LAN host to the remote host) keyed on
+    # LAN host IP, remote host IP and (LAN host IP, remote port) respectively.
+    hosts = {}
+    remotes = {}
+    ports = {}
+    counted = 0
+
+    for c in conntrack.read():
+        if c.packets is None:
+            continue
+
+        if c.reply_dst == WAN_IP or c.src == WAN_IP:
+            # Outward bound (masqueraded or from the router itself)
+            host, remote, port = c.src, c.dst, c.dport
+            up, down = c.bytes, c.reply_bytes
+        elif c.dst == WAN_IP:
+            # Inward bound (port forwarded to a LAN host, or to the router itself)
+            host, remote, port = c.reply_src, c.src, c.dport
+            up, down = c.reply_bytes, c.bytes
+        else:
+            continue  # Traffic that doesn't cross the WAN
+
+        packets = c.packets + c.reply_packets
+        for (table, key) in ((hosts, host), (remotes, remote), (ports, (host, port))):
+            total = table.get(key)
+            if total is None:
+                table[key] = [packets, up, down]
+            else:
+                total[0] += packets
+                total[1] += up
+                total[2] += down
+        counted += 1
+
+    if counted == 0:
+        print >> sys.stderr, "No traffic counters found. Is conntrack accounting enabled (sysctl net.netfilter.nf_conntrack_acct=1)?"
+
+    # The top talkers by bytes. A heap finds them without sorting every entry.
+    def top(table):
+        return heapq.nlargest(args.Top, table.iteritems(), key=lambda item: item[1][1] + item[1][2])
+
+    top_hosts = top(hosts)
+    top_remotes = top(remotes)
+    top_ports = top(ports)
+
+    # Only the names we'll show need looking up
+    resolve_names(set([IP for (IP, total) in top_hosts] + [IP for (IP, total) in top_remotes] + [key[0] for (key, total) in top_ports]))
+
+    def entry(IP, total, port=None):
+        result = {"IP": IP, "name": Name(IP), "packets": total[0], "bytes": total[1] + total[2], "up": total[1], "down": total[2]}
+        if not port is None:
+            result["port"] = port
+        return result
+
+    results = {"hosts": [entry(IP, total) for (IP, total) in top_hosts],
+               "remotes": [entry(IP, total) for (IP, total) in top_remotes],
+               "ports": [entry(key[0], total, key[1]) for (key, total) in top_ports]}
+
+    if args.json:
+        print json.dumps(results)
+    else:
+        template = "{:<50} {:>12} {:>12} {:>12} {:>10}"
+        for (title, key) in (("LAN host", "hosts"), ("Remote host", "remotes"), ("LAN host:Remote port", "ports")):
+            print template.format("Top {} by traffic".format(title), "Total", "Up", "Down", "Packets")
+            for e in results[key]:
+                label = "{} ({})".format(e["name"], e["IP"]) + (":{}".format(e["port"]) if "port" in e else "")
+                print template.format(label, byte_fmt(e["bytes"]), byte_fmt(e["up"]), byte_fmt(e["down"]), e["packets"])
+            if key != "ports":
+                print
+
+
+def watch(events, flows):
+    # Maintain the table of established connections from conntrack events, keyed on the original
+    # direction's endpoints, and report only the changes. Names are only looked up for endpoints
+    # we haven't seen before, so the work done is proportional to the changes, not the table size.
+    table = dict((f[:2], f) for f in flows)
+
+    def report(change, f):
+        c = summarise(f)
+        if args.Outward:
+            print "{} {} -> {}".format(change, c[2], c[3])
+        if args.Inward:
+            print "{} {} -> {}".format(change, c[4], c[5])
+        sys.stdout.flush()
+
+    for (event, c) in events:
+        f = flow(c)
+        key = f[:2]
+        if event != "DESTROY" and c.state == "ESTABLISHED":
+            if not key in table:
+                table[key] = f
+                resolve_names(set(IP for (IP, Port) in f if not IP in DNS_names))
+                report("+", f)
+        elif key in table:
+            report("-", table.pop(key))
+
+
+# Traffic accounting is a report of its own
+if args.Accounting:
+    account()
+    sys.exit()
+
+# Subscribe to changes before reading the table so none are missed in between
+if args.Watch:
+    events = conntrack.events("tcp", "UPDATE,DESTROY")
+
+Flows = []
+
+# Only established TCP connections are of interest, and conntrack filters them out of the table
+# as it streams through it.
+for c in conntrack.read("tcp", "ESTABLISHED"):
+    Flows.append(flow(c))
+
+# Look up all the names we need at once
+resolve_names(set(IP for f in Flows for (IP, Port) in f))
+
+CONNECTIONS = []
+
+for f in Flows:
+    CONNECTIONS.append(summarise(f))
 
 # Print Outward Bound connections first
 if args.Outward:
@@ -137,6 +241,10 @@ if args.Inward:
     for c in sorted(CONNECTIONS, key=lambda conn: (conn[2], conn[3])):
         print "{} -> {}".format(c[4], c[5])
 
-# Save the name cache
-with open(name_cache_file, 'wb') as f:
-    pickle.dump(name_cache, f)
+# Then the changes as they happen
+if args.Watch:
+    sys.stdout.flush()
+    try:
+        watch(events, Flows)
+    except KeyboardInterrupt:
+        pass
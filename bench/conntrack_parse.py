@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+# Benchmarks parsing a conntrack table the way NAT.py used to (slurp the whole "conntrack -L"
+# output, split every line and pick fields by position) against conntrack's streaming reader.
+#
+# The table is a synthetic /proc/net/nf_conntrack of LINES connections, a mix of established and
+# closing TCP connections and UDP flows, generated afresh on each run (pass a filename as the
+# second argument to keep a copy of it).
+#
+# Each method runs in a fresh python process so the memory figures (RSS growth) are comparable.
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+LINES = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+KEEP = sys.argv[2] if len(sys.argv) > 2 else None
+
+MEASURE = '''
+import sys, time
+sys.path.insert(0, %(path)r)
+import conntrack
+def rss():
+    with open("/proc/self/status") as status:
+        return [int(line.split()[1]) for line in status if line.startswith("VmRSS:")][0]
+before = rss()
+start = time.time()
+flows = []
+if %(method)r == "slurp":
+    with open(%(file)r) as f:
+        connections = f.read().splitlines()
+    for c in connections:
+        fields = c.split()[2:]
+        if fields[0] == "tcp" and fields[3] == "ESTABLISHED":
+            flows.append(((fields[4][4:], fields[6][6:]), (fields[5][4:], fields[7][6:]),
+                          (fields[10][4:], fields[12][6:]), (fields[11][4:], fields[13][6:])))
+else:
+    with open(%(file)r) as f:
+        for c in conntrack.read("tcp", "ESTABLISHED", f):
+            flows.append(((c.src, c.sport), (c.dst, c.dport), (c.reply_src, c.reply_sport), (c.reply_dst, c.reply_dport)))
+elapsed = time.time() - start
+print elapsed, rss() - before, len(flows), hash(tuple(flows))
+'''
+
+def make_table(path):
+    random.seed(1)
+    wan = "203.63.3.28"
+    with open(path, "w") as table:
+        for i in range(LINES):
+            lan = "192.168.%d.%d" % (random.randint(0, 3), random.randint(2, 254))
+            remote = "%d.%d.%d.%d" % (random.randint(1, 223), random.randint(0, 255), random.randint(0, 255), random.randint(1, 254))
+            sport = random.randint(1024, 65535)
+            kind = random.random()
+            if kind < 0.2:
+                table.write("ipv4     2 udp      17 %d src=%s dst=%s sport=%d dport=53 packets=1 bytes=70 src=%s dst=%s sport=53 dport=%d packets=1 bytes=120 mark=0 zone=0 use=2\n"
+                            % (random.randint(1, 180), lan, remote, sport, remote, wan, sport))
+            else:
+                state = "ESTABLISHED" if kind < 0.8 else "TIME_WAIT"
+                table.write("ipv4     2 tcp      6 %d %s src=%s dst=%s sport=%d dport=443 packets=%d bytes=%d src=%s dst=%s sport=443 dport=%d packets=%d bytes=%d [ASSURED] mark=0 zone=0 use=2\n"
+                            % (random.randint(1, 432000), state, lan, remote, sport, random.randint(1, 9999), random.randint(60, 9999999),
+                               remote, wan, sport, random.randint(1, 9999), random.randint(60, 9999999)))
+
+def measure(method, path):
+    code = MEASURE % {"path": sys.path[0], "method": method, "file": path}
+    elapsed, rss, flows, digest = subprocess.check_output([sys.executable, "-c", code]).split()
+    return float(elapsed), int(rss), int(flows), digest
+
+work_dir = tempfile.mkdtemp()
+try:
+    table = KEEP or os.path.join(work_dir, "nf_conntrack")
+    make_table(table)
+    print "%d lines, %d KiB" % (LINES, os.path.getsize(table) // 1024)
+
+    digests = set()
+    for method in ("slurp", "stream"):
+        elapsed, rss, flows, digest = measure(method, table)
+        digests.add(digest)
+        print "%-8s %8.3fs %8d KiB RSS growth  %d established TCP flows" % (method, elapsed, rss, flows)
+    print "Results identical:", len(digests) == 1
+finally:
+    shutil.rmtree(work_dir)
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+#
+# Times lanip.py's pre-flight check (-C) of a merge of a synthetic backup file with the DHCP and
+# Majordomo configs (served by a stand in for uci that prints them as "uci show" would) at
+# doubling sizes, from ENTRIES rows up, to show that it takes time in proportion to the rows.
+#
+# The backup file has every device, the dhcp config about a half of them and the majordomo config
+# about a third, and a few rows in the file reuse an IP or name (so there are conflicts to find).
+#
+# Each size is run RUNS times (in a fresh python process each time, as from the command line) and
+# the best time is reported, with the time per row.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+ENTRIES = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+RUNS = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+SIZES = 3
+
+LANIP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lanip.py")
+
+def IP(i):
+    return "10.%d.%d.%d" % (i // 62500, i // 250 % 250, i % 250 + 1)
+
+def MAC(i):
+    return "02:00:00:%02X:%02X:%02X" % (i >> 16 & 255, i >> 8 & 255, i & 255)
+
+def make_data(work_dir, entries):
+    with open(os.path.join(work_dir, "backup"), "w") as backup:
+        for i in range(entries):
+            # Every thousandth row reuses the IP of the row before it
+            backup.write("host%d %s %s\n" % (i, IP(i - 1 if i % 1000 == 999 else i), MAC(i)))
+
+    with open(os.path.join(work_dir, "dhcp.show"), "w") as dhcp:
+        for (n, i) in enumerate(range(0, entries, 2)):
+            dhcp.write("dhcp.cfg%06x=host\ndhcp.cfg%06x.name='host%d'\ndhcp.cfg%06x.ip='%s'\ndhcp.cfg%06x.mac='%s'\n" % (n, n, i, n, IP(i), n, MAC(i).lower()))
+
+    with open(os.path.join(work_dir, "majordomo.show"), "w") as majordomo:
+        for (n, i) in enumerate(range(0, entries, 3)):
+            majordomo.write("majordomo.cfg%06x=static_name\nmajordomo.cfg%06x.name='host%d'\nmajordomo.cfg%06x.mac='%s'\n" % (n, n, i, n, MAC(i)))
+
+work_dir = tempfile.mkdtemp()
+try:
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir)
+    with open(os.path.join(bin_dir, "uci"), "w") as uci:
+        uci.write("#!/bin/sh\ncat %s/$3.show 2>/dev/null\n" % work_dir)
+    os.chmod(os.path.join(bin_dir, "uci"), 0755)
+    env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ["PATH"])
+
+    print "lanip -C backup,UCI, best of %d runs" % RUNS
+    for size in range(SIZES):
+        entries = ENTRIES * 2 ** size
+        make_data(work_dir, entries)
+
+        best = None
+        for run in range(RUNS):
+            start = time.time()
+            check = subprocess.Popen([sys.executable, LANIP, "-C", os.path.join(work_dir, "backup") + ",UCI"],
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+            (summary, conflicts) = check.communicate()
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print "%6d rows %8.1f ms %6.1f us/row  %s" % (entries, best * 1000, best * 1e6 / entries, summary.strip())
+finally:
+    shutil.rmtree(work_dir)
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+#
+# Measures load time and memory footprint of the old pickled name cache against namecache's
+# sqlite store, with caches of 10k and 100k names.
+#
+# Each measurement runs in a fresh python process so the memory figures (RSS growth) are
+# not polluted by the others. A run of NAT.py needs the names for a few hundred to a few thousand
+# IPs, so the sqlite store is measured fetching LOOKUPS of them.
+
+import os
+import sys
+import time
+import pickle
+import shutil
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import namecache
+
+SIZES = [10000, 100000]
+LOOKUPS = 1000
+
+MEASURE = '''
+import sys, time, pickle
+sys.path.insert(0, %(path)r)
+import namecache
+def rss():
+    with open("/proc/self/status") as status:
+        return [int(line.split()[1]) for line in status if line.startswith("VmRSS:")][0]
+before = rss()
+start = time.time()
+if %(method)r == "pickle":
+    with open(%(file)r) as f:
+        cache = pickle.load(f)
+    names = dict((IP, cache[IP]) for IP in %(keys)r if IP in cache)
+else:
+    cache = namecache.NameCache(%(file)r, max_entries=%(size)d)
+    names = cache.get_many(%(keys)r)
+elapsed = time.time() - start
+print elapsed, rss() - before, len(names)
+'''
+
+def IP(i):
+    return "10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255, i & 255)
+
+def measure(method, path, size, keys):
+    code = MEASURE % {"path": os.path.dirname(namecache.__file__) or ".", "method": method, "file": path, "size": size, "keys": keys}
+    elapsed, rss, found = subprocess.check_output([sys.executable, "-c", code]).split()
+    return float(elapsed), int(rss), int(found)
+
+work_dir = tempfile.mkdtemp()
+try:
+    print "%-8s %-8s %10s %10s %10s" % ("entries", "store", "file KiB", "load s", "RSS KiB")
+    for size in SIZES:
+        expires = time.time() + 3600
+        entries = dict((IP(i), ("host-%d.example.com" % i, expires)) for i in range(size))
+        keys = [IP(i) for i in range(0, size, size // LOOKUPS)]
+
+        pickle_file = os.path.join(work_dir, "cache%d.pickle" % size)
+        with open(pickle_file, "wb") as f:
+            pickle.dump(entries, f)
+
+        sqlite_file = os.path.join(work_dir, "cache%d.sqlite" % size)
+        cache = namecache.NameCache(sqlite_file, max_entries=size)
+        cache.put_many(entries)
+        cache.close()
+
+        for method, path in (("pickle", pickle_file), ("sqlite", sqlite_file)):
+            elapsed, rss, found = measure(method, path, size, keys)
+            print "%-8d %-8s %10d %10.3f %10d" % (size, method, os.path.getsize(path) // 1024, elapsed, rss)
+finally:
+    shutil.rmtree(work_dir)
@@ -0,0 +1,167 @@
+#!/usr/bin/python
+#
+# Benchmarks ncdip fetching the registered IPs of DOMAINS domains against a local stub of the
+# Namecheap API, the way ncdip used to (one urllib request per domain, one after the other, each
+# on a new connection) against ncdip itself (parallel calls on keep-alive connections).
+#
+# The stub replays responses recorded from the API (with the domain names and IPs substituted)
+# and simulates the costs of the real thing: HANDSHAKE seconds for each new connection (the TLS
+# handshake) and LATENCY seconds for each request. It also throttles the first getHosts call for
+# every THROTTLE'th domain (with the API's "Too many requests" error) so ncdip has to retry those.
+#
+# Both methods' results are checked against the IPs the stub serves.
+
+import os
+import sys
+import json
+import time
+import shutil
+import urllib
+import tempfile
+import threading
+import subprocess
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+DOMAINS = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+HANDSHAKE = 0.15
+LATENCY = 0.05
+THROTTLE = 10
+
+NCDIP = os.path.join(sys.path[0], "ncdip.py")
+
+GETLIST = '''<?xml version="1.0" encoding="utf-8"?>
+<ApiResponse Status="OK" xmlns="http://api.namecheap.com/xml.response">
+  <Errors />
+  <Warnings />
+  <RequestedCommand>namecheap.domains.getList</RequestedCommand>
+  <CommandResponse Type="namecheap.domains.getList">
+    <DomainGetListResult>
+%s
+    </DomainGetListResult>
+    <Paging>
+      <TotalItems>%d</TotalItems>
+      <CurrentPage>%d</CurrentPage>
+      <PageSize>%d</PageSize>
+    </Paging>
+  </CommandResponse>
+  <Server>PHX01APIEXT03</Server>
+  <GMTTimeDifference>--5:00</GMTTimeDifference>
+  <ExecutionTime>0.047</ExecutionTime>
+</ApiResponse>'''
+
+DOMAIN = '''      <Domain ID="%d" Name="%s" User="thumbs" Created="04/11/2016" Expires="04/11/2027" IsExpired="false" IsLocked="false" AutoRenew="true" WhoisGuard="ENABLED" IsPremium="false" IsOurDNS="true" />'''
+
+GETHOSTS = '''<?xml version="1.0" encoding="utf-8"?>
+<ApiResponse Status="OK" xmlns="http://api.namecheap.com/xml.response">
+  <Errors />
+  <Warnings />
+  <RequestedCommand>namecheap.domains.dns.gethosts</RequestedCommand>
+  <CommandResponse Type="namecheap.domains.dns.getHosts">
+    <DomainDNSGetHostsResult Domain="%s" EmailType="FWD" IsUsingOurDNS="true">
+      <host HostId="1083261" Name="www" Type="CNAME" Address="%s." MXPref="10" TTL="1800" AssociatedAppTitle="" FriendlyName="" IsActive="true" IsDDNSEnabled="false" />
+      <host HostId="1083262" Name="@" Type="A" Address="%s" MXPref="10" TTL="60" AssociatedAppTitle="" FriendlyName="" IsActive="true" IsDDNSEnabled="true" />
+      <host HostId="1083263" Name="@" Type="TXT" Address="v=spf1 include:spf.efwd.registrar-servers.com ~all" MXPref="10" TTL="1800" AssociatedAppTitle="" FriendlyName="" IsActive="true" IsDDNSEnabled="false" />
+    </DomainDNSGetHostsResult>
+  </CommandResponse>
+  <Server>PHX01APIEXT01</Server>
+  <GMTTimeDifference>--5:00</GMTTimeDifference>
+  <ExecutionTime>0.021</ExecutionTime>
+</ApiResponse>'''
+
+THROTTLED = '''<?xml version="1.0" encoding="utf-8"?>
+<ApiResponse Status="ERROR" xmlns="http://api.namecheap.com/xml.response">
+  <Errors>
+    <Error Number="500000">Too many requests</Error>
+  </Errors>
+  <Warnings />
+  <RequestedCommand />
+  <Server>PHX01APIEXT02</Server>
+  <GMTTimeDifference>--5:00</GMTTimeDifference>
+  <ExecutionTime>0</ExecutionTime>
+</ApiResponse>'''
+
+domains = ["thumbs%03d.place" % i for i in range(DOMAINS)]
+IPs = dict((domain, "203.63.%d.%d" % (i // 250, i % 250 + 1)) for (i, domain) in enumerate(domains))
+
+class Stub(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    connections = 0
+    requests = 0
+    throttled = set()
+
+class API(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+        time.sleep(HANDSHAKE)
+
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(LATENCY)
+        query = dict(urlparse.parse_qsl(urlparse.urlsplit(self.path).query))
+        if query["Command"] == "namecheap.domains.getList":
+            (page, size) = (int(query.get("Page", 1)), int(query.get("PageSize", 20)))
+            listed = list(enumerate(domains))[(page - 1) * size:page * size]
+            body = GETLIST % ("\n".join(DOMAIN % (i, d) for (i, d) in listed), len(domains), page, size)
+        else:
+            domain = query["SLD"] + "." + query["TLD"]
+            if domains.index(domain) % THROTTLE == 0 and not domain in self.server.throttled:
+                self.server.throttled.add(domain)
+                body = THROTTLED
+            else:
+                body = GETHOSTS % (domain, domain, IPs[domain])
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def before(url):
+    # The way ncdip used to do it
+    results = {}
+    for domain in domains:
+        (SLD, TLD) = domain.split(".")
+        response = urllib.urlopen(url + "?ApiUser=thumbs&UserName=thumbs&ApiKey=key&ClientIP=203.63.3.28" +
+                                  "&Command=namecheap.domains.dns.getHosts&SLD={}&TLD={}".format(SLD, TLD)).read()
+        results[domain] = response.split('Type="A" Address="')[1].split('"')[0] if 'Type="A"' in response else None
+    return results
+
+def after(url, home):
+    env = dict(os.environ, HOME=home, PATH=os.path.join(home, "bin") + os.pathsep + os.environ["PATH"])
+    return json.loads(subprocess.check_output([sys.executable, NCDIP, "-j", "-R", "100000", "-A", url], env=env))
+
+work_dir = tempfile.mkdtemp()
+server = Stub(("127.0.0.1", 0), API)
+threading.Thread(target=server.serve_forever).start()
+try:
+    os.makedirs(os.path.join(work_dir, ".auth"))
+    with open(os.path.join(work_dir, ".auth", "namecheap.auth"), "w") as auth:
+        auth.write("username=thumbs\nAPIkey=key\n")
+    os.makedirs(os.path.join(work_dir, "bin"))
+    with open(os.path.join(work_dir, "bin", "wanip"), "w") as wanip:
+        wanip.write("#!/bin/sh\necho 203.63.3.28\n")
+    os.chmod(os.path.join(work_dir, "bin", "wanip"), 0755)
+
+    url = "http://127.0.0.1:%d/xml.response" % server.server_address[1]
+    print "%d domains, %.2fs per connection, %.2fs per request, every %dth domain throttled once" % (DOMAINS, HANDSHAKE, LATENCY, THROTTLE)
+
+    for (method, run) in (("before", lambda: before(url)), ("after", lambda: after(url, work_dir))):
+        server.connections = server.requests = 0
+        server.throttled = set() if method == "after" else set(domains)
+        start = time.time()
+        results = run()
+        elapsed = time.time() - start
+        print "%-7s %7.2fs %4d connections %4d requests  results correct: %s" % (method, elapsed, server.connections, server.requests, results == IPs)
+finally:
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(work_dir)
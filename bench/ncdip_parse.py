@@ -0,0 +1,131 @@
+#!/usr/bin/python
+#
+# Benchmarks parsing Namecheap API responses the way ncdip used to (read the whole response and
+# build a tree of it with ElementTree.fromstring) against ncdip's incremental parsing (iterparse,
+# keeping no more of the tree than it needs and stopping as soon as it has what it wants).
+#
+# The responses are synthetic: a getList response listing DOMAINS domains and a getHosts response
+# with HOSTS host records, the DDNS enabled A record among the first of them.
+#
+# ncdip's own parsing functions are used, loaded by running ncdip (with a primed cache so that it
+# makes no API calls), and each method runs in a fresh python process so the memory figures (RSS
+# growth) are comparable.
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+DOMAINS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+HOSTS = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+NCDIP = os.path.join(sys.path[0], "ncdip.py")
+
+MEASURE = '''
+import os, sys, time
+def rss():
+    with open("/proc/self/status") as status:
+        return [int(line.split()[1]) for line in status if line.startswith("VmRSS:")][0]
+prefix = "{http://api.namecheap.com/xml.response}"
+if %(method)r == "tree":
+    import xml.etree.ElementTree as ET
+else:
+    # Load ncdip's functions (its output, from the primed cache, isn't wanted)
+    sys.argv = ["ncdip", "-j"]
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    ncdip = {"__name__": "ncdip"}
+    execfile(%(ncdip)r, ncdip)
+    sys.stdout = stdout
+before = rss()
+start = time.time()
+with open(%(file)r) as response:
+    if %(method)r == "tree":
+        tree = ET.fromstring(response.read())
+        if %(command)r == "getList":
+            result = [Domain.attrib["Name"] for Domain in tree.find(prefix + "CommandResponse").find(prefix + "DomainGetListResult").findall(prefix + "Domain")]
+        else:
+            result = [host.attrib["Address"] for host in tree.find(prefix + "CommandResponse").find(prefix + "DomainDNSGetHostsResult").findall(prefix + "host")
+                      if host.attrib["Type"] == "A" and host.attrib["IsDDNSEnabled"] == "true"][0]
+    else:
+        if %(command)r == "getList":
+            result = ncdip["getDomainPage"](response)[0]
+        else:
+            result = ncdip["getDDNSHost"](response)[0]
+elapsed = time.time() - start
+print elapsed, rss() - before, hash(str(result))
+'''
+
+HEAD = '''<?xml version="1.0" encoding="utf-8"?>
+<ApiResponse Status="OK" xmlns="http://api.namecheap.com/xml.response">
+  <Errors />
+  <Warnings />
+  <RequestedCommand>%s</RequestedCommand>
+  <CommandResponse Type="%s">
+'''
+
+TAIL = '''  </CommandResponse>
+  <Server>PHX01APIEXT03</Server>
+  <GMTTimeDifference>--5:00</GMTTimeDifference>
+  <ExecutionTime>0.047</ExecutionTime>
+</ApiResponse>'''
+
+def make_getList(path):
+    with open(path, "w") as f:
+        f.write(HEAD % ("namecheap.domains.getList", "namecheap.domains.getList"))
+        f.write("    <DomainGetListResult>\n")
+        for i in range(DOMAINS):
+            f.write('      <Domain ID="%d" Name="thumbs%05d.place" User="thumbs" Created="04/11/2016" Expires="04/11/2027" IsExpired="false" '
+                    'IsLocked="false" AutoRenew="true" WhoisGuard="ENABLED" IsPremium="false" IsOurDNS="true" />\n' % (i, i))
+        f.write("    </DomainGetListResult>\n")
+        f.write("    <Paging>\n      <TotalItems>%d</TotalItems>\n      <CurrentPage>1</CurrentPage>\n      <PageSize>%d</PageSize>\n    </Paging>\n" % (DOMAINS, DOMAINS))
+        f.write(TAIL)
+
+def make_getHosts(path):
+    with open(path, "w") as f:
+        f.write(HEAD % ("namecheap.domains.dns.getHosts", "namecheap.domains.dns.getHosts"))
+        f.write('    <DomainDNSGetHostsResult Domain="thumbs.place" EmailType="FWD" IsUsingOurDNS="true">\n')
+        for i in range(HOSTS):
+            ddns = "true" if i == 1 else "false"
+            f.write('      <host HostId="%d" Name="host%d" Type="A" Address="203.63.%d.%d" MXPref="10" TTL="1800" AssociatedAppTitle="" '
+                    'FriendlyName="" IsActive="true" IsDDNSEnabled="%s" />\n' % (i, i, i // 250, i % 250 + 1, ddns))
+        f.write("    </DomainDNSGetHostsResult>\n")
+        f.write(TAIL)
+
+def measure(method, command, path, home):
+    code = MEASURE % {"method": method, "command": command, "file": path, "ncdip": NCDIP}
+    env = dict(os.environ, HOME=home, PATH=os.path.join(home, "bin") + os.pathsep + os.environ["PATH"])
+    elapsed, rss, digest = subprocess.check_output([sys.executable, "-c", code], env=env).split()
+    return float(elapsed), int(rss), digest
+
+work_dir = tempfile.mkdtemp()
+try:
+    # Just enough for ncdip to run without calling the API: an auth file, wanip and a fresh cache
+    os.makedirs(os.path.join(work_dir, ".auth"))
+    with open(os.path.join(work_dir, ".auth", "namecheap.auth"), "w") as auth:
+        auth.write("username=thumbs\nAPIkey=key\n")
+    os.makedirs(os.path.join(work_dir, "bin"))
+    with open(os.path.join(work_dir, "bin", "wanip"), "w") as wanip:
+        wanip.write("#!/bin/sh\necho 203.63.3.28\n")
+    os.chmod(os.path.join(work_dir, "bin", "wanip"), 0755)
+    os.makedirs(os.path.join(work_dir, ".cache"))
+    with open(os.path.join(work_dir, ".cache", "ncdip.json"), "w") as cache:
+        json.dump({"getList": {"time": time.time(), "domains": []}, "getHosts": {}}, cache)
+
+    for (command, make, count) in (("getList", make_getList, "%d domains" % DOMAINS), ("getHosts", make_getHosts, "%d hosts" % HOSTS)):
+        path = os.path.join(work_dir, command + ".xml")
+        make(path)
+        print "%s response, %s, %d KiB" % (command, count, os.path.getsize(path) // 1024)
+
+        digests = set()
+        for method in ("tree", "iterparse"):
+            elapsed, rss, digest = measure(method, command, path, work_dir)
+            digests.add(digest)
+            print "  %-10s %8.4fs %8d KiB RSS growth" % (method, elapsed, rss)
+        print "  Results identical:", len(digests) == 1
+finally:
+    shutil.rmtree(work_dir)
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+#
+# Benchmarks routes.py end to end on a synthetic ARP table of ENTRIES entries, the way it used to
+# work (running MACnames -j and IPnames -j for its name tables and reading the ARP table with
+# fileinput) against routes.py itself (building the name tables in process with lannames), asked
+# for IPv4 neighbours only (-4) as that's all routes.py used to report.
+#
+# The names come from synthetic DHCP leases and dhcp and majordomo configs (served by a stand in
+# for uci that prints them as "uci show" would) with about a third of the ARP entries in each. The
+# tables are built here, not fetched from namesd, in both cases.
+#
+# Each method is run RUNS times (in a fresh python process each time, as from the command line) and
+# the best time is reported. Both methods' outputs are checked to be the same.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+ENTRIES = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+RUNS = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+REPO = sys.path[0]
+
+# Runs a script from the repo with lannames reading the synthetic leases (and not asking namesd)
+RUNNER = '''#!%(python)s
+import sys
+sys.path.insert(0, %(repo)r)
+import lannames
+lannames.DHCP_LEASES = %(leases)r
+lannames.SOCKET = %(socket)r
+sys.argv = [%(script)r] + sys.argv[1:]
+execfile(%(script)r, {"__name__": "__main__"})
+'''
+
+def IP(i):
+    return "10.%d.%d.%d" % (i // 62500, i // 250 % 250, i % 250 + 1)
+
+def MAC(i):
+    return "02:00:00:%02x:%02x:%02x" % (i >> 16 & 255, i >> 8 & 255, i & 255)
+
+def make_data(work_dir):
+    with open(os.path.join(work_dir, "arp"), "w") as arp:
+        arp.write("IP address       HW type     Flags       HW address            Mask     Device\n")
+        for i in range(ENTRIES):
+            flags = "0x0" if i % 50 == 0 else ("0x6" if i % 20 == 0 else "0x2")
+            arp.write("%-16s 0x1         %-11s %-21s *        br-lan\n" % (IP(i), flags, MAC(i) if flags != "0x0" else "00:00:00:00:00:00"))
+
+    with open(os.path.join(work_dir, "leases"), "w") as leases:
+        for i in range(0, ENTRIES, 3):
+            leases.write("1700000000 %s %s lease%d *\n" % (MAC(i).lower(), IP(i), i))
+
+    with open(os.path.join(work_dir, "dhcp.show"), "w") as dhcp:
+        for (n, i) in enumerate(range(1, ENTRIES, 3)):
+            dhcp.write("dhcp.cfg%06x=host\ndhcp.cfg%06x.name='host%d'\ndhcp.cfg%06x.ip='%s'\ndhcp.cfg%06x.mac='%s'\n" % (n, n, i, n, IP(i), n, MAC(i)))
+
+    with open(os.path.join(work_dir, "majordomo.show"), "w") as majordomo:
+        for (n, i) in enumerate(range(2, ENTRIES, 6)):
+            majordomo.write("majordomo.cfg%06x=static_name\nmajordomo.cfg%06x.name='static%d'\nmajordomo.cfg%06x.mac='%s'\n" % (n, n, i, n, MAC(i)))
+
+def make_scripts(work_dir):
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir)
+
+    def script(name, content):
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(content)
+        os.chmod(path, 0755)
+        return path
+
+    script("uci", "#!/bin/sh\ncat %s/$3.show 2>/dev/null\n" % work_dir)
+
+    def runner(name, path):
+        return script(name, RUNNER % {"python": sys.executable, "repo": REPO, "leases": os.path.join(work_dir, "leases"),
+                                      "socket": os.path.join(work_dir, "no.sock"), "script": path})
+
+    runner("MACnames", os.path.join(REPO, "MACnames.py"))
+    runner("IPnames", os.path.join(REPO, "IPnames.py"))
+
+    # routes.py as it was, before it used lannames (reading the synthetic ARP table)
+    changed = subprocess.check_output(["git", "-C", REPO, "log", "-1", "--format=%H", "-S", "import lannames", "--", "routes.py"]).strip()
+    before = subprocess.check_output(["git", "-C", REPO, "show", (changed + "~1" if changed else "HEAD") + ":routes.py"])
+    with open(os.path.join(work_dir, "routes_before.py"), "w") as f:
+        f.write(before.replace('ARP = "/proc/net/arp"', 'ARP = %r' % os.path.join(work_dir, "arp")))
+
+    return {"before": [runner("routes_before", os.path.join(work_dir, "routes_before.py"))],
+            "after": [runner("routes_after", os.path.join(REPO, "routes.py")), "-4", "-A", os.path.join(work_dir, "arp")]}
+
+work_dir = tempfile.mkdtemp()
+try:
+    make_data(work_dir)
+    commands = make_scripts(work_dir)
+    env = dict(os.environ, PATH=os.path.join(work_dir, "bin") + os.pathsep + os.environ["PATH"])
+
+    print "%d ARP entries, best of %d runs" % (ENTRIES, RUNS)
+    outputs = {}
+    for method in ("before", "after"):
+        best = None
+        for run in range(RUNS):
+            start = time.time()
+            outputs[method] = subprocess.check_output(commands[method] + ["-i", "-t", "-d", "-f", "-s", "-H"], env=env)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print "%-7s %8.1f ms" % (method, best * 1000)
+    print "Outputs identical:", outputs["before"] == outputs["after"]
+finally:
+    shutil.rmtree(work_dir)
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+#
+# Benchmarks reading static leases with one "uci get" per option (as IPnames and MACnames used to)
+# against a single uciconf snapshot.
+#
+# Runs off the router: a synthetic dhcp and majordomo config of HOSTS hosts is served by a small
+# shell stand-in for uci placed at the front of the PATH, which counts its invocations.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import uciconf
+
+HOSTS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+UCI_SHIM = '''#!/bin/sh
+echo >> "%(count)s"
+[ "$1" = "-q" ] && shift
+case "$1" in
+	get) line=$(grep -F -m1 "$2=" "%(dump)s") || exit 1; echo "${line#*=}" | sed "s/^'\\\\(.*\\\\)'$/\\\\1/" ;;
+	show) grep "^$2\\\\." "%(dump)s" ;;
+esac
+'''
+
+devnull = open(os.devnull, 'w')
+
+def make_dump(path):
+	with open(path, "w") as dump:
+		for i in range(HOSTS):
+			dump.write("dhcp.@host[%d]=host\n" % i)
+			dump.write("dhcp.@host[%d].name='host%d'\n" % (i, i))
+			dump.write("dhcp.@host[%d].ip='10.0.%d.%d'\n" % (i, i // 250, i % 250 + 2))
+			dump.write("dhcp.@host[%d].mac='02:00:00:00:%02X:%02X'\n" % (i, i // 256, i % 256))
+		for i in range(HOSTS):
+			dump.write("majordomo.@static_name[%d]=static_name\n" % i)
+			dump.write("majordomo.@static_name[%d].name='host%d'\n" % (i, i))
+			dump.write("majordomo.@static_name[%d].mac='02:00:00:00:%02X:%02X'\n" % (i, i // 256, i % 256))
+
+def uci_get(key):
+	return subprocess.check_output(["uci", "get", key], stderr=devnull).strip()
+
+def per_option():
+	# The way MACnames read the configs before uciconf
+	conf = {}
+	for config, stype in (("dhcp", "host"), ("majordomo", "static_name")):
+		i = 0
+		while 0 == subprocess.call(["uci", "get", "%s.@%s[%d]" % (config, stype, i)], stdout=devnull, stderr=devnull):
+			conf[uci_get("%s.@%s[%d].mac" % (config, stype, i)).upper()] = uci_get("%s.@%s[%d].name" % (config, stype, i))
+			i += 1
+	return conf
+
+def snapshot():
+	conf = {}
+	for config, stype in (("dhcp", "host"), ("majordomo", "static_name")):
+		for section in uciconf.sections(uciconf.show(config), stype):
+			conf[uciconf.option(section, "mac").upper()] = uciconf.option(section, "name")
+	return conf
+
+def measure(label, method, count_file):
+	open(count_file, "w").close()
+	start = time.time()
+	result = method()
+	elapsed = time.time() - start
+	forks = sum(1 for _ in open(count_file))
+	print "%-12s %6d forks %8.3fs  (%d names)" % (label, forks, elapsed, len(result))
+	return result
+
+work_dir = tempfile.mkdtemp()
+try:
+	dump = os.path.join(work_dir, "uci.dump")
+	count = os.path.join(work_dir, "uci.count")
+	make_dump(dump)
+
+	with open(os.path.join(work_dir, "uci"), "w") as shim:
+		shim.write(UCI_SHIM % {"dump": dump, "count": count})
+	os.chmod(os.path.join(work_dir, "uci"), 0755)
+	os.environ["PATH"] = work_dir + os.pathsep + os.environ["PATH"]
+
+	print "%d hosts in dhcp and majordomo" % HOSTS
+	before = measure("uci get", per_option, count)
+	after = measure("uciconf", snapshot, count)
+	print "Results identical:", before == after
+finally:
+	shutil.rmtree(work_dir)
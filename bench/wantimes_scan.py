@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+# Benchmarks wantimes scanning a set of rotated system logs serially (-j 1) against scanning them
+# in parallel processes (-j JOBS, by default the number of CPUs but at least 2).
+#
+# The logs are FILES synthetic rotated logs (messages and messages.1.gz to messages.N.gz) of
+# SIZE_MB megabytes each (uncompressed), mostly noise with a WAN link up or down message every
+# megabyte or so, generated afresh on each run in a temporary directory.
+#
+# Both runs ignore wantimes' index (-r) so each scans every file, and the link up and down events
+# they list (-l) are counted and compared (not the rest of the report, which is timed from now).
+
+import os
+import sys
+import gzip
+import time
+import random
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+FILES = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+SIZE_MB = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+JOBS = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+WANTIMES = os.path.join(sys.path[0], "wantimes.py")
+
+NOISE = ["{time} info dnsmasq[2781]: query[A] {host}.example.com from 192.168.0.{n}\n",
+         "{time} info dnsmasq[2781]: reply {host}.example.com is 93.184.{n}.34\n",
+         "{time} notice netifd[1612]: Interface 'lan' is now up\n",
+         "{time} info kernel[]: [ {n}.123456] br-lan: port 2(lan1) entered forwarding state\n",
+         "{time} info dropbear[3120]: Child connection from 192.168.0.{n}:5{n}\n",
+         "{time} err uhttpd[2211]: luci: accepted login on / for root from 192.168.0.{n}\n"]
+
+def make_log(path, number):
+    # Each rotated log covers a day, the oldest having the highest number
+    random.seed(number)
+    day = 86400 * (FILES - number)
+    size = 0
+    up = True
+    log_file = gzip.open(path, "wb", 6) if path.endswith(".gz") else open(path, "wb")
+    while size < SIZE_MB * 1024 * 1024:
+        lines = []
+        seconds = day + (size // 4096) % 86400
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1483228800 + seconds))
+        for i in range(8000):
+            lines.append(random.choice(NOISE).format(time=stamp, host="host%d" % random.randint(1, 999), n=random.randint(2, 254)))
+        up = not up
+        lines.append("%s notice netifd[1612]: Network device 'pppoe-wan' link is %s\n" % (stamp, "up" if up else "down"))
+        block = "".join(lines)
+        log_file.write(block)
+        size += len(block)
+    log_file.close()
+
+def run(log_dir, index, jobs):
+    start = time.time()
+    output = subprocess.check_output([sys.executable, WANTIMES, "-r", "-l", "-d", log_dir, "-I", index, "-j", str(jobs)])
+    elapsed = time.time() - start
+    events = [line for line in output.splitlines() if line.startswith("Link went ")]
+    return elapsed, len(events), hashlib.md5("\n".join(events)).hexdigest()
+
+work_dir = tempfile.mkdtemp()
+try:
+    for number in range(FILES):
+        make_log(os.path.join(work_dir, "messages.%d.gz" % number if number else "messages"), number)
+    compressed = sum(os.path.getsize(os.path.join(work_dir, f)) for f in os.listdir(work_dir))
+    print "%d logs of %d MB, %d MiB on disk" % (FILES, SIZE_MB, compressed // (1024 * 1024))
+
+    try:
+        import multiprocessing
+        cpus = multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        cpus = 1
+    jobs = JOBS or max(cpus, 2)
+
+    digests = set()
+    for (method, n) in (("serial", 1), ("parallel", jobs)):
+        elapsed, events, digest = run(work_dir, os.path.join(work_dir, "index.json"), n)
+        digests.add(digest)
+        print "%-8s %2d jobs %8.2fs  %d events" % (method, n, elapsed, events)
+    print "%d CPUs, results identical:" % cpus, len(digests) == 1
+finally:
+    shutil.rmtree(work_dir)
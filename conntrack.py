@@ -0,0 +1,201 @@
+#
+# A streaming reader for the kernel's connection tracking table.
+#
+# Reads /proc/net/nf_conntrack (or the output of "conntrack -L" if the kernel doesn't provide it)
+# a line at a time, rather than slurping the whole table, and parses fields by name rather than by
+# position (the fields present vary with protocol and kernel configuration, e.g. packets= and bytes=
+# only appear with nf_conntrack_acct enabled). Lines are filtered by protocol and state before
+# they are parsed, so only the connections wanted are ever built.
+#
+# A sample line from /proc/net/nf_conntrack (conntrack -L lines lack the first two fields):
+#   ipv4 2 tcp 6 7411 ESTABLISHED src=192.168.0.206 dst=13.56.143.44 sport=30291 dport=443 packets=2717
+#   bytes=193825 src=13.56.143.44 dst=203.63.3.28 sport=443 dport=30291 packets=1402 bytes=142342
+#   [ASSURED] mark=0 zone=0 use=2
+#
+# The first src/dst/sport/dport (packets/bytes) describe the original direction of the connection
+# and the second set the reply direction.
+#
+# Can also follow the table as it changes, with the events reported by "conntrack -E", which are
+# lines in the same format prefixed with the event type, e.g. "[UPDATE] tcp 6 432000 ESTABLISHED ...".
+#
+# Not a script in its own right, it is imported by the scripts that need it, so it must be installed
+# alongside them (with its .py extension intact).
+
+import os
+import re
+import time
+import subprocess
+
+PROC_CONNTRACK = "/proc/net/nf_conntrack"
+PROC_NETLINK = "/proc/net/netlink"
+NETLINK_NETFILTER = 12
+SUBSCRIBE_TIMEOUT = 5  # seconds to wait for conntrack -E to subscribe to events
+
+# Fields are found by name (the fields between them vary by protocol, e.g. ICMP has type= and
+# code= where TCP and UDP have ports). Event lines for destroyed connections have no timeout.
+# The groups match the order of Connection's attributes.
+LINE = re.compile(r"(?:(ipv[46])\s+\d+\s+)?(\w+)\s+\d+\s+(?:(\d+)\s+)?(?:([A-Z_]+)\s+)?"
+                  r"src=(\S+) dst=(\S+)(?: sport=(\d+) dport=(\d+))?(?:[^\[]*? packets=(\d+) bytes=(\d+))?"
+                  r".*? src=(\S+) dst=(\S+)(?: sport=(\d+) dport=(\d+))?(?:[^\[]*? packets=(\d+) bytes=(\d+))?")
+
+devnull = open(os.devnull, 'w')
+
+
+class Connection(object):
+    '''
+    One connection from the conntrack table. Counters are None if accounting is not enabled and
+    ports are None for protocols without them.
+
+    Addresses and ports are kept as the strings conntrack gives us, the numeric fields are only
+    converted to numbers when they are used.
+    '''
+    __slots__ = ("family", "protocol", "_timeout", "state",
+                 "src", "dst", "sport", "dport", "_packets", "_bytes",
+                 "reply_src", "reply_dst", "reply_sport", "reply_dport", "_reply_packets", "_reply_bytes",
+                 "assured")
+
+    def __init__(self, fields, assured):
+        (self.family, self.protocol, self._timeout, self.state,
+         self.src, self.dst, self.sport, self.dport, self._packets, self._bytes,
+         self.reply_src, self.reply_dst, self.reply_sport, self.reply_dport, self._reply_packets, self._reply_bytes) = fields
+        self.assured = assured
+
+        # conntrack -L doesn't tell us the family
+        if self.family is None:
+            self.family = "ipv6" if ":" in self.src else "ipv4"
+
+    timeout = property(lambda self: counter(self._timeout))
+    packets = property(lambda self: counter(self._packets))
+    bytes = property(lambda self: counter(self._bytes))
+    reply_packets = property(lambda self: counter(self._reply_packets))
+    reply_bytes = property(lambda self: counter(self._reply_bytes))
+
+    def __repr__(self):
+        return "<Connection %s %s %s:%s -> %s:%s>" % (self.protocol, self.state, self.src, self.sport, self.dst, self.dport)
+
+
+def counter(value):
+    return None if value is None else int(value)
+
+
+def parse(line):
+    '''
+    Parses one line of /proc/net/nf_conntrack or "conntrack -L" output into a Connection.
+    Returns None if the line can't be parsed.
+    '''
+    match = LINE.match(line)
+    if match is None:
+        return None
+
+    return Connection(match.groups(), "[ASSURED]" in line)
+
+
+def lines():
+    '''
+    Yields the lines of the conntrack table, from /proc if available else from conntrack -L
+    '''
+    try:
+        table = open(PROC_CONNTRACK)
+    except IOError:
+        table = None
+
+    if table is not None:
+        with table:
+            for line in table:
+                yield line
+    else:
+        process = subprocess.Popen(["conntrack", "-L"], stdout=subprocess.PIPE, stderr=devnull)
+        try:
+            for line in iter(process.stdout.readline, ""):
+                yield line
+        finally:
+            process.stdout.close()
+            process.wait()
+
+
+def read(protocol=None, state=None, source=None):
+    '''
+    Yields Connections from the conntrack table (or the lines of source if provided), only those of
+    the given protocol (e.g. "tcp") and state (e.g. "ESTABLISHED") if specified.
+    '''
+    # Cheap substring tests reject most unwanted lines before we split them
+    protocol_tag = " %s " % protocol if protocol else None
+    state_tag = " %s " % state if state else None
+
+    for line in (lines() if source is None else source):
+        if protocol_tag and not protocol_tag in " " + line[:24]:
+            continue
+        if state_tag and not state_tag in line:
+            continue
+
+        connection = parse(line)
+        if connection is None:
+            continue
+        if protocol and connection.protocol != protocol:
+            continue
+        if state and connection.state != state:
+            continue
+
+        yield connection
+
+
+def subscribed(pid):
+    '''
+    True if process pid has a netfilter netlink socket bound to multicast groups (which conntrack -E
+    has once it has subscribed to events), False if not (yet), or None if we can't tell (no /proc).
+    '''
+    try:
+        sockets = set()
+        for fd in os.listdir("/proc/%d/fd" % pid):
+            link = os.readlink("/proc/%d/fd/%s" % (pid, fd))
+            if link.startswith("socket:["):
+                sockets.add(link[8:-1])
+
+        with open(PROC_NETLINK) as netlink:
+            # sk Eth Pid Groups Rmem Wmem Dump Locks Drops Inode
+            for line in netlink.readlines()[1:]:
+                fields = line.split()
+                if int(fields[1]) == NETLINK_NETFILTER and int(fields[3], 16) and fields[9] in sockets:
+                    return True
+        return False
+    except (OSError, IOError, ValueError, IndexError):
+        return None
+
+
+def events(protocol=None, event_mask="ALL"):
+    '''
+    Starts following conntrack events (of the given protocol, and types in event_mask which is any
+    of NEW, UPDATE and DESTROY comma separated) and returns a generator that yields them as
+    (event type, Connection) tuples as they happen.
+
+    Waits (up to SUBSCRIBE_TIMEOUT seconds) for conntrack to subscribe to the events before it
+    returns, so a snapshot of the table read afterwards misses none of them. If it can't tell (no
+    /proc to look in) or conntrack takes longer, it returns anyway and events from that time may
+    be missed.
+    '''
+    command = ["conntrack", "-E", "-e", event_mask]
+    if protocol:
+        command += ["-p", protocol]
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=devnull)
+
+    deadline = time.time() + SUBSCRIBE_TIMEOUT
+    while process.poll() is None and subscribed(process.pid) is False and time.time() < deadline:
+        time.sleep(0.01)
+
+    def follow():
+        try:
+            for line in iter(process.stdout.readline, ""):
+                line = line.strip()
+                if line.startswith("["):
+                    event, line = line[1:].split("]", 1)
+                    connection = parse(line.strip())
+                    if not connection is None:
+                        yield (event, connection)
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+
+    return follow()
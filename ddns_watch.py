@@ -0,0 +1,203 @@
+#!/usr/bin/python
+#
+# Watch the net for propagation of a DDNS IP
+# This is ordinarily run after a DDNS IP update to watch propagation of the newly updated DDNS IP
+#
+# Outputs JSON lines, one for each event as it happens, each with the time (seconds since epoch):
+#
+#   start       when watching started (and again if the WAN IP changes while watching)
+#   seen        when a DDNS domain first reflected the current WAN IP (from any server asked)
+#   converged   when a DDNS domain reflected the current WAN IP (from all servers asked)
+#   first       when the first DDNS domain converged
+#   all         when all DDNS domains had converged
+#   timeout     if we gave up waiting (listing the domains that hadn't converged)
+#
+# Stays running, asking only about the domains that haven't converged yet, all at once, with
+# dnsquery. Rather than asking every second, it asks again when the answer it has could next
+# change: when its TTL expires in the resolver's cache, or for authoritative servers (-a) which
+# update when the zone does, after an interval that doubles with each unchanged answer.
+#
+# Depends on:
+#
+#	wanip				- which prints the current WAN IP of the router we're running on
+#	ddns_domains		- which prints a list of domains under DDNS management that should point to this router
+
+import os, subprocess, sys, argparse, json, time
+import dnsquery
+import namecache
+
+NoIP = "127.0.0.0"
+devnull = open(os.devnull, 'w')
+
+parser = argparse.ArgumentParser(description='Watch the propagation of the WAN IP to all DDNS domains, reporting progress as JSON lines',
+                                 epilog="Only one instance runs at a time, a new instance exits quietly if one is already watching.",
+                                 formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=25))
+
+parser.add_argument('-a', '--Authoritative', action='store_true', help='Ask each domain\'s authoritative name servers rather than the local resolver')
+parser.add_argument('-r', '--Resolvers', help='With -a also ask these resolvers (comma separated IPs, e.g. 1.1.1.1,8.8.8.8)')
+parser.add_argument('-i', '--MinInterval', type=float, default=1, help='Shortest time to wait before asking about a domain again (default: %(default)ss)')
+parser.add_argument('-I', '--MaxInterval', type=float, default=60, help='Longest time to wait before asking about a domain again (default: %(default)ss)')
+parser.add_argument('-m', '--MaxWait', type=float, default=3 * 3600, help='Give up after this long (default: %(default)ss)')
+parser.add_argument('-W', '--WANCheck', type=float, default=30, help='How often to check the WAN IP for changes (default: %(default)ss)')
+parser.add_argument('-t', '--Timeout', type=float, default=dnsquery.TIMEOUT, help='Seconds to wait for each DNS lookup before retrying it (default: %(default)s)')
+
+args = parser.parse_args()
+
+# Allow one instance only of this script to run.
+# If a new instance is invoked, it should exit silently.
+# This script watches the WAN IP and if it changes resets its propagation watching timers
+# Meaning until a stable propagation is seen and it exits, there is zero need for a new
+# instance to start up and start watching the DDNS propagation.
+LOCK = "/var/run/ddns_watch.lock"
+
+def lock():
+    try:
+        with open(LOCK) as f:
+            PID = int(f.read().strip())
+        if os.path.exists("/proc/%d" % PID):
+            return False  # An instance is running right now
+    except (IOError, ValueError):
+        pass  # No lock, or a ghost lock file we can just overwrite
+
+    with open(LOCK, "w") as f:
+        f.write("%d\n" % os.getpid())
+    return True
+
+def unlock():
+    try:
+        os.remove(LOCK)
+    except OSError:
+        pass
+
+def getWANIP():
+    try:
+        return subprocess.check_output(["wanip", "-4"], stderr=devnull).strip()
+    except:
+        return NoIP
+
+def getDomains():
+    try:
+        return subprocess.check_output(["ddns_domains"], stderr=devnull).split()
+    except:
+        return []
+
+def emit(event, **fields):
+    fields["event"] = event
+    fields.setdefault("time", time.time())
+    print json.dumps(fields, sort_keys=True)
+    sys.stdout.flush()
+
+def servers(domains):
+    # The servers to ask about each domain, as a dict of domain: [(label, IP or None, recurse)],
+    # None meaning the local resolver. Name servers are asked not to recurse, resolvers are.
+    if not args.Authoritative:
+        return dict((domain, [("resolver", None, True)]) for domain in domains)
+
+    cache = namecache.ZoneCache()
+    try:
+        zones = namecache.zone_servers(cache, domains, timeout=args.Timeout)
+    finally:
+        cache.close()
+
+    resolvers = [(IP, IP, True) for IP in args.Resolvers.split(",")] if args.Resolvers else []
+    return dict((domain, [(name, IP, False) for (name, IP) in zones[domain][1]] + resolvers) for domain in domains)
+
+def ask(domains, servers):
+    # Asks all the servers about all the domains at once. Returns a dict of domain: [(IP, TTL)]
+    # with one answer per server (IP None and TTL None if the server didn't answer).
+    queries = [(domain, "A", IP) for domain in domains for (label, IP, recurse) in servers[domain]]
+    responses = {}
+    for recurse in (False, True):
+        batch = [(domain, "A", IP) for domain in domains for (label, IP, asked) in servers[domain] if asked == recurse]
+        if batch:
+            responses.update(dnsquery.resolve(batch, timeout=args.Timeout, deadline=args.MaxInterval, recurse=recurse))
+
+    answers = {}
+    for (domain, rtype, IP) in queries:
+        response = responses[(domain, rtype, IP)]
+        As = dnsquery.records(response, "A")
+        answers.setdefault(domain, []).append((As[-1] if As else None, dnsquery.min_ttl(response, "A")))
+    return answers
+
+def watch(domains):
+    # Returns when all domains have converged on the WAN IP, or the WAN IP changes, or we give up
+    # (returning the reason). Each domain is asked about only when it's due.
+    WANIP = getWANIP()
+    start = time.time()
+    emit("start", time=start, wan_ip=WANIP, domains=len(domains), authoritative=args.Authoritative)
+
+    domain_servers = servers(domains)
+    pending = set(domains)
+    due = dict((domain, start) for domain in domains)
+    interval = dict((domain, args.MinInterval) for domain in domains)
+    seen = set()
+    first = None
+    queries = 0
+    WAN_checked = start
+
+    while pending:
+        now = time.time()
+        if now - start > args.MaxWait:
+            emit("timeout", start=start, pending=sorted(pending), queries=queries)
+            return "timeout"
+
+        if now - WAN_checked > args.WANCheck:
+            WAN_checked = now
+            if getWANIP() != WANIP:
+                return "restart"
+
+        asking = [domain for domain in pending if due[domain] <= now]
+        if asking:
+            answers = ask(asking, domain_servers)
+            queries += sum(len(domain_servers[domain]) for domain in asking)
+            now = time.time()
+
+            for domain in asking:
+                IPs = [IP for (IP, ttl) in answers[domain]]
+                if WANIP in IPs and not domain in seen:
+                    seen.add(domain)
+                    emit("seen", time=now, domain=domain, elapsed=now - start)
+
+                if IPs and all(IP == WANIP for IP in IPs):
+                    pending.discard(domain)
+                    emit("converged", time=now, domain=domain, elapsed=now - start)
+                    if first is None:
+                        first = now
+                        emit("first", time=now, domain=domain, elapsed=now - start)
+                    continue
+
+                # A resolver won't change a cached answer until its TTL runs out, so that's when
+                # to ask again. Otherwise (authoritative servers, or no answer) back off.
+                ttls = [ttl for (IP, ttl) in answers[domain] if not ttl is None and IP != WANIP]
+                if not args.Authoritative and ttls:
+                    wait = min(ttls) + 1
+                else:
+                    wait = interval[domain]
+                    interval[domain] = min(interval[domain] * 2, args.MaxInterval)
+                due[domain] = now + min(max(wait, args.MinInterval), args.MaxInterval)
+
+        if pending:
+            wake = min(min(due[domain] for domain in pending), WAN_checked + args.WANCheck)
+            time.sleep(max(0, wake - time.time()))
+
+    now = time.time()
+    emit("all", time=now, start=start, first=first, elapsed=now - start, queries=queries)
+    return "done"
+
+if not lock():
+    sys.exit(1)
+
+try:
+    Domains = getDomains()
+    if not Domains:
+        print >> sys.stderr, "No domains are being managed by the DDNS service"
+        sys.exit()
+
+    # Reset the timers if the WAN IP changes while we're watching
+    # This implies a DDNS IP update has happened since we started watching
+    while watch(Domains) == "restart":
+        pass
+except KeyboardInterrupt:
+    pass
+finally:
+    unlock()
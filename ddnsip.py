@@ -6,6 +6,8 @@
 # A special domain "WAN" is listed for the apparent WAN address.
  
 import os, subprocess, sys, argparse, json
+import dnsquery
+import namecache
 
 # Configurations
 web_header = ["NameCheap", "Cerberus", "AlwaysData"]
@@ -30,6 +32,11 @@ Worw.add_argument('-W', '--WebForce', action='store_true', help='Use a webservic
 
 parser.add_argument('-H', '--Header', action='store_true', help='Print header line')
 parser.add_argument('-n', '--Notify', action='store_true', help='Notify administrator of results')
+parser.add_argument('-t', '--Timeout', type=float, default=dnsquery.TIMEOUT, help='Seconds to wait for each DNS lookup before retrying it (default: %(default)s)')
+parser.add_argument('-a', '--Authoritative', action='store_true', help='Ask each domain\'s authoritative name servers rather than the local resolver (whose cache can be stale)')
+parser.add_argument('-r', '--Resolvers', help='With -a also ask these resolvers (comma separated IPs, e.g. 1.1.1.1,8.8.8.8)')
+parser.add_argument('-S', '--Servers', action='store_true', help='With -a report the answer and its TTL from each server rather than one IP per domain')
+parser.add_argument('-T', '--Deadline', type=float, default=10, help='Seconds to wait for all the DNS lookups (default: %(default)s)')
 
 Eore = parser.add_mutually_exclusive_group()
 Eore.add_argument('-e', '--ErrorReport', action='store_true', help='Report only errors')
@@ -48,12 +55,88 @@ def getDomains():
     except:
         return []
 
-def getApparentIP(domain):
+def getApparentIPs(domains):
+    # Returns a dict of domain: IP, the IP being "" if the domain has none and NoIP if the lookup
+    # failed (see dnsquery.apparent_IPs).
+    try:
+        IPs = dnsquery.apparent_IPs(domains, timeout=args.Timeout, deadline=args.Deadline)
+    except:
+        return dict((domain, NoIP) for domain in domains)
+
+    return dict((domain, NoIP if IP is None else IP) for (domain, IP) in IPs.items())
+
+def getServerAnswers(domains):
+    # Asks the authoritative name servers of each domain (and any resolvers given) for its IP,
+    # all at once. The name servers of each zone are looked up once and then cached. Returns a
+    # dict of domain: [(server, IP, TTL), ...].
+    cache = namecache.ZoneCache()
     try:
-        # for CNAME records (commonly subdomains) dig retrusn two lines and the IP is on the second
-        return subprocess.check_output(["dig", "+noall",  "+answer", "+short",  domain]).strip().split("\n")[-1]
+        zones = namecache.zone_servers(cache, domains, timeout=args.Timeout)
     except:
-        return NoIP
+        zones = dict((domain, (None, [])) for domain in domains)
+    finally:
+        cache.close()
+
+    resolvers = args.Resolvers.split(",") if args.Resolvers else []
+
+    # The name servers are asked not to recurse (so they answer from their own zone data, not what
+    # they might have cached from elsewhere), the resolvers are asked to.
+    name_servers = dict((domain, zones[domain][1]) for domain in domains)
+    resolver_servers = dict((domain, [(IP, IP) for IP in resolvers]) for domain in domains)
+
+    answers = dict((domain, []) for domain in domains)
+    for (servers, recurse) in ((name_servers, False), (resolver_servers, True)):
+        queries = {}
+        for domain in domains:
+            for (name, IP) in servers[domain]:
+                queries[(domain, "A", IP)] = (domain, name)
+        if not queries:
+            continue
+
+        try:
+            responses = dnsquery.resolve(queries.keys(), timeout=args.Timeout, deadline=args.Deadline, recurse=recurse)
+        except:
+            responses = dict((query, None) for query in queries)
+
+        for query in sorted(queries):
+            (domain, server) = queries[query]
+            response = responses[query]
+            if response is None:
+                answers[domain].append((server, NoIP, None))
+            else:
+                As = dnsquery.records(response, "A")
+                answers[domain].append((server, As[-1] if As else "", dnsquery.min_ttl(response, "A")))
+
+    return answers
+
+def getAuthoritativeIPs(answers):
+    # One IP per domain from the server answers. If the servers disagree (the update hasn't reached
+    # them all yet) the odd one out (not the WAN IP) is reported.
+    IPs = {}
+    for domain in answers:
+        found = sorted(set(IP for (server, IP, ttl) in answers[domain]))
+        if not found:
+            IPs[domain] = NoIP
+        elif len(found) == 1:
+            IPs[domain] = found[0]
+        else:
+            IPs[domain] = [IP for IP in found if IP != WANIP][0]
+    return IPs
+
+def getApparentIP(domain):
+    return getApparentIPs([domain])[domain]
+
+def showServerAnswers(answers):
+    if args.json:
+        print json.dumps(answers)
+    else:
+        width = max([len(domain) for domain in answers] + [6])
+        template = "{}, {}, {}, {}" if args.csv else "{:>" + str(width) + "} {:<24} {:<15} {}"
+        if args.Header:
+            print template.format("Domain", "Server", "IP", "TTL")
+        for domain in sorted(answers):
+            for (server, IP, ttl) in answers[domain]:
+                print template.format(domain, server, IP, "" if ttl is None else ttl)
 
 def getWebData():
     try:
@@ -68,14 +151,23 @@ def notify(status, message):
     except:
         return "Error: Notification failed."
 
+# In authoritative mode we can report the answer from each server instead
+if args.Authoritative:
+    answers = getServerAnswers([args.DomainName] if args.DomainName and args.DomainName != "WAN" else getDomains())
+    if args.Servers:
+        showServerAnswers(answers)
+        sys.exit()
+
 results = {}
 errors = 0
 maxlen = 0
 if args.DomainName:
     if args.DomainName == "WAN":
-        results[args.DomainName] = WANIP
+        results[args.DomainName] = (WANIP,)
+    elif args.Authoritative:
+        results[args.DomainName] = (getAuthoritativeIPs(answers)[args.DomainName],)
     else:
-        results[args.DomainName] = getApparentIP(args.DomainName)
+        results[args.DomainName] = (getApparentIP(args.DomainName),)
     maxlen = len(args.DomainName)
 else:
     Domains = getDomains()
@@ -84,11 +176,13 @@ else:
         results["WAN"] = (WANIP,)
     
     if isinstance(Domains, list):
+        ApparentIPs = getAuthoritativeIPs(answers) if args.Authoritative else getApparentIPs(Domains)
+
         for Domain in Domains:
             # We have to loop over all the hosts here
             # And it's then Host.Domain
             
-            IP = getApparentIP(Domain)
+            IP = ApparentIPs[Domain]
             if IP != WANIP:
                 errors += 1
 
@@ -43,21 +43,16 @@ log="$tstamp $op $ip $mac ($hostname)"
 
 echo $log >> $logdir/$logfile
 
-# Given an IP address fetch the MAC address (if any) associated with it as a static DHCP lease
-IP_MAC() {
-	lanip DHCP | grep "\b$1\b" | awk '{print $3}'
-}
-
-# Given an IP address fetch the Host name (if any) associated with it as a static DHCP lease
-IP_Hostname() {
-	lanip DHCP | grep "\b$1\b" | awk '{print $1}'
+# Given an IP address fetch the Host name and MAC address (if any) associated with it as a static DHCP lease
+# Prints "hostname MAC" (one lanip call serves both)
+IP_Static_Lease() {
+	lanip DHCP | awk -v ip="$1" '$2 == ip {print $1, $3; exit}'
 }
 
 # Post a notification if a new IP address is allocated AND if the MAC of an existing lease changes!
 if [[ "$op" == "add" || "$op" == "old" ]]; then
 	# Get static lease MAC and hostname associated with this IP if any
-	ip_mac=$(IP_MAC $ip)
-	ip_hostname=$(IP_Hostname $ip)
+	read ip_hostname ip_mac <<< "$(IP_Static_Lease $ip)"
 	
 	# If we're assigning a different MAC  or hostname to a static lease IP something is awry
 	# And if there was no static lease for this IP then ip_mac and ip_hostname are empty
@@ -0,0 +1,28 @@
+#!/usr/bin/python
+#
+# Print the apparent IP address (from DNS) of each of the given domains as a JSON dictionary.
+#
+# Looks them all up at once (with dnsquery) so it takes about as long as the slowest lookup rather
+# than the sum of them all. Used by index.php to fill in the apparent IPs on the DDNS report in one
+# call rather than running dig for each domain.
+#
+# Domains without an IP map to "" and those whose lookup failed to null.
+
+import sys, argparse, json
+import dnsquery
+
+parser = argparse.ArgumentParser(description='Print the apparent IP addresses of domains as a JSON dictionary.',
+                                 formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=25))
+
+parser.add_argument('DomainNames', nargs='*', help='The domain names to look up (else read from stdin, one per line)')
+parser.add_argument('-s', '--Server', help='The DNS server to ask (default: the first in /etc/resolv.conf)')
+parser.add_argument('-t', '--Timeout', type=float, default=dnsquery.TIMEOUT, help='Seconds to wait for each DNS lookup before retrying it (default: %(default)s)')
+parser.add_argument('-T', '--Deadline', type=float, default=10, help='Seconds to wait for all the DNS lookups (default: %(default)s)')
+
+args = parser.parse_args()
+
+domains = args.DomainNames or sys.stdin.read().split()
+
+IPs = dnsquery.apparent_IPs(domains, server=args.Server, timeout=args.Timeout, deadline=args.Deadline)
+
+print json.dumps(IPs)
@@ -0,0 +1,308 @@
+#
+# A small in-process DNS client.
+#
+# Forking dig for every lookup is slow, serial and throws away the TTLs. This sends DNS queries
+# straight from python over UDP, many at a time from one socket, and collects the answers as they
+# arrive (with their TTLs) so that a batch of lookups costs about one round trip rather than one
+# per name.
+#
+# Supports just what these tools need: A, AAAA, CNAME, NS, PTR and SOA records, recursive queries
+# to the configured resolver and non-recursive queries to a given (authoritative) server.
+#
+# Not a script in its own right, it is imported by the scripts that need it, so it must be installed
+# alongside them (with its .py extension intact).
+
+import time
+import errno
+import random
+import select
+import socket
+import struct
+
+RESOLV_CONF = "/etc/resolv.conf"
+PORT = 53
+
+TIMEOUT = 2         # seconds to wait for an answer before retrying a query
+RETRIES = 1         # times to retry a query that timed out
+CONCURRENCY = 32    # queries in flight at any one time
+
+TYPES = {"A": 1, "NS": 2, "CNAME": 5, "SOA": 6, "PTR": 12, "AAAA": 28}
+TYPE_NAMES = dict((v, k) for (k, v) in TYPES.items())
+
+# Response codes
+NOERROR = 0
+NXDOMAIN = 3
+
+
+def nameservers(resolv_conf=RESOLV_CONF):
+    '''
+    Returns the list of nameservers configured in resolv.conf (or the local host if none are)
+    '''
+    servers = []
+    try:
+        with open(resolv_conf) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == "nameserver":
+                    servers.append(fields[1])
+    except IOError:
+        pass
+    return servers or ["127.0.0.1"]
+
+
+def reverse_name(IP):
+    '''
+    Returns the in-addr.arpa or ip6.arpa name for an IP address (for PTR lookups)
+    '''
+    if ":" in IP:
+        nibbles = socket.inet_pton(socket.AF_INET6, IP).encode("hex")
+        return ".".join(reversed(nibbles)) + ".ip6.arpa"
+    else:
+        return ".".join(reversed(IP.split("."))) + ".in-addr.arpa"
+
+
+def build_query(ID, name, qtype, recurse=True):
+    flags = 0x0100 if recurse else 0x0000
+    header = struct.pack("!HHHHHH", ID, flags, 1, 0, 0, 0)
+    qname = "".join(chr(len(label)) + label for label in name.rstrip(".").split(".") if label) + "\0"
+    return header + qname + struct.pack("!HH", TYPES[qtype], 1)
+
+
+def read_name(data, offset):
+    '''
+    Reads a (possibly compressed) domain name from a DNS message.
+    Returns the name and the offset just past it.
+    '''
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        length = ord(data[offset])
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = struct.unpack("!H", data[offset:offset + 2])[0] & 0x3FFF
+            jumps += 1
+            if jumps > 64:
+                raise ValueError("DNS name compression loop")
+        elif length == 0:
+            offset += 1
+            break
+        else:
+            labels.append(data[offset + 1:offset + 1 + length])
+            offset += 1 + length
+
+    return ".".join(labels), (offset if end is None else end)
+
+
+def read_rdata(data, offset, rtype, rdlength):
+    if rtype == TYPES["A"]:
+        return socket.inet_ntoa(data[offset:offset + 4])
+    elif rtype == TYPES["AAAA"]:
+        return socket.inet_ntop(socket.AF_INET6, data[offset:offset + 16])
+    elif rtype in (TYPES["CNAME"], TYPES["NS"], TYPES["PTR"]):
+        return read_name(data, offset)[0]
+    elif rtype == TYPES["SOA"]:
+        mname, offset = read_name(data, offset)
+        rname, offset = read_name(data, offset)
+        # serial, refresh, retry, expire, minimum
+        return (mname, rname) + struct.unpack("!IIIII", data[offset:offset + 20])
+    else:
+        return data[offset:offset + rdlength]
+
+
+def parse_response(data):
+    '''
+    Parses a DNS response into a dict with keys:
+        id, rcode, truncated, authoritative, question (name, type)
+        answer, authority, additional - lists of records as (name, type, ttl, value)
+    '''
+    (ID, flags, qdcount, ancount, nscount, arcount) = struct.unpack("!HHHHHH", data[:12])
+
+    offset = 12
+    question = None
+    for i in range(qdcount):
+        qname, offset = read_name(data, offset)
+        qtype, qclass = struct.unpack("!HH", data[offset:offset + 4])
+        offset += 4
+        if question is None:
+            question = (qname.lower(), TYPE_NAMES.get(qtype, qtype))
+
+    sections = []
+    for count in (ancount, nscount, arcount):
+        records = []
+        for i in range(count):
+            rname, offset = read_name(data, offset)
+            rtype, rclass, ttl, rdlength = struct.unpack("!HHIH", data[offset:offset + 10])
+            offset += 10
+            value = read_rdata(data, offset, rtype, rdlength)
+            offset += rdlength
+            records.append((rname, TYPE_NAMES.get(rtype, rtype), ttl, value))
+        sections.append(records)
+
+    return {"id": ID,
+            "rcode": flags & 0x000F,
+            "truncated": bool(flags & 0x0200),
+            "authoritative": bool(flags & 0x0400),
+            "question": question,
+            "answer": sections[0],
+            "authority": sections[1],
+            "additional": sections[2]}
+
+
+def resolve(queries, server=None, timeout=TIMEOUT, retries=RETRIES, concurrency=CONCURRENCY, deadline=None, recurse=True):
+    '''
+    Resolves a batch of queries concurrently.
+
+    queries is an iterable of (name, type) or (name, type, server) tuples, type being one of TYPES.
+    Queries without a server go to server, or else the first nameserver in resolv.conf.
+
+    At most concurrency queries are in flight at any time, each is given timeout seconds to answer
+    and retried up to retries times. If deadline (seconds) is given, the whole batch is abandoned
+    after that long.
+
+    Returns a dict keyed on the query tuples, each value being the parsed response (see
+    parse_response) or None if no answer arrived.
+    '''
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1, not %s" % concurrency)
+
+    default_server = server or nameservers()[0]
+    results = {}
+    pending = []
+    for query in queries:
+        if not query in results:
+            results[query] = None
+            pending.append(query)
+    pending.reverse()  # So we can pop() them off in order
+
+    sockets = {}
+    in_flight = {}  # ID: [query, server address, tries, expiry, packet]
+    started = time.time()
+
+    def get_socket(address):
+        family = socket.AF_INET6 if ":" in address else socket.AF_INET
+        if not family in sockets:
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sock.setblocking(0)
+            sockets[family] = sock
+        return sockets[family]
+
+    def send(ID):
+        query, address, tries, expiry, packet = in_flight[ID]
+        try:
+            get_socket(address).sendto(packet, (address, PORT))
+        except socket.error:
+            pass  # Treated as a timeout
+        in_flight[ID][3] = time.time() + timeout
+
+    try:
+        while pending or in_flight:
+            # Top up the queries in flight
+            while pending and len(in_flight) < concurrency:
+                query = pending.pop()
+                ID = random.randint(0, 0xFFFF)
+                while ID in in_flight:
+                    ID = random.randint(0, 0xFFFF)
+                address = query[2] if len(query) > 2 and query[2] else default_server
+                in_flight[ID] = [query, address, 0, 0, build_query(ID, query[0], query[1], recurse)]
+                send(ID)
+
+            now = time.time()
+            if deadline is not None and now - started > deadline:
+                break
+
+            wait = max(0, min(entry[3] for entry in in_flight.values()) - now)
+            if deadline is not None:
+                wait = min(wait, max(0, started + deadline - now))
+
+            try:
+                readable = select.select(sockets.values(), [], [], wait)[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for sock in readable:
+                while True:
+                    try:
+                        data, source = sock.recvfrom(4096)
+                    except socket.error:
+                        break
+
+                    try:
+                        response = parse_response(data)
+                    except (ValueError, IndexError, struct.error):
+                        continue
+
+                    entry = in_flight.get(response["id"])
+                    if entry is None or entry[1] != source[0]:
+                        continue
+
+                    query = entry[0]
+                    if response["question"] and response["question"][0] != query[0].rstrip(".").lower():
+                        continue
+
+                    results[query] = response
+                    del in_flight[response["id"]]
+
+            # Retry or give up on queries that timed out
+            now = time.time()
+            for ID in [ID for ID in in_flight if in_flight[ID][3] <= now]:
+                if in_flight[ID][2] < retries:
+                    in_flight[ID][2] += 1
+                    send(ID)
+                else:
+                    del in_flight[ID]
+    finally:
+        for sock in sockets.values():
+            sock.close()
+
+    return results
+
+
+def records(response, rtype):
+    '''
+    Returns the values of all answer records of the given type in a response
+    '''
+    if response is None:
+        return []
+    return [record[3] for record in response["answer"] if record[1] == rtype]
+
+
+def min_ttl(response, rtype=None):
+    '''
+    Returns the smallest TTL of the answer records (of the given type if specified) in a response,
+    or for negative answers the negative caching TTL from the SOA record. None if there's no TTL.
+    '''
+    if response is None:
+        return None
+
+    ttls = [record[2] for record in response["answer"] if rtype is None or record[1] == rtype]
+    if not ttls:
+        # Negative answers carry the zone SOA, whose minimum field is the negative caching TTL
+        ttls = [min(record[2], record[3][6]) for record in response["authority"] if record[1] == "SOA"]
+
+    return min(ttls) if ttls else None
+
+
+def apparent_IPs(domains, server=None, timeout=TIMEOUT, deadline=None):
+    '''
+    Looks up the IP (A record) of each of the domains, all at once, so it takes about as long as the
+    slowest lookup rather than the sum of them all.
+
+    Returns a dict of domain: IP, the IP being "" for a domain without one and None for a domain
+    whose lookup failed. For a CNAME (commonly of a subdomain) it's the IP the CNAME leads to.
+    '''
+    responses = resolve([(domain, "A") for domain in domains], server=server, timeout=timeout, deadline=deadline)
+
+    IPs = {}
+    for domain in domains:
+        response = responses[(domain, "A")]
+        if response is None:
+            IPs[domain] = None
+        else:
+            # For CNAME records the answer has the CNAME and then the IP
+            As = records(response, "A")
+            IPs[domain] = As[-1] if As else ""
+    return IPs
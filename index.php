@@ -34,11 +34,12 @@
  * ULR?wanip4=202.53.56.35&reason=ifup
  * ULR?wanip4=202.53.56.35&wanip6=2001:0db8:85a3:0000:0000:8a2e:0370:7334&reason=ifup
  *
- * wanip: (no IP address provided), presents the WAN IP log file
- * (optionally if lines=val is specified, that many lines, else a default)
+ * wanip: (no IP address provided), presents the WAN IP log file, IPv4 and IPv6 changes
+ * (optionally if lines=val is specified, that many changes of each, else a default, and if
+ * family=4 or family=6 is specified, just that family)
  *
  * json: Returns the DDNS diagnostics as a JSON structure (providing a web service rather than HTML page)
- * json=WAN: returns the WAN IP log as a JSON structure
+ * json=WAN: returns the WAN IP log as a JSON structure (a list of changes for each of IPv4 and IPv6)
  * json=DDNS: same as json (explicitly requests the DDNS diagnostics which are the default)
  *
  * Background:
@@ -114,9 +115,12 @@ date_default_timezone_set('Australia/Hobart');
 $cgi_bin = $_SERVER['DOCUMENT_ROOT'] . "cgi-bin/"; # Where the ncdip command can be found
 $auth_file = $_SERVER['HOME'] . "/.auth/namecheap.auth"; # Where the namecheap auth file can be found
 $registrar_cmd = $cgi_bin . 'ncdip -j'; # A local command that returns a JSON dictionary mapping domain name to registered IP address
+$registrar_invalidate_cmd = $cgi_bin . 'ncdip -I'; # Drops the registered IP addresses ncdip has cached (run when the WAN IP changes)
+$apparent_cmd = $cgi_bin . 'dnsips'; # A local command that looks up the domains given all at once and returns a JSON dictionary mapping domain name to apparent IP address
 
-$wanip4_logfile = "wanip4.log"; # Log file to store submited WAN IPv4 values to
-$wanip6_logfile = "wanip6.log"; # Log file to store submited WAN IPv6 values to
+$wanip_logfile = "wanip.log"; # Log file to store submited WAN IP changes to (both families, see log_parse)
+$wanip4_logfile = "wanip4.log"; # Older log file submited WAN IPv4 values were stored in (imported into $wanip_logfile)
+$wanip6_logfile = "wanip6.log"; # Older log file submited WAN IPv6 values were stored in (imported into $wanip_logfile)
 $FMT_DATETIME = 'd/m/Y H:i:s'; # Date format to use in the WAN IP log file
 $LOG_LINES = 50; # Default number of lines when displaying the WAN IP log file
 $PH_EMPHASIZE = "_EMPHASIZE_"; # A placeholder in an a HTML string for an emphasis attribute
@@ -129,57 +133,216 @@ function console_log($output, $with_script_tags = true) {
     echo $js_code;
 }
 
-/**
- * Slightly modified version of http://www.geekality.net/2011/05/28/php-tail-tackling-large-files/
- *
- * @author Torleif Berger, Lorenzo Stanco
- * @link http://stackoverflow.com/a/15025877/995958
- * @license http://creativecommons.org/licenses/by/3.0/
- */
-function tail($filepath, $lines = 1, $adaptive = true)
+// The WAN IP log is an append only store of one JSON record per line, each recording a change of
+// the WAN IPs with both families, the reason and the time (seconds since the epoch):
+//   {"time":1700000000,"wanip4":"203.0.113.7","wanip6":"2001:db8::7","reason":"ifup"}
+// An IP that's unknown (or wasn't valid) is null. Lines in the older text form (one IP per line):
+//   dd/mm/YYYY HH:MM:SS, IP, reason
+// can still be read, so the older logs are imported as they are (see wan_store).
+//
+// It has an index alongside it (the log file name with .idx appended) of fixed size records, one per
+// log line, each the offset of the line in the log and its time packed as two little endian 32 bit
+// unsigned ints. With it the log is read from the end, record by record, only as far back as needed
+// to find the last N changes of a family, no matter how long the log grows. wanlog keeps the same
+// store (and index) on the router. Only log_index writes the index, and only holding a lock on the
+// log (the one writers append under), so each line is indexed once whoever gets to it first.
+$LOG_RECORD = 8; # The size of an index record in bytes
+$LOG_BLOCK = 64; # Index records to read at a time when reading the log backwards
+
+function log_parse($line)
 {
-    // Open file
-    $f = @fopen($filepath, "rb");
-    if ($f === false)
+    // The record a log line holds (time, wanip4, wanip6 and reason), or false if it holds none. A
+    // text line has only the family of its IP (the other is absent, not unknown).
+    global $FMT_DATETIME;
+    if (substr($line, 0, 1) === "{") {
+        $record = json_decode($line, true);
+        if (! is_array($record) || ! isset($record['time']))
+            return false;
+        $record['time'] = intval($record['time']);
+        return $record;
+    }
+
+    $time = date_create_from_format($FMT_DATETIME, substr($line, 0, 19));
+    if ($time === false)
         return false;
-    // Sets buffer size, according to the number of lines to retrieve.
-    // This gives a performance boost when reading a few lines from the file.
-    if (! $adaptive)
-        $buffer = 4096;
-    else
-        $buffer = ($lines < 2 ? 64 : ($lines < 10 ? 512 : 4096));
-    // Jump to last character
-    fseek($f, - 1, SEEK_END);
-    // Read it and adjust line number if necessary
-    // (Otherwise the result would be wrong if file doesn't end with a blank line)
-    if (fread($f, 1) != "\n")
-        $lines -= 1;
-
-    // Start reading
-    $output = '';
-    $chunk = '';
-    // While we would like more
-    while (ftell($f) > 0 && $lines >= 0) {
-        // Figure out how far back we should jump
-        $seek = min(ftell($f), $buffer);
-        // Do the jump (backwards, relative to where we are)
-        fseek($f, - $seek, SEEK_CUR);
-        // Read a chunk and prepend it to our output
-        $output = ($chunk = fread($f, $seek)) . $output;
-        // Jump back to where we started reading
-        fseek($f, - mb_strlen($chunk, '8bit'), SEEK_CUR);
-        // Decrease our line counter
-        $lines -= substr_count($chunk, "\n");
+    $cells = array_map('trim', explode(",", substr($line, 19), 3)) + ["", "", ""];
+    $family = strpos($cells[1], ":") === false ? "wanip4" : "wanip6";
+    return ["time" => $time->getTimestamp(), $family => $cells[1] === "" ? null : $cells[1], "reason" => $cells[2]];
+}
+
+function log_time($line)
+{
+    // The time of a log line (seconds since the epoch) or false if it holds no record
+    $record = log_parse($line);
+    return $record === false ? false : $record['time'];
+}
+
+function log_index($logfile)
+{
+    // Brings the index of $logfile up to date, indexing any lines not yet indexed (or all of them if
+    // the log was truncated or replaced). Returns the number of records in the index.
+    global $LOG_RECORD;
+    $log = @fopen($logfile, "rb");
+    if ($log === false)
+        return 0;
+    flock($log, LOCK_EX);
+    $index = fopen($logfile . ".idx", "c+b");
+
+    // The log is indexed up to the end of the last line indexed, if it's still there
+    fseek($index, 0, SEEK_END);
+    $count = intval(ftell($index) / $LOG_RECORD);
+    $offset = 0;
+    if ($count > 0) {
+        fseek($index, ($count - 1) * $LOG_RECORD);
+        $record = unpack("Voffset/Vtime", fread($index, $LOG_RECORD));
+        fseek($log, $record['offset']);
+        $line = fgets($log);
+        if ($line !== false && substr($line, - 1) === "\n" && log_time($line) === $record['time'])
+            $offset = ftell($log);
+        else
+            $count = 0;
     }
-    // While we have too many lines
-    // (Because of buffer size we might have read too many)
-    while ($lines ++ < 0) {
-        // Find first newline and remove all text before that
-        $output = substr($output, strpos($output, "\n") + 1);
+    ftruncate($index, $count * $LOG_RECORD);
+    fseek($index, $count * $LOG_RECORD);
+
+    fseek($log, $offset);
+    while (($line = fgets($log)) !== false && substr($line, - 1) === "\n") {
+        $time = log_time($line);
+        if ($time !== false) {
+            fwrite($index, pack("VV", $offset, $time));
+            $count ++;
+        }
+        $offset += strlen($line);
     }
-    // Close file and return
-    fclose($f);
-    return trim($output);
+
+    fclose($index);
+    flock($log, LOCK_UN);
+    fclose($log);
+    return $count;
+}
+
+function log_append($logfile, $line)
+{
+    // Appends a line to $logfile (under its lock) and then indexes it
+    $log = fopen($logfile, "a");
+    flock($log, LOCK_EX);
+    fwrite($log, $line);
+    fflush($log);
+    flock($log, LOCK_UN);
+    fclose($log);
+    log_index($logfile);
+}
+
+function log_backwards($logfile)
+{
+    // Yields the records in $logfile, latest first, reading the index a block at a time
+    global $LOG_RECORD, $LOG_BLOCK;
+    $count = log_index($logfile);
+    if ($count == 0)
+        return;
+
+    $index = fopen($logfile . ".idx", "rb");
+    $log = fopen($logfile, "rb");
+    while ($count > 0) {
+        $first = max(0, $count - $LOG_BLOCK);
+        fseek($index, $first * $LOG_RECORD);
+        $records = fread($index, ($count - $first) * $LOG_RECORD);
+        for ($i = strlen($records) - $LOG_RECORD; $i >= 0; $i -= $LOG_RECORD) {
+            $record = unpack("Voffset/Vtime", substr($records, $i, $LOG_RECORD));
+            fseek($log, $record['offset']);
+            $record = log_parse(fgets($log));
+            if ($record !== false)
+                yield $record;
+        }
+        $count = $first;
+    }
+    fclose($index);
+    fclose($log);
+}
+
+function wan_history($logfile, $family, $lines)
+{
+    // The last $lines changes of one family (wanip4 or wanip6) in $logfile, oldest first, each with
+    // the time, the IP changed to, the reason, the previous IP and how long it was held.
+    global $FMT_DATETIME;
+    if ($lines <= 0)
+        return [];
+
+    // The records that changed the family's IP, latest first. A record with the same IP as the one
+    // before it still counts (as a reconnect) unless it was logged for a change of the other family.
+    // We need one change more than we report (for the previous IP and how long it was held), and
+    // each record is only known to count once we've read the one before it.
+    $other = $family === "wanip4" ? "wanip6" : "wanip4";
+    $found = [];
+    $later = null;
+    $complete = false;
+    foreach (log_backwards($logfile) as $record) {
+        if (! isset($record[$family]) || $record[$family] === "")
+            continue;
+        if ($later !== null) {
+            $same_other = (isset($later[$other]) ? $later[$other] : null) === (isset($record[$other]) ? $record[$other] : null);
+            if ($later[$family] !== $record[$family] || $same_other) {
+                array_push($found, $later);
+                if (count($found) == $lines + 1) {
+                    $complete = true;
+                    break;
+                }
+            }
+        }
+        $later = $record;
+    }
+    if (! $complete && $later !== null)
+        array_push($found, $later);
+
+    $changes = [];
+    $previous = null;
+    foreach (array_reverse($found) as $record) {
+        $time = $record['time'];
+        array_push($changes, [
+            "time" => date($FMT_DATETIME, $time),
+            "epoch" => $time,
+            "IP" => $record[$family],
+            "reason" => isset($record['reason']) ? $record['reason'] : "",
+            "previous" => $previous === null ? "unknown" : $previous[1],
+            "held" => $previous === null ? null : $time - $previous[0]
+        ]);
+        $previous = [$time, $record[$family]];
+    }
+
+    return $complete ? array_slice($changes, 1) : array_slice($changes, - $lines);
+}
+
+function wan_store($logfile, $older_logfiles)
+{
+    // Creates the WAN IP log, if it doesn't exist yet, from the older logs (a family each), merged
+    // in time order (their text lines are readable as they are). Under the log's lock, so that of
+    // two first page views only one imports them.
+    if (file_exists($logfile))
+        return;
+
+    $log = fopen($logfile, "c");
+    flock($log, LOCK_EX);
+    if (fstat($log)['size'] > 0) {
+        flock($log, LOCK_UN);
+        fclose($log);
+        return;
+    }
+
+    $lines = [];
+    foreach ($older_logfiles as $older_logfile)
+        if (is_readable($older_logfile))
+            foreach (file($older_logfile) as $line)
+                if (($time = log_time($line)) !== false)
+                    array_push($lines, [$time, rtrim($line, "\n") . "\n"]);
+
+    usort($lines, function ($a, $b) {
+        return $a[0] - $b[0];
+    });
+
+    fwrite($log, implode("", array_column($lines, 1)));
+    fflush($log);
+    flock($log, LOCK_UN);
+    fclose($log);
 }
 
 function duration_formatted($seconds, $suffixes = array('y','w','d','h','m','s'), $add_s = False, $separator = ' ')
@@ -250,6 +413,41 @@ function IsNullOrEmpty($string)
     return (! isset($string) || trim($string) === '');
 }
 
+// The HTML page is written in two parts, so that the head of the page and the table header can be
+// sent (and rendered) before the table rows are ready.
+$html_started = false;
+
+function html_start($title, $intro, $header)
+{
+    global $html_started;
+    $html_started = true;
+?>
+<head>
+<title><?php print $title?></title>
+<link rel="icon" type="image/ico" href="favicon.ico">
+<link rel="stylesheet" type="text/css" href="default.css">
+</head>
+<body>
+	<h1><?php print $title?></h1>
+		<?php print $intro?>
+		<table>
+		<?php
+    print($header);
+
+    // Send it now, rather than when the page is complete
+    while (ob_get_level() > 0)
+        ob_end_flush();
+    flush();
+}
+
+function html_end()
+{
+?>
+		</table>
+</body>
+<?php
+}
+
 $get = array_change_key_case($_GET);
 
 // Will loaded wtih Get params to log a wanip change. 
@@ -270,21 +468,21 @@ if (! IsNullOrEmpty($get['wanip4']) || ! IsNullOrEmpty($get['wanip6'])) {
         // spurious strangers submitting log lines really.
         if ($get['key'] == $auth['APIkey']) {
             $wanip_reason = isset($get['reason']) ? $get['reason'] : "";
-            $wanip_date = date($FMT_DATETIME, time());
-
-            if ($valid_ip4) {
-                $log_line = sprintf("%s, %s, %s\n", $wanip_date, $IP4, $wanip_reason);
-                $iplog = fopen($wanip4_logfile, "a");
-                fwrite($iplog, $log_line);
-                echo $log_line;
-            }
-
-            if ($valid_ip6) {
-                $log_line = sprintf("%s, %s, %s\n", $wanip_date, $IP6, $wanip_reason);
-                $iplog = fopen($wanip6_logfile, "a");
-                fwrite($iplog, $log_line);
-                echo $log_line;
-            }
+            // One record of the change with both families (an invalid IP is recorded as unknown)
+            $wanip_time = time();
+            $log_line = json_encode([
+                "time" => $wanip_time,
+                "wanip4" => $valid_ip4 ? $IP4 : null,
+                "wanip6" => $valid_ip6 ? $IP6 : null,
+                "reason" => $wanip_reason
+            ]) . "\n";
+            wan_store($wanip_logfile, [$wanip4_logfile, $wanip6_logfile]);
+            log_append($wanip_logfile, $log_line);
+            echo $log_line;
+
+            // The registered IPs are changing, so ncdip's cached ones are stale
+            if ($valid_ip4)
+                shell_exec($registrar_invalidate_cmd);
             exit();
         } else
             echo "Permission denied!";
@@ -299,7 +497,7 @@ $FORMAT = array_key_exists('json', $get) ? "JSON" : "HTML";
 // We set $REQUEST, $FMT and $DELIM based on the $FORMAT
 if ($FORMAT === "JSON") {
     $REQUEST = IsNullOrEmpty($get['json']) ? "DDNS" : $get['json'];
-    $FMT = $REQUEST === "WAN" ? '"%s": ["%s", "%s", "%s", "%s"]' : '"%s": ["%s", "%s"]';
+    $FMT = '"%s": ["%s", "%s"]';
     $DELIM = ", ";
 } else {
     // if $wanip4 or $wanip6 was a valid IP address we already logged it/them above.
@@ -319,9 +517,32 @@ if ($FORMAT === "JSON") {
 }
 
 if ($REQUEST === "DDNS") {
+    // The last WAN IP change logged (the first record reading backwards)
+    wan_store($wanip_logfile, [$wanip4_logfile, $wanip6_logfile]);
+    $last = log_backwards($wanip_logfile)->current();
+    if ($last === null)
+        $last = ["time" => time(), "reason" => ""];
+    $wanip = [date($FMT_DATETIME, $last['time']), isset($last['wanip4']) ? $last['wanip4'] : "unknown", $last['reason']];
+    $duration = time() - $last['time'];
+
+    $html_header = sprintf('<tr><th>%s</th><th>%s</th><th>%s</th></tr>', "Domain", "NameCheap Registered IP", "Apparent IP from AlwaysData");
+    $html_title  = "Dynamic DNS Status Report";
+    $html_intro  = sprintf("<p>Last WAN IP was logged %s ago (at %s) with stated reason: %s.</p>", duration_formatted($duration), $wanip[0], $wanip[2]);
+
+    // Show the page while we wait on the registrar and DNS
+    if ($FORMAT === "HTML")
+        html_start($html_title, $html_intro, $html_header);
+
     $json = shell_exec($registrar_cmd);
     $data = json_decode($json, true);
-    $wanip = explode(", ", tail($wanip4_logfile));
+    if (! is_array($data))
+        $data = [];
+
+    // Look up the apparent IPs of all the domains at once
+    $domains = array_keys($data);
+    $apparent = [];
+    if (count($domains) > 0)
+        $apparent = json_decode(shell_exec($apparent_cmd . ' ' . implode(' ', array_map('escapeshellarg', $domains))), true);
 
     // console_log("data = " . var_export($data, true));
     // console_log("wanip = " . var_export($wanip, true));
@@ -333,7 +554,7 @@ if ($REQUEST === "DDNS") {
 
     // Then one line per domain
     foreach ($data as $domain => $ipnc) {
-        $ipdig = trim(shell_exec('dig +noall +answer +short ' . $domain));
+        $ipdig = isset($apparent[$domain]) ? trim($apparent[$domain]) : "";
         $ip = filter_var($ipnc, FILTER_VALIDATE_IP) ? trim($ipnc) : "";
         $emphasis = (IsNullOrEmpty($ip) || $ip === $ipdig) ? "" : "class='emphasized'";
 
@@ -341,44 +562,40 @@ if ($REQUEST === "DDNS") {
         array_push($lines, $line);
     }
     $result = join($DELIM, $lines);
-
-    $now = date_create_from_format($FMT_DATETIME, date($FMT_DATETIME, time()));
-    $wanip_date = date_create_from_format($FMT_DATETIME, $wanip[0]);
-    $duration = ($now->getTimestamp() - $wanip_date->getTimestamp());
-
-    $html_header = sprintf('<tr><th>%s</th><th>%s</th><th>%s</th></tr>', "Domain", "NameCheap Registered IP", "Apparent IP from AlwaysData");
-    $html_title  = "Dynamic DNS Status Report";
-    $html_intro  = sprintf("<p>Last WAN IP was logged %s ago (at %s) with stated reason: %s.</p>", duration_formatted($duration), $wanip[0], $wanip[2]);
 } elseif ($REQUEST === "WAN") {
-    // TODO: Report the IPv6 logfile too!
-    // I think in HTML two table side by side
-    // and in JSON simply continue the dctionary with IPv6 keys (it's currently built with IPv4 keys).
-    // In both cases need to build paralle $result strigs and keep separate track of the $diff_time.
-
-    $log_lines = isset($get['lines']) ? $get['lines'] : $LOG_LINES;
-    $wanlog = explode("\n", tail($wanip4_logfile, $log_lines));
+    // Both families from the one log, IPv4 then IPv6, each as a dictionary entry (JSON) or a section
+    // of the table (HTML) listing the latest changes first.
+    $log_lines = isset($get['lines']) ? max(0, intval($get['lines'])) : $LOG_LINES;
+    $families = ["wanip4" => "IPv4", "wanip6" => "IPv6"];
+    if (isset($get['family']))
+        $families = array_intersect_key($families, ["wanip" . $get['family'] => true]);
+
+    wan_store($wanip_logfile, [$wanip4_logfile, $wanip6_logfile]);
     $lines = [];
-    $prev_time = 0;
-    $prev_IP = "unknown";
-    foreach ($wanlog as $line) {
-        $cells = explode(", ", $line);
-        $log_time = date_create_from_format($FMT_DATETIME, $cells[0]);
-        if ($prev_time == 0) {
-            $diff_time = "";
-        } else {
-            $diff_time = duration_formatted($log_time->getTimestamp() - $prev_time->getTimestamp());
+    foreach ($families as $family => $family_name) {
+        $changes = wan_history($wanip_logfile, $family, $log_lines);
+
+        if ($FORMAT === "JSON") {
+            array_push($lines, sprintf('"%s": %s', $family_name, json_encode($changes)));
+            continue;
         }
-        array_push($lines, sprintf($FMT, $prev_IP, $diff_time, trim($cells[0]), trim($cells[1]), trim($cells[2])));
-        $prev_time = $log_time;
-        $prev_IP = $cells[1];
-    }
 
-    $now = date_create_from_format($FMT_DATETIME, date($FMT_DATETIME, time()));
-    $diff_time = duration_formatted($now->getTimestamp() - $prev_time->getTimestamp());
-    $FMT = "<tr><td>%s</td><td>for</td><td align=right>%s</td><td>until</td><td>%s</td><td></td><td></td><td></td><td></td></tr>";
-    array_push($lines, sprintf($FMT, $prev_IP, $diff_time, "now."));
+        $rows = [];
+        foreach ($changes as $change) {
+            $held = $change['held'] === null ? "" : duration_formatted($change['held']);
+            array_push($rows, sprintf($FMT, $change['previous'], $held, $change['time'], $change['IP'], $change['reason']));
+        }
+        if (count($changes) > 0) {
+            $last = end($changes);
+            $FMT_NOW = "<tr><td>%s</td><td>for</td><td align=right>%s</td><td>until</td><td>%s</td><td></td><td></td><td></td><td></td></tr>";
+            array_push($rows, sprintf($FMT_NOW, $last['IP'], duration_formatted(time() - $last['epoch']), "now."));
+        }
+        array_push($rows, "<tr><th colspan=9>$family_name</th></tr>");
+
+        $lines = array_merge($lines, array_reverse($rows));
+    }
 
-    $result = join($DELIM, array_reverse($lines));
+    $result = join($DELIM, $lines);
     $html_title = "WAN IP Log Report";
     $html_intro = "<p>WAN IPs should be logged here every time the WAN IP changes and the DNNS domains were updated.</p>";
     $html_header = '<tr><th>WAN IP</th><th></th><th>Duration held</th><th></th><th>Until</th><th></th><th>New IP</th><th></th><th>Reason</th></tr>';
@@ -387,20 +604,11 @@ if ($REQUEST === "DDNS") {
 
 <?php if ($FORMAT==="JSON"): ?>
 	{ <?php print($result) ?> }
-<?php else: ?>
-<head>
-<title><?php print $html_title?></title>
-<link rel="icon" type="image/ico" href="favicon.ico">
-<link rel="stylesheet" type="text/css" href="default.css">
-</head>
-<body>
-	<h1><?php print $html_title?></h1>
-		<?php print $html_intro?>
-		<table>
-		<?php
-    print($html_header);
+<?php
+else:
+    if (! $html_started)
+        html_start($html_title, $html_intro, $html_header);
     print($result);
-    ?>
-		</table>
-</body>
-<?php endif; ?>
+    html_end();
+endif;
+?>
@@ -0,0 +1,514 @@
+#!/usr/bin/python
+#
+# A general purpose tool for moving LAN IP configurations between configuration files, backup files and screen.
+#
+# A LAN IP configuration is considered to be a list of Name, IP, MAC tuples that serve as a map between MAC, IP
+# and device names.
+#
+# Can report DHCP and Majordomo configurations or back them up, or restore them from file.
+#
+# The DHCP configurations are used by both the DHCP server to allocate IP addresses to devices based on MAC
+# and the DNS to resolve names to IP addressses.
+#
+# The Majordomo configurations are used by Majordomo to render MAC addresses with a familiar name in reports.
+#
+# Other configuration areas that map names, to IP or MAC can be added easily enough.
+#
+# This replaces lanip.sh, which asked uci for every option of every host (with one "uci get" each) for
+# every record it applied, and committed after each. Here each config is read once (with uciconf), the
+# sources are merged and matched against the configs with dict indexes on name, IP and MAC, and all
+# the changes to the configs are applied in one "uci batch" with a single commit per config.
+
+import os, sys, argparse, socket, subprocess
+import uciconf
+
+UNKNOWN = "unknown"
+
+UCI = ["Majordomo", "DHCP"]
+
+class OrderArgs(argparse.Action):
+	'''
+		A custom action for argparse that stores a pseudo argument "order" as a list of options in order.
+		And the position in that order of a command line argument as its value.
+	'''
+	def __call__(self, parser, namespace, values, option_string=None):
+		order = getattr(namespace, 'order') if hasattr(namespace, 'order') else []
+		if self.dest in order:
+			sys.stderr.write("Warning: --%s should only be specified once. Subsequent instances are ignored.\n" % self.dest)
+		else:
+			order.append(self.dest)
+			setattr(namespace, 'order', order)
+			setattr(namespace, self.dest, len(order))
+
+parser = argparse.ArgumentParser(description='Report, backup and load LAN IP configurations.\nSpecifically concerned with name to IP to MAC mappings configured with uci on an OpenWRT router.',
+                                 epilog='Can read from a list of sources, in which case they are merged if possible, and write to a list of targets. '
+                                        'Multiple sources or targets can be specified (comma separated). SOURCE and TARGET can be: '
+                                        'stdin, stdout, stderr, '
+                                        'DHCP (the router\'s configured static DHCP leases, provides/expects Name, IP, MAC), '
+                                        'Majordomo (the router\'s configured Majordomo static names, provides/expects Name, MAC), '
+                                        'ALL or UCI (all the uci sources/targets, same as "DHCP, Majordomo") '
+                                        'or a FILENAME (which is read or written as appropriate).',
+                                 formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=30))
+
+parser.add_argument('Source', nargs='?', help='read data from SOURCE (default: UCI)')
+parser.add_argument('Target', nargs='?', help='send data to TARGET (default: stdout)')
+parser.add_argument('-s', '--source', help='read data from SOURCE')
+parser.add_argument('-t', '--target', help='send data to TARGET')
+parser.add_argument('-c', '--csv', action='store_true', help='use CSV output on stdout, expect it on stdin')
+parser.add_argument('-H', '--Header', action='store_true', help='add headers to output on stdout, expect one on stdin')
+parser.add_argument('-d', '--debug', action='store_true', help='print a debug trace')
+parser.add_argument('-D', '--DryRun', action='store_true', help='do not alter any configurations, print the changes that would be made')
+parser.add_argument('-C', '--Check', action='store_true', help='only check the sources (and any uci targets) for conflicts, write nothing')
+parser.add_argument('-n', '--NameSort', action=OrderArgs, help='Sort results by Device name.', nargs=0)
+parser.add_argument('-i', '--IPsort', action=OrderArgs, help='Sort results by IP address.', nargs=0)
+parser.add_argument('-m', '--MACsort', action=OrderArgs, help='Sort results by MAC.', nargs=0)
+
+args = parser.parse_args()
+
+def debug(message):
+	if args.debug:
+		print >> sys.stderr, message
+
+def stvals(value):
+	'''
+	Parses a source or target value into a list of sources or targets
+	'''
+	if not value:
+		return []
+	elif value in UCI or os.path.isfile(value):
+		return [value]
+	elif value in ("ALL", "UCI"):
+		return list(UCI)
+	else:
+		return sum([stvals(v) if v in ("ALL", "UCI") else [v] for v in value.replace(",", " ").split()], [])
+
+def unique(values):
+	'''
+	The values in order with repeats dropped (each source is read and each target written once)
+	'''
+	seen = set()
+	return [value for value in values if not (value in seen or seen.add(value))]
+
+def known(value):
+	'''
+	A value from a config or file, trimmed, or UNKNOWN if it's missing
+	'''
+	value = (value or "").strip()
+	return value if value and value.lower() != UNKNOWN else UNKNOWN
+
+class LANIPs(object):
+	'''
+	A merged list of (name, IP, MAC) entries, indexed on each of name, IP and MAC so that each new
+	entry is matched against those already merged in constant time (and a merge of any number of
+	sources takes time in proportion to the number of rows in them).
+
+	Every value is attributed to the source (and row) it came from, and every conflict found is
+	recorded (with the sources of the values in conflict) not just the first. Conflicts are:
+		- a device (matched on MAC, else IP, else name) with two different values for another field
+		  (a MAC with two IPs, say)
+		- a value of one device that another device already has (an IP or name reused)
+	'''
+	FIELDS = ("name", "IP", "MAC")
+
+	def __init__(self):
+		self.entries = []
+		self.origins = []  # The origin of each value in each entry
+		self.index = dict((field, {}) for field in self.FIELDS)
+		self.conflicts = []
+
+	def match(self, entry):
+		# MAC is the best ID for a device, then IP, and name the weakest
+		for field in ("MAC", "IP", "name"):
+			value = entry[self.FIELDS.index(field)]
+			if value != UNKNOWN and value in self.index[field]:
+				return (field, self.index[field][value])
+		return (None, None)
+
+	def set(self, i, field, value, origin):
+		f = self.FIELDS.index(field)
+		self.entries[i][f] = value
+		self.origins[i][f] = origin
+		if value != UNKNOWN:
+			self.index[field].setdefault(value, i)
+
+	def describe(self, i):
+		return " ".join(self.entries[i])
+
+	def conflict(self, description):
+		self.conflicts.append(description)
+		return description
+
+	def store(self, origin, name, IP, MAC):
+		'''
+		Merges an entry from origin (a source and where in it the entry is), returning the result:
+		Added, Updated, Unchanged or Ignored, or a description of the (last) conflict found (all of
+		them are recorded in conflicts).
+		'''
+		new = [known(name), known(IP), known(MAC).upper() if known(MAC) != UNKNOWN else UNKNOWN]
+
+		# Skip an known (observed) bizarre situation where uci has a null entry for something
+		if all(value == UNKNOWN for value in new):
+			return "Ignored"
+
+		(key, i) = self.match(new)
+		if i is None:
+			self.entries.append([UNKNOWN] * len(self.FIELDS))
+			self.origins.append([None] * len(self.FIELDS))
+			for (f, field) in enumerate(self.FIELDS):
+				self.set(len(self.entries) - 1, field, new[f], origin)
+			debug('Found new: "%s" "%s" "%s"' % tuple(new))
+			return "Added"
+
+		old = list(self.entries[i])
+		if old == new:
+			return "Unchanged"
+
+		# Update with new data where ours is unknown and note conflicting data
+		k = self.FIELDS.index(key)
+		result = "Unchanged"
+		for (f, field) in enumerate(self.FIELDS):
+			if field == key or old[f] == new[f] or new[f] == UNKNOWN:
+				continue
+
+			other = self.index[field].get(new[f])
+			if not other is None and other != i:
+				result = self.conflict("%s already in use:\n\t%s: %s\n\tby: %s (from %s)\n\tand: %s (from %s)"
+				                       % (field, field, new[f], self.describe(other), self.origins[other][f], " ".join(new), origin))
+			elif old[f] == UNKNOWN:
+				self.set(i, field, new[f], origin)
+				debug("Merge: Updating %s for %s:\n\t%s: %s\n\t%ss: %s -> %s" % (field, key, key, old[k], field, old[f], new[f]))
+				if result == "Unchanged":
+					result = "Updated"
+			else:
+				result = self.conflict("Conflicting %ss for %s:\n\t%s: %s\n\t%ss: %s (from %s) -> %s (from %s)"
+				                       % (field, key, key, old[k], field, old[f], self.origins[i][f], new[f], origin))
+		return result
+
+	def sorted(self, sortkeys):
+		def IPkey(IP):
+			try:
+				return socket.inet_aton(IP)
+			except socket.error:
+				return ""
+
+		def key(i):
+			(name, IP, MAC) = self.entries[i]
+			keys = []
+			for sortkey in sortkeys:
+				if sortkey == "NameSort":
+					keys.append(name)
+				elif sortkey == "IPsort":
+					keys.append(IPkey(IP))
+				elif sortkey == "MACsort":
+					keys.append(MAC)
+			return keys + [i]
+
+		return [self.entries[i] for i in sorted(range(len(self.entries)), key=key)]
+
+def read_uci(source):
+	'''
+	Returns a list of (origin, name, IP, MAC) tuples from the DHCP or Majordomo config (with one uci call)
+	'''
+	if source == "DHCP":
+		return [("DHCP dhcp.@host[%d]" % host[".index"], uciconf.option(host, "name"), uciconf.option(host, "ip"), uciconf.option(host, "mac"))
+				for host in uciconf.sections(uciconf.show("dhcp"), "host")]
+	else:
+		return [("Majordomo majordomo.@static_name[%d]" % static_name[".index"], uciconf.option(static_name, "name"), UNKNOWN, uciconf.option(static_name, "mac"))
+				for static_name in uciconf.sections(uciconf.show("majordomo"), "static_name")]
+
+def read_file(source):
+	'''
+	Returns a list of (origin, name, IP, MAC) tuples from stdin or a file (space separated, or CSV with --csv)
+	'''
+	if source in ("", "stdin", "0", "-"):
+		lines = sys.stdin.read().splitlines()
+	else:
+		with open(source) as f:
+			lines = f.read().splitlines()
+
+	first = 1
+	if args.Header and lines:
+		debug("Skipping header in %s" % source)
+		first = 2
+
+	entries = []
+	for (number, line) in enumerate(lines[first - 1:], first):
+		parts = line.split(",") if args.csv else line.split()
+		parts = [part.strip().strip("\"'").strip() for part in parts] + ["", "", ""]
+		entries.append(("%s line %d" % (source, number),) + tuple(parts[:3]))
+	return entries
+
+def quoted(value):
+	return "'" + value.replace("'", "'\\''") + "'"
+
+class Config(object):
+	'''
+	A uci config (dhcp or majordomo) section type (host or static_name) loaded once, with the
+	options we manage, indexed by MAC, IP and name. Entries are applied to it in memory and the
+	changes to make are then the difference between the config as loaded and as it ends up.
+
+	Once all the entries are applied, any IP, name or MAC that two hosts have (one of them changed
+	or added) is a conflict (recorded in conflicts). The config is checked as it ends up, not after
+	each entry, so that hosts can swap IPs (or names). An entry matched on IP or name to a host with
+	another MAC is also a conflict, and is not applied.
+	'''
+	def __init__(self, config, stype, options):
+		self.config = config
+		self.stype = stype
+		self.options = options  # ("name", "ip", "mac") or ("name", "mac")
+		self.loaded = []
+		for section in uciconf.sections(uciconf.show(config), stype):
+			host = {}
+			for option in options:
+				value = uciconf.option(section, option)
+				host[option] = UNKNOWN if value is None or not value.strip() else value.strip()
+			# MACs are compared case insensitively (as "uci get ... | tr" did) so we hold them in upper case
+			if host.get("mac", UNKNOWN) != UNKNOWN:
+				host["mac"] = host["mac"].upper()
+			self.loaded.append(host)
+
+		self.hosts = [dict(host) for host in self.loaded]
+		self.index = dict((option, {}) for option in options)
+		self.conflicts = []
+		for (i, host) in enumerate(self.hosts):
+			self.add_to_index(i, host)
+
+	def values(self, host, option):
+		# The values a host has for an option to index it on (a host can have a list of MACs)
+		if host[option] == UNKNOWN:
+			return []
+		return host[option].split() if option == "mac" else [host[option]]
+
+	def add_to_index(self, i, host):
+		# Every host with a value is indexed under it (a config can have duplicates)
+		for option in self.options:
+			for value in self.values(host, option):
+				self.index[option].setdefault(value, set()).add(i)
+
+	def remove_from_index(self, i, host):
+		for option in self.options:
+			for value in self.values(host, option):
+				holders = self.index[option].get(value, set())
+				holders.discard(i)
+				if not holders:
+					self.index[option].pop(value, None)
+
+	def match(self, entry):
+		'''
+		The host an entry matches on MAC, IP or name (in that order of priority) and the option it
+		matched on, or (None, None). The first host with a given MAC is the one it's matched to, and
+		the last with a given IP or name (as lanip.sh did).
+		'''
+		for option in ("mac", "ip", "name"):
+			if option in self.options and entry[option] != UNKNOWN and entry[option] in self.index[option]:
+				holders = self.index[option][entry[option]]
+				return (min(holders) if option == "mac" else max(holders), option)
+		return (None, None)
+
+	def apply(self, entry):
+		'''
+		Applies an entry (a dict with the options) to the host it matches, as the config now is, or
+		else adds a new host. Returns False (having applied nothing) if it matched a host on IP or
+		name that has another MAC (applying it would drop that device from the config).
+		'''
+		(i, matched) = self.match(entry)
+
+		if not i is None and matched != "mac" and "mac" in self.options:
+			host = self.hosts[i]
+			if host["mac"] != UNKNOWN and entry["mac"] != UNKNOWN and not entry["mac"] in host["mac"].split():
+				self.conflicts.append("%s would replace another device:\n\t%s: %s\n\tby: %s (%s)\n\tand: %s"
+				                      % (matched, matched, entry[matched], self.section(i),
+				                         self.describe(host), self.describe(entry)))
+				return False
+
+		if i is None:
+			self.hosts.append(dict(entry))
+			self.add_to_index(len(self.hosts) - 1, entry)
+		else:
+			# The host's old values no longer identify it, so they're dropped from the index first
+			host = self.hosts[i]
+			self.remove_from_index(i, host)
+			for option in self.options:
+				# A host that has the entry's MAC in its list of MACs keeps the list
+				if option == "mac" and entry["mac"] in host["mac"].split():
+					continue
+				host[option] = entry[option]
+			self.add_to_index(i, host)
+		return True
+
+	def section(self, i):
+		return "%s.@%s[%d]" % (self.config, self.stype, i)
+
+	def describe(self, host):
+		return " ".join(host[option] for option in self.options)
+
+	def check(self):
+		'''
+		Records a conflict for each IP, name or MAC that more than one host has, as the config is
+		now (with all the entries applied), if any of those hosts was changed or added.
+		'''
+		changed = set(i for (i, host) in enumerate(self.hosts) if i >= len(self.loaded) or host != self.loaded[i])
+		for option in self.options:
+			for (value, holders) in sorted(self.index[option].items()):
+				if len(holders) > 1 and holders & changed:
+					self.conflicts.append("%s already in use:\n\t%s: %s\n%s"
+					                      % (option, option, value, "\n".join("\tby: %s (%s)" % (self.section(i), self.describe(self.hosts[i])) for i in sorted(holders))))
+		return not self.conflicts
+
+	def changes(self):
+		'''
+		Returns the uci batch commands that make the config as loaded what it now is, and a
+		description of each change as a list of (description, [commands])
+		'''
+		changes = []
+		for (i, host) in enumerate(self.hosts):
+			section = self.section(i)
+			if i < len(self.loaded):
+				old = self.loaded[i]
+				if old == host:
+					continue
+				description = "%s: %s" % (section, " ".join("%s->%s" % (old[option], host[option]) for option in self.options))
+				commands = []
+				for option in self.options:
+					if host[option] == old[option]:
+						continue
+					elif host[option] == UNKNOWN:
+						commands.append("delete %s.%s" % (section, option))
+					else:
+						commands.append("set %s.%s=%s" % (section, option, quoted(host[option])))
+			else:
+				description = "%s: new %s" % (section, self.describe(host))
+				commands = ["add %s %s" % (self.config, self.stype)]
+				for option in self.options:
+					if host[option] != UNKNOWN:
+						commands.append("set %s.@%s[-1].%s=%s" % (self.config, self.stype, option, quoted(host[option])))
+			changes.append((description, commands))
+		return changes
+
+def plan_uci(targets, entries):
+	'''
+	Applies the entries to the uci targets (DHCP and/or Majordomo) in memory, returning a list of
+	(target, Config) and a list of the conflicts with the configs that were found. Nothing is written.
+	'''
+	configs = []
+	conflicts = []
+	for target in targets:
+		if target == "DHCP":
+			config = Config("dhcp", "host", ("name", "ip", "mac"))
+			for (name, IP, MAC) in entries:
+				# DHCP hosts are keyed on MAC if known else IP
+				if MAC != UNKNOWN or IP != UNKNOWN:
+					config.apply({"name": name, "ip": IP, "mac": MAC})
+		else:
+			config = Config("majordomo", "static_name", ("name", "mac"))
+			for (name, IP, MAC) in entries:
+				if MAC != UNKNOWN:
+					config.apply({"name": name, "mac": MAC})
+
+		config.check()
+		configs.append((target, config))
+		conflicts += ["%s: %s" % (target, conflict) for conflict in config.conflicts]
+	return (configs, conflicts)
+
+def apply_uci(configs):
+	'''
+	Writes the changes planned (by plan_uci) to the configs in one uci batch with one commit per
+	config changed, or with --DryRun prints the changes only.
+	'''
+	batch = []
+	for (target, config) in configs:
+		changes = config.changes()
+		for (description, commands) in changes:
+			if args.DryRun:
+				print "# " + description
+				for command in commands:
+					print command
+			else:
+				debug("Setting %s config: %s" % (target, description))
+			batch += commands
+
+		if changes:
+			batch.append("commit %s" % config.config)
+
+	if args.DryRun or not batch:
+		return True
+
+	uci = subprocess.Popen(["uci", "batch"], stdin=subprocess.PIPE)
+	uci.communicate("\n".join(batch) + "\n")
+	return uci.returncode == 0
+
+# Build the sources and targets lists
+source_list = unique(stvals(args.source) + stvals(args.Source))
+if not source_list:
+	source_list = list(UCI)
+
+target_list = unique(stvals(args.target) + stvals(args.Target))
+if not target_list:
+	target_list = ["stdout"]
+
+sortkeys = list(getattr(args, 'order', []))
+
+debug("Sort keys: %s" % " ".join(sortkeys))
+debug("sources: %d (%s)" % (len(source_list), " ".join(source_list)))
+debug("targets: %d (%s)" % (len(target_list), " ".join(target_list)))
+
+lanips = LANIPs()
+sources_ok = True
+for source in source_list:
+	debug("\nSourcing: %s" % source)
+	rows = read_uci(source) if source in UCI else read_file(source)
+	for (origin, name, IP, MAC) in rows:
+		conflicts = len(lanips.conflicts)
+		lanips.store(origin, name, IP, MAC)
+		for conflict in lanips.conflicts[conflicts:]:
+			print >> sys.stderr, conflict
+			sources_ok = False
+
+entries = lanips.sorted(sortkeys)
+uci_targets = [target for target in target_list if target in UCI]
+
+# A pre-flight check: report the conflicts amongst the sources and with the uci targets, write nothing
+if args.Check:
+	conflicts = plan_uci(uci_targets, entries)[1] if uci_targets else []
+	for conflict in conflicts:
+		print >> sys.stderr, conflict
+	print "%d entries from %s: %d conflicts" % (len(entries), ", ".join(source_list), len(lanips.conflicts) + len(conflicts))
+	sys.exit(0 if sources_ok and not conflicts else 1)
+
+maxname = max([0] + [len(name) for (name, IP, MAC) in entries])
+FMT = '"%s", "%s", "%s"' if args.csv else "%%-%ds %%-15s %%-17s" % maxname
+
+for target in target_list:
+	debug("\nTargeting: %s" % target)
+	if target in UCI:
+		continue
+
+	if target in ("", "stdout", "1", "-"):
+		out = sys.stdout
+	elif target in ("stderr", "2"):
+		out = sys.stderr
+	else:
+		out = open(target, "w")
+
+	if args.Header:
+		print >> out, FMT % ("Device Name", "IP", "MAC")
+	for entry in entries:
+		print >> out, FMT % tuple(entry)
+
+	if not out in (sys.stdout, sys.stderr):
+		out.close()
+
+if uci_targets:
+	if not sources_ok:
+		print >> sys.stderr, "%s configs NOT written. Sources not consistent." % " and ".join(uci_targets)
+		sys.exit(1)
+
+	(configs, conflicts) = plan_uci(uci_targets, entries)
+	if conflicts:
+		for conflict in conflicts:
+			print >> sys.stderr, conflict
+		print >> sys.stderr, "%s configs NOT written. Sources conflict with them." % " and ".join(uci_targets)
+		sys.exit(1)
+	elif not apply_uci(configs):
+		print >> sys.stderr, "uci batch failed, %s configs NOT written." % " and ".join(uci_targets)
+		sys.exit(1)
@@ -0,0 +1,141 @@
+#
+# Name tables for the LAN, mapping IP addresses and MAC addresses to device names.
+#
+# Builds the tables by checking
+# 	Active DHCP leases
+# 	DHCP Configuration
+# 	Majordomo Configuration (MACs only)
+#
+# Active leases take priority over configured names. The configurations are read in one pass
+# each with uciconf.
+#
+# If namesd is running the tables are fetched from it over a Unix socket (it holds them in memory
+# and rebuilds them only when the leases or configs change) else they are built here.
+#
+# Not a script in its own right, it is imported by the scripts that need it, so it must be installed
+# alongside them (with its .py extension intact).
+
+import os
+import socket
+import json
+import uciconf
+
+DHCP_LEASES = "/tmp/dhcp.leases"
+SOCKET = "/var/run/namesd.sock"
+TIMEOUT = 2  # seconds to wait for namesd before building tables here
+
+# The files the tables are built from (uci keeps uncommitted changes in /tmp/.uci)
+SOURCES = [DHCP_LEASES,
+		   "/etc/config/dhcp",
+		   "/etc/config/majordomo",
+		   "/tmp/.uci/dhcp",
+		   "/tmp/.uci/majordomo"]
+
+TABLES = ("IP", "MAC")
+
+def get_DHCP_leases():
+	'''
+	Returns a list of (MAC, IP, name) tuples for the active DHCP leases
+	'''
+	leases = []
+	try:
+		with open(DHCP_LEASES) as lease_file:
+			for line in lease_file:
+				fields = line.split()
+				if len(fields) >= 4:
+					leases.append((fields[1].upper(), fields[2], fields[3]))
+	except IOError:
+		pass
+	return leases
+
+def build_tables():
+	'''
+	Returns a dict holding the IP and MAC name tables, built from the leases and configs
+	'''
+	IP_names = {}
+	MAC_names = {}
+
+	# Start with the known DHCP leases
+	for (MAC, IP, name) in get_DHCP_leases():
+		IP_names[IP] = name
+		MAC_names[MAC] = name
+
+	# Augment with any DHCP conf info
+	for host in uciconf.sections(uciconf.show("dhcp"), "host"):
+		name = uciconf.option(host, "name")
+		IP = uciconf.option(host, "ip")
+		if not IP is None and not IP in IP_names:
+			IP_names[IP] = name
+		for MAC in uciconf.values(host, "mac"):
+			MAC_names.setdefault(MAC.upper(), name)
+
+	# Augment with any MajorDomo conf info
+	for static_name in uciconf.sections(uciconf.show("majordomo"), "static_name"):
+		name = uciconf.option(static_name, "name")
+		for MAC in uciconf.values(static_name, "mac"):
+			MAC_names.setdefault(MAC.upper(), name)
+
+	return {"IP": IP_names, "MAC": MAC_names}
+
+def sources_signature():
+	'''
+	Returns a signature of the source files (mtimes and sizes) that changes if any of them change
+	'''
+	signature = []
+	for source in SOURCES:
+		try:
+			stat = os.stat(source)
+			signature.append((stat.st_mtime, stat.st_size))
+		except OSError:
+			signature.append(None)
+	return tuple(signature)
+
+def ask_daemon(request):
+	'''
+	Sends a one line request to namesd and returns the decoded JSON response.
+	Raises socket.error if namesd is not running.
+	'''
+	client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	client.settimeout(TIMEOUT)
+	try:
+		client.connect(SOCKET)
+		client.sendall(request + "\n")
+		response = client.makefile().readline()
+	finally:
+		client.close()
+
+	if not response:
+		raise socket.error("No response from namesd")
+
+	return json.loads(response)
+
+def table(name):
+	'''
+	Returns the name table for "IP" or "MAC", from namesd if it's running else built here.
+	'''
+	try:
+		return ask_daemon(name)
+	except (socket.error, ValueError):
+		return build_tables()[name]
+
+def tables():
+	'''
+	Returns a dict holding both name tables ("IP" and "MAC"), from namesd if it's running else built
+	here (once, for both).
+	'''
+	try:
+		return dict((name, ask_daemon(name)) for name in TABLES)
+	except (socket.error, ValueError):
+		return build_tables()
+
+def lookup(name, address):
+	'''
+	Returns the name of a given address in the "IP" or "MAC" table, or None if it has no name.
+	'''
+	if name == "MAC":
+		address = address.upper()
+
+	try:
+		return ask_daemon("%s %s" % (name, address))
+	except (socket.error, ValueError):
+		return build_tables()[name].get(address)
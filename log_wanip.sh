@@ -41,23 +41,11 @@ source $keydir/$keyfile
 
 # Fetch the WAN IPs
 
-wanip4=""
-wanip6=""
-tries=0
-
 # WAN IP may not be available the second the ifup event triggers a hotplug
-# Retry until it is or a time is up (30mins)
-while [[ "$wanip4" == "" ]] && (( tries < 60 )); do
-	wanip4=$(wanip -4)
-	if [[ "$wanip4" == "" ]]; then sleep 30; fi
-	(( tries++ ))
-done
-
-while [[ "$wanip6" == "" ]] && (( tries < 60 )); do
-	wanip6=$(wanip -6)
-	if [[ "$wanip6" == "" ]]; then sleep 30; fi
-	(( tries++ ))
-done
+# wanaddr waits for it (up to 30mins) and reports it the instant it's assigned
+wait=1800
+wanip4=$(wanaddr -4 -w -t $wait)
+wanip6=$(wanaddr -6 -w -t $(( SECONDS < wait ? wait - SECONDS : 0 )))
 
 # If we still don't have it, say so with clarity.
 if [[ "$wanip4" == "" ]]; then wanip4="unknown"; fi
@@ -72,7 +60,8 @@ if [[ "$wanip4" != "$lastip4" ]] || [[ "$wanip6" != "$lastip6" ]]; then
 
 	echo $wanip4 > $ipdir/$ip4file
 	echo $wanip6 > $ipdir/$ip6file
-	echo $result >> $logdir/$logfile
+	# One record of the change with both families, in the log (and its index) that wanip -h reads
+	wanlog -f $logdir/$logfile -c "$wanip4" "$wanip6" "$reason"
 
 	# Send a notification email:
 	#
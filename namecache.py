@@ -0,0 +1,258 @@
+#
+# A persistent cache of reverse DNS names for IP addresses (and of the name servers for domains).
+#
+# Reverse DNS is slow, so NAT.py and nodename keep the names they find (and ddnsip the authoritative
+# name servers it finds). This stores them in a small sqlite database on tmpfs rather than a pickled
+# dict, so that:
+#
+#   - only the names needed are read, not the whole cache
+#   - updates are written in one transaction, not by rewriting the whole file
+#   - concurrent runs don't clobber each other's updates (sqlite locks the file)
+#   - each name expires (by the TTL of its PTR record) and the cache is capped in size, dropping the
+#     least recently used names first, so it can't grow without bound on the router's RAM backed /tmp.
+#
+# The name servers of domains (ZoneCache) are kept in a table of their own, with their own size cap
+# and TTL bounds, so that the many reverse names NAT.py looks up can't evict them.
+#
+# If python's sqlite3 module isn't installed the cache only lives as long as the process.
+#
+# Not a script in its own right, it is imported by the scripts that need it, so it must be installed
+# alongside them (with its .py extension intact).
+
+import time
+import dnsquery
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+CACHE_FILE = "/tmp/name_cache.sqlite"
+MAX_ENTRIES = 20000  # About 1.5MB on disk
+
+# Bounds on how long we cache reverse DNS results (seconds). The PTR record's TTL is used within
+# these bounds, the minimum stops short TTLs from costing a lookup on every run.
+MIN_TTL = 300
+MAX_TTL = 86400
+NEGATIVE_TTL = 3600  # For IPs with no PTR record (if the zone doesn't tell us)
+RETRY_TTL = 60       # For IPs whose lookup timed out or failed
+STALE_TTL = 86400    # How long expired names are kept (as a fallback if a lookup times out)
+
+# The same for the name servers of domains (from NS records, which change rarely). Expired ones
+# are of no use (we don't fall back on them) so they're dropped.
+MAX_ZONES = 1000
+ZONE_MIN_TTL = 3600
+ZONE_MAX_TTL = 2 * 86400
+ZONE_STALE_TTL = 0
+
+LOCK_TIMEOUT = 10    # seconds to wait for another process to finish writing
+BATCH = 500          # keys per query (sqlite limits the number of parameters)
+
+
+class NameCache(object):
+    '''
+    A cache of names keyed on IP address, each with an expiry time.
+    '''
+    TABLE = "names"
+    STALE_TTL = STALE_TTL
+
+    def __init__(self, path=CACHE_FILE, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.memory = {}
+        self.db = None
+
+        if sqlite3 is not None:
+            try:
+                self.db = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+                self.db.text_factory = str
+                with self.db:
+                    self.db.execute("CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, name TEXT, expires REAL, used REAL)" % self.TABLE)
+                    self.db.execute("CREATE INDEX IF NOT EXISTS %s_used ON %s (used)" % (self.TABLE, self.TABLE))
+            except sqlite3.Error:
+                self.db = None  # Fall back on a memory cache
+
+    def get_many(self, keys):
+        '''
+        Returns a dict of key: (name, expiry time) for those keys in the cache (expired or not),
+        and marks them as recently used.
+        '''
+        keys = list(set(keys))
+        found = {}
+
+        if self.db is None:
+            for key in keys:
+                if key in self.memory:
+                    found[key] = self.memory[key]
+            return found
+
+        now = time.time()
+        with self.db:
+            for i in range(0, len(keys), BATCH):
+                batch = keys[i:i + BATCH]
+                marks = ",".join("?" * len(batch))
+                for (key, name, expires) in self.db.execute("SELECT key, name, expires FROM %s WHERE key IN (%s)" % (self.TABLE, marks), batch):
+                    found[key] = (name, expires)
+                self.db.execute("UPDATE %s SET used=? WHERE key IN (%s)" % (self.TABLE, marks), [now] + batch)
+
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, entries):
+        '''
+        Stores a dict of key: (name, expiry time) in one transaction and trims the cache.
+        '''
+        if self.db is None:
+            self.memory.update(entries)
+            return
+
+        now = time.time()
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO %s (key, name, expires, used) VALUES (?, ?, ?, ?)" % self.TABLE,
+                                [(key, name, expires, now) for (key, (name, expires)) in entries.items()])
+            self.prune(now)
+
+    def put(self, key, name, expires):
+        self.put_many({key: (name, expires)})
+
+    def prune(self, now=None):
+        '''
+        Drops long expired names and, if the cache is still too big, the least recently used names.
+        '''
+        if self.db is None:
+            return
+
+        now = now or time.time()
+        self.db.execute("DELETE FROM %s WHERE expires < ?" % self.TABLE, (now - self.STALE_TTL,))
+        excess = self.db.execute("SELECT COUNT(*) FROM %s" % self.TABLE).fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.db.execute("DELETE FROM %s WHERE key IN (SELECT key FROM %s ORDER BY used LIMIT ?)" % (self.TABLE, self.TABLE), (excess,))
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+class ZoneCache(NameCache):
+    '''
+    A cache of the name servers of domains keyed on domain, each with an expiry time, in the same
+    database as the names but in a table (and so a size cap and least recently used order) of its own.
+    '''
+    TABLE = "zones"
+    STALE_TTL = ZONE_STALE_TTL
+
+    def __init__(self, path=CACHE_FILE, max_entries=MAX_ZONES):
+        NameCache.__init__(self, path, max_entries)
+
+
+def bounded_ttl(ttl, min_ttl=MIN_TTL, max_ttl=MAX_TTL):
+    return min(max(ttl, min_ttl), max_ttl)
+
+
+def reverse_names(cache, IPs, timeout=dnsquery.TIMEOUT, concurrency=dnsquery.CONCURRENCY):
+    '''
+    Returns a dict of IP: name for the given IPs ("unknown" for those without one).
+
+    Names fresh in the cache are used as is, the rest are looked up concurrently with dnsquery
+    and stored in the cache with their TTLs.
+    '''
+    now = time.time()
+    cached = cache.get_many(IPs)
+    names = dict((IP, cached[IP][0]) for IP in cached)
+
+    queries = {}
+    for IP in IPs:
+        if not IP in cached or cached[IP][1] <= now:
+            queries[(dnsquery.reverse_name(IP), "PTR")] = IP
+
+    if not queries:
+        return names
+
+    responses = dnsquery.resolve(queries.keys(), timeout=timeout, concurrency=concurrency)
+
+    updates = {}
+    for query, response in responses.items():
+        IP = queries[query]
+        PTRs = dnsquery.records(response, "PTR")
+        ttl = dnsquery.min_ttl(response, "PTR")
+        if PTRs:
+            updates[IP] = (PTRs[0], now + bounded_ttl(ttl))
+        elif response is not None and response["rcode"] in (dnsquery.NOERROR, dnsquery.NXDOMAIN):
+            updates[IP] = ("unknown", now + bounded_ttl(NEGATIVE_TTL if ttl is None else ttl))
+        else:
+            # Timed out or the server failed (SERVFAIL, REFUSED and the like, which say nothing
+            # about the name), so keep a stale name if we have one, and try again soon
+            updates[IP] = (names.get(IP, "unknown"), now + RETRY_TTL)
+
+    cache.put_many(updates)
+
+    for IP in updates:
+        names[IP] = updates[IP][0]
+
+    return names
+
+
+def zone_servers(cache, domains, timeout=dnsquery.TIMEOUT, concurrency=dnsquery.CONCURRENCY):
+    '''
+    Returns a dict of domain: (zone, [(name, IP), ...]) listing the authoritative name servers of
+    each domain's zone ((None, []) for domains whose zone wasn't found).
+
+    Zones are found by asking for the NS records of each domain and all its parents at once, the
+    zone being the longest of them that has NS records. The name servers found are kept in the
+    cache (a ZoneCache) for the TTL of their NS records.
+    '''
+    now = time.time()
+    cached = cache.get_many(domains)
+
+    found = {}
+    for domain in cached:
+        (value, expires) = cached[domain]
+        if expires > now:
+            fields = value.split()
+            found[domain] = (fields[0], [tuple(field.split("=")) for field in fields[1:]])
+
+    def parents(domain):
+        # The domain and its parents, longest first (not including the top level domain)
+        labels = domain.rstrip(".").lower().split(".")
+        return [".".join(labels[i:]) for i in range(len(labels) - 1)]
+
+    wanted = [domain for domain in domains if not domain in found]
+    if wanted:
+        queries = set((parent, "NS") for domain in wanted for parent in parents(domain))
+        responses = dnsquery.resolve(queries, timeout=timeout, concurrency=concurrency)
+
+        zones = {}
+        for domain in wanted:
+            for parent in parents(domain):
+                response = responses[(parent, "NS")]
+                # Only NS records of the parent itself (a CNAME'd name can bring others)
+                NSs = [] if response is None else [r[3].lower() for r in response["answer"] if r[1] == "NS" and r[0].lower() == parent]
+                if NSs:
+                    zones[domain] = (parent, sorted(NSs), dnsquery.min_ttl(response, "NS"))
+                    break
+
+        NS_names = set(NS for (zone, NSs, ttl) in zones.values() for NS in NSs)
+        responses = dnsquery.resolve([(NS, "A") for NS in NS_names], timeout=timeout, concurrency=concurrency)
+        addresses = {}
+        for (NS, rtype) in responses:
+            As = dnsquery.records(responses[(NS, rtype)], "A")
+            if As:
+                addresses[NS] = As[-1]
+
+        updates = {}
+        for domain in zones:
+            (zone, NSs, ttl) = zones[domain]
+            servers = [(NS, addresses[NS]) for NS in NSs if NS in addresses]
+            found[domain] = (zone, servers)
+            if servers:
+                updates[domain] = (" ".join([zone] + ["%s=%s" % server for server in servers]), now + bounded_ttl(ttl, ZONE_MIN_TTL, ZONE_MAX_TTL))
+
+        cache.put_many(updates)
+
+    for domain in domains:
+        if not domain in found:
+            found[domain] = (None, [])
+
+    return found
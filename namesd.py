@@ -0,0 +1,97 @@
+#!/usr/bin/python
+#
+# A small name resolution daemon for the LAN.
+#
+# IPnames, MACnames, nodename and friends all map IPs and MACs to names by reading the DHCP leases
+# and the DHCP and Majordomo configurations. That's a lot of work to repeat on every invocation.
+# This holds the tables in memory and serves them over a Unix socket, rebuilding them only when
+# the leases or configs change (checked by mtime on each request, which is just a few stats).
+#
+# The clients (via lannames) fall back to building the tables themselves if this isn't running.
+#
+# The protocol is one request line per connection, answered with one line of JSON:
+#	IP			the full IP to name table
+#	MAC			the full MAC to name table
+#	IP address	the name of that IP address (or null)
+#	MAC address	the name of that MAC address (or null)
+#
+# Start it on boot with something like this in /etc/rc.local:
+#	namesd &
+
+import os
+import sys
+import json
+import socket
+import signal
+import argparse
+import SocketServer
+import lannames
+
+parser = argparse.ArgumentParser(description='Serve LAN IP and MAC to name lookups over a Unix socket.',
+                                 epilog="Used by IPnames, MACnames and other tools in this set when it's running.",
+                                 formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=20))
+
+parser.add_argument('-s', '--Socket', default=lannames.SOCKET, help='The socket to listen on (default: %s).' % lannames.SOCKET)
+parser.add_argument('-v', '--Verbose', action='store_true', help='Log requests and table rebuilds to stderr.')
+
+args = parser.parse_args()
+
+tables = None
+signature = None
+
+def get_tables():
+	global tables, signature
+
+	current = lannames.sources_signature()
+	if current != signature:
+		tables = lannames.build_tables()
+		signature = current
+		if args.Verbose:
+			print >> sys.stderr, "Rebuilt tables: %d IPs, %d MACs" % (len(tables["IP"]), len(tables["MAC"]))
+
+	return tables
+
+class NameRequest(SocketServer.StreamRequestHandler):
+	def handle(self):
+		request = self.rfile.readline().split()
+
+		if args.Verbose:
+			print >> sys.stderr, "Request:", " ".join(request)
+
+		if len(request) in (1, 2) and request[0] in lannames.TABLES:
+			table = get_tables()[request[0]]
+			if len(request) == 1:
+				response = table
+			elif request[0] == "MAC":
+				response = table.get(request[1].upper())
+			else:
+				response = table.get(request[1])
+		else:
+			response = {"error": "Unknown request"}
+
+		self.wfile.write(json.dumps(response) + "\n")
+
+# Clean up a stale socket from a previous run (but don't steal a live one)
+if os.path.exists(args.Socket):
+	try:
+		probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		probe.connect(args.Socket)
+		probe.close()
+		print >> sys.stderr, "namesd is already running on %s" % args.Socket
+		sys.exit(1)
+	except socket.error:
+		os.remove(args.Socket)
+
+server = SocketServer.UnixStreamServer(args.Socket, NameRequest)
+
+# Exit cleanly (removing the socket) when killed
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+try:
+	get_tables()
+	server.serve_forever()
+except KeyboardInterrupt:
+	pass
+finally:
+	server.server_close()
+	os.remove(args.Socket)
@@ -24,9 +24,20 @@
 # 2) You can only get access if you have 20 domains or more registered with them or spent $50 or more with them 
 #    in the past two years. Not a huge hurdle but if you haven't spent $50 you may need to access the API.
 # 3) You need to enable the API on your account and whitelist any IPs from which you access it explicitly.
+#
+# The API is called over a few persistent (keep-alive) HTTPS connections, with the getHosts calls for
+# all the domains running in parallel (see APIClient) but within the API's rate limits.
+#
+# The results are cached (in CacheFile) so that index.php, which runs this on every page view, needn't
+# wait on the API each time. Cached results are used until they're older than --MaxAge, and are all
+# dropped (with --Invalidate) when index.php logs a new WAN IP, as the registered IPs are about to change.
  
-import os, subprocess, urllib, sys, argparse, json
-import xml.etree.ElementTree as ET  # The API returns XML
+import os, subprocess, urllib, sys, argparse, json, fcntl
+import time, random, socket, httplib, urlparse, threading, Queue, collections
+try:
+    import xml.etree.cElementTree as ET  # The API returns XML
+except ImportError:
+    import xml.etree.ElementTree as ET
 
 # Configurations 
 AuthFile = "~/.auth/namecheap.auth"
@@ -34,6 +45,18 @@ APIURL = "https://api.namecheap.com/xml.response"
 XMLprefix = "{http://api.namecheap.com/xml.response}"
 NoIP = "127.0.0.0"
 
+# Namecheap limits API calls to 20 a minute, 700 an hour and 8000 a day (as (calls, seconds))
+RateLimits = ((20, 60), (700, 3600))
+Concurrency = 4      # API calls in flight at once (each on its own connection)
+Retries = 3          # Times to retry a call that failed or was throttled
+Backoff = 2          # Seconds to wait before the first retry (doubling for each one after)
+Timeout = 30         # Seconds to wait for a response
+
+PageSize = 100      # Domains per page of getList results (the most the API allows)
+
+CacheFile = "~/.cache/ncdip.json"
+CacheTTL = 900       # Seconds that cached results are used for by default
+
 # Parse arguments
 parser = argparse.ArgumentParser(description='Report registered IP address(es) for Namecheap registered Dynamic Domain Names.',
                                  epilog = "Requires that you have valid authorization details in {}.".format(AuthFile) +
@@ -46,6 +69,11 @@ corj.add_argument('-c', '--csv', action='store_true', help='Print output in CSV
 corj.add_argument('-j', '--json', action='store_true', help='Print output in JSON format')
 
 parser.add_argument('-H', '--Header', action='store_true', help='Print header line')
+parser.add_argument('-C', '--Concurrency', type=int, default=Concurrency, help='API calls to make at once (default: %(default)s)')
+parser.add_argument('-R', '--Rate', type=int, default=RateLimits[0][0], help='API calls allowed per minute (default: %(default)s)')
+parser.add_argument('-M', '--MaxAge', '--max-age', type=float, default=CacheTTL, help='Use cached results up to this many seconds old (default: %(default)s, 0 to always ask the API)')
+parser.add_argument('-I', '--Invalidate', action='store_true', help='Drop all cached results (when the WAN IP changes) and exit')
+parser.add_argument('-A', '--API', default=APIURL, help='The API URL (default: %(default)s, the sandbox is https://api.sandbox.namecheap.com/xml.response)')
 
 args = parser.parse_args()
 
@@ -65,8 +93,68 @@ def readAuth(file):
         
     return auth
 
+def loadCache():
+    try:
+        with open(os.path.expanduser(CacheFile)) as f:
+            cache = json.load(f)
+        if isinstance(cache.get("getHosts"), dict):
+            cache.setdefault("generation", 0)
+            return cache
+    except (IOError, ValueError, AttributeError):
+        pass
+    return {"generation": 0, "getList": None, "getHosts": {}}
+
+def lockCache():
+    # An exclusive lock (held until the file returned is closed) on the cache's lock file, under
+    # which the cache is rewritten or invalidated
+    path = os.path.expanduser(CacheFile)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    lock = open(path + ".lock", "a")
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+def writeCache(cache):
+    # Write a new cache and move it into place, so concurrent page views never read half a cache
+    path = os.path.expanduser(CacheFile)
+    temp = "{}.{}".format(path, os.getpid())
+    with open(temp, "w") as f:
+        json.dump(cache, f)
+    os.rename(temp, path)
+
+def saveCache(cache):
+    # Unless the cache was invalidated since we loaded it (its generation has moved on), in which
+    # case what we have predates the new WAN IP and is dropped.
+    try:
+        with lockCache():
+            if loadCache()["generation"] == cache["generation"]:
+                writeCache(cache)
+    except (IOError, OSError):
+        pass  # No worries, we'll just ask the API again next time
+
+def invalidateCache():
+    # Empties the cache and moves its generation on, so that no run that loaded it before can
+    # write it back
+    try:
+        with lockCache():
+            writeCache({"generation": loadCache()["generation"] + 1, "getList": None, "getHosts": {}})
+    except (IOError, OSError):
+        try:
+            os.remove(os.path.expanduser(CacheFile))
+        except OSError:
+            pass
+
+def fresh(entry):
+    return not entry is None and 0 <= time.time() - entry["time"] <= args.MaxAge
+
+if args.Invalidate:
+    invalidateCache()
+    sys.exit()
+
+cache = loadCache()
+
 try:
-    ClientIP = subprocess.check_output(["wanip"])
+    ClientIP = subprocess.check_output(["wanip", "-4"]).strip()
 except:
     ClientIP = NoIP
 
@@ -75,32 +163,216 @@ auth = readAuth(AuthFile)
 username = auth["username"] 
 APIkey = auth["APIkey"] 
 
-def APIglobals():
-    return "?ApiUser={}&UserName={}&ApiKey={}&ClientIP={}".format(username, username, APIkey, ClientIP)
-    
-def getDomains():
+class APIClient(object):
+    '''
+    Makes Namecheap API calls over persistent (keep-alive) connections, so that only the first call
+    on each connection pays for the TLS handshake.
+
+    Calls can be made from many threads at once (see map), each taking an idle connection or
+    opening a new one. All calls wait their turn under the rate limits, and calls that fail or
+    are throttled are retried after a backoff.
+    '''
+    def __init__(self, url, rate_limits=RateLimits, timeout=Timeout):
+        parts = urlparse.urlsplit(url)
+        self.Connection = httplib.HTTPSConnection if parts.scheme == "https" else httplib.HTTPConnection
+        self.host = parts.netloc
+        self.path = parts.path
+        self.timeout = timeout
+        self.rate_limits = rate_limits
+        self.calls = collections.deque()  # The times of recent calls
+        self.idle = Queue.LifoQueue()     # Idle connections (the most recently used first, as the least likely to have been closed)
+        self.lock = threading.Lock()
+
+    def wait_turn(self):
+        # Waits until a call is allowed under all the rate limits, and books it
+        while True:
+            with self.lock:
+                now = time.time()
+                longest = max(seconds for (calls, seconds) in self.rate_limits)
+                while self.calls and self.calls[0] <= now - longest:
+                    self.calls.popleft()
+
+                wait = 0
+                for (calls, seconds) in self.rate_limits:
+                    recent = [t for t in self.calls if t > now - seconds]
+                    if len(recent) >= calls:
+                        wait = max(wait, recent[-calls] + seconds - now)
+
+                if wait <= 0:
+                    self.calls.append(now)
+                    return
+
+            time.sleep(wait)
+
+    def request(self, query):
+        # Sends one HTTP request, on an idle connection if there is one (retrying once on a fresh
+        # connection if the server had closed it). Returns the connection and the response, whose
+        # body is still to be read.
+        try:
+            connection = self.idle.get_nowait()
+            new = False
+        except Queue.Empty:
+            connection = self.Connection(self.host, timeout=self.timeout)
+            new = True
+
+        try:
+            connection.request("GET", self.path + "?" + query)
+            return (connection, connection.getresponse())
+        except (httplib.HTTPException, socket.error):
+            connection.close()
+            if new:
+                raise
+            return self.request(query)
+
+    def release(self, connection, response):
+        # Returns the connection to the idle pool if the response was read to the end. If parsing
+        # stopped early (once what was wanted was found) the rest of the body is not read, the
+        # connection is closed instead and the next call opens a new one: a TLS handshake costs
+        # less than reading (over the router's link) the rest of a large page we've no use for.
+        if response.isclosed() and not response.will_close:
+            self.idle.put(connection)
+        else:
+            connection.close()
+
+    def call(self, command, parse, **parameters):
+        '''
+        Makes an API call, returning what parse returns given the response (a file like object it
+        can read the XML from as it arrives), or None if the call failed. parse need not read all
+        of the response.
+        '''
+        parameters.update({"ApiUser": username, "UserName": username, "ApiKey": APIkey, "ClientIP": ClientIP, "Command": command})
+        query = urllib.urlencode(parameters)
+
+        for attempt in range(Retries + 1):
+            if attempt > 0:
+                # Exponential backoff, with a little jitter so parallel calls don't retry in lockstep
+                time.sleep(Backoff * 2 ** (attempt - 1) * random.uniform(1, 1.5))
+
+            self.wait_turn()
+            try:
+                (connection, response) = self.request(query)
+            except (httplib.HTTPException, socket.error):
+                continue
+
+            try:
+                if response.status in (429, 502, 503, 504):
+                    continue
+                return parse(response)
+            except APIError as e:
+                if not e.throttled():
+                    raise
+            except (ET.ParseError, httplib.HTTPException, socket.error):
+                pass
+            finally:
+                self.release(connection, response)
+
+        return None
+
+    def map(self, function, items, concurrency=Concurrency):
+        '''
+        Returns a dict of item: function(item), running up to concurrency of them at once.
+        '''
+        results = {}
+        todo = Queue.Queue()
+        for item in items:
+            todo.put(item)
+
+        def work():
+            while True:
+                try:
+                    item = todo.get_nowait()
+                except Queue.Empty:
+                    return
+                results[item] = function(item)
+
+        workers = [threading.Thread(target=work) for i in range(max(1, min(concurrency, len(items))))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            # A timeout on join keeps Ctrl-C working
+            while worker.is_alive():
+                worker.join(1)
+
+        return results
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                return
+
+class APIError(Exception):
+    '''
+    An API call answered with errors (the list of error messages)
+    '''
+    def throttled(self):
+        # Namecheap reports exceeding the rate limits as an API error
+        return any("too many requests" in (error or "").lower() for error in self.args[0])
+
+def elements(response, tags):
+    '''
+    Parses an API response as it arrives, yielding (tag, element) for each element with one of the
+    given tags (sans namespace) as soon as it's complete. Raises APIError if the response is an
+    error (the errors come first in a response).
+    '''
+    status = None
+    errors = []
+    for (event, element) in ET.iterparse(response, events=("start", "end")):
+        if event == "start":
+            if status is None:
+                status = element.attrib.get("Status")
+            continue
+
+        tag = element.tag[len(XMLprefix):] if element.tag.startswith(XMLprefix) else element.tag
+        if tag == "Error":
+            errors.append(element.text)
+        elif tag == "Errors" and status != "OK":
+            raise APIError(errors)
+        elif tag in tags:
+            yield (tag, element)
+            element.clear()  # Done with it, so don't keep it
+
+def getDomainPage(response):
+    # The domain names on a page of getList results and the total number of domains
     Names = []
-    URL = APIURL + APIglobals() + "&Command=namecheap.domains.getList"
-    response = urllib.urlopen(URL).read()
-    ApiResponse = ET.fromstring(response)
-    if ApiResponse.attrib["Status"] == "OK":
-        CommandResponse = ApiResponse.find(XMLprefix+"CommandResponse")
-        DomainGetListResult = CommandResponse.find(XMLprefix+"DomainGetListResult")
-        Domains = DomainGetListResult.findall(XMLprefix+"Domain")
-        
-        for Domain in Domains:
-            Name = Domain.attrib["Name"]
-            Names += [Name]
-            
-        return Names
-    elif ApiResponse.attrib["Status"] == "ERROR":
-        Errors = ApiResponse.find(XMLprefix+"Errors")
+    Total = None
+    for (tag, element) in elements(response, ("Domain", "TotalItems")):
+        if tag == "Domain":
+            Names += [element.attrib["Name"]]
+        else:
+            Total = int(element.text)
+    return (Names, Total)
+
+def getDomains():
+    if fresh(cache["getList"]):
+        return cache["getList"]["domains"]
+
+    def page(number):
+        return client.call("namecheap.domains.getList", getDomainPage, Page=number, PageSize=PageSize)
+
+    try:
+        # The first page tells us how many more there are, which we can then fetch in parallel
+        first = page(1)
+        if first is None:
+            return None
+        (Names, Total) = first
+
+        last = ((Total or 0) + PageSize - 1) // PageSize
+        pages = client.map(page, range(2, last + 1), args.Concurrency)
+        for number in sorted(pages):
+            if pages[number] is None:
+                return None
+            Names += pages[number][0]
+    except APIError as e:
         print >> sys.stderr, "Errors fetching domain names:"
-        for Error in Errors.findall(XMLprefix+"Error"):
-            print >> sys.stderr, Error.text
-        sys.exit()             
-    else:
-        return None
+        for Error in e.args[0]:
+            print >> sys.stderr, Error
+        sys.exit()
+
+    cache["getList"] = {"time": time.time(), "domains": Names}
+    return Names
 
 def getApparentIP(domain):
     try:
@@ -109,59 +381,61 @@ def getApparentIP(domain):
         return NoIP
     
 def getRegisteredIP(domain):
-    global ClientIP
-    if ClientIP == NoIP:
-        ClientIP = getApparentIP(domain)
-        
+    if fresh(cache["getHosts"].get(domain)):
+        return cache["getHosts"][domain]["IP"]
+
+    IP = getHostsIP(domain)
+    if isinstance(IP, tuple):
+        cache["getHosts"][domain] = {"time": time.time(), "IP": IP[0]}
+        return IP[0]
+    return IP
+
+def getDDNSHost(response):
+    # The IP of the first DDNS enabled A record, reading no further than we need to
+    for (tag, host) in elements(response, ("host",)):
+        if host.attrib["Type"] == "A" and host.attrib["IsDDNSEnabled"] == "true":
+            return (host.attrib["Address"],)
+    return (None,)
+
+def getHostsIP(domain):
+    # Returns the DDNS IP from the domain's host records as a 1-tuple (so that None, for no DDNS
+    # host, can be cached), else an error message (or None) that isn't cached.
     parts = domain.split('.')
     TLD = parts[-1]
     SLD = parts[-2]
-    URL = APIURL + APIglobals() + "&Command=namecheap.domains.dns.getHosts&SLD={}&TLD={}".format(SLD, TLD)
-    response = urllib.urlopen(URL).read()
-    ApiResponse = ET.fromstring(response)
-    
-    if ApiResponse.attrib["Status"] == "OK":
-        CommandResponse = ApiResponse.find(XMLprefix+"CommandResponse")
-        DomainDNSGetHostsResult = CommandResponse.find(XMLprefix+"DomainDNSGetHostsResult")
-        hosts = DomainDNSGetHostsResult.findall(XMLprefix+"host")
-        
-        for host in hosts:
-            Type = host.attrib["Type"]
-            Name = host.attrib["Name"]
-            Address = host.attrib["Address"]
-            IsDDNSEnabled = host.attrib["IsDDNSEnabled"]
-            if Type == "A" and IsDDNSEnabled == "true":
-                return Address
-    elif ApiResponse.attrib["Status"] == "ERROR":
-        try:
-            Errors = ApiResponse.find(XMLprefix+"Errors")
-            lstErrorTxt = []
-            for Error in Errors.findall(XMLprefix+"Error"):
-                lstErrorTxt += [Error.text]
-            return ", ".join(lstErrorTxt)
-        except:
-            print >> sys.stderr, "Unable to parse Error response:\n" + response
-            return None
-    else:
-        return None
+    try:
+        return client.call("namecheap.domains.dns.getHosts", getDDNSHost, SLD=SLD, TLD=TLD)
+    except APIError as e:
+        return ", ".join(Error or "" for Error in e.args[0])
+
+client = APIClient(args.API, ((args.Rate, 60),) + RateLimits[1:])
 
 results = {}
 maxlen = 0
 if args.DomainName:
+    if ClientIP == NoIP:
+        ClientIP = getApparentIP(args.DomainName).strip()
     results[args.DomainName] = getRegisteredIP(args.DomainName)
     maxlen = len(args.DomainName)
 else:
     Domains = getDomains()
     
     if isinstance(Domains, list):
+        if ClientIP == NoIP and Domains:
+            ClientIP = getApparentIP(Domains[0]).strip()
+
+        # Fetch them all in parallel
+        results = client.map(getRegisteredIP, Domains, args.Concurrency)
         for Domain in Domains:
-            results[Domain] = getRegisteredIP(Domain)
             if len(Domain) > maxlen: 
                 maxlen = len(Domain)
     else:
         print >> sys.stderr, "No domains registered"
         sys.exit()
 
+client.close()
+saveCache(cache)
+
 if args.json:
     print json.dumps(results)
 else:
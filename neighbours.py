@@ -0,0 +1,219 @@
+#
+# The neighbour tables of the router, IPv4 (ARP) and IPv6 (NDP), and a store holding both indexed
+# on MAC (so that all the IPs a device has, in either family, can be found at once). A neighbour is
+# an IP on a device (interface), as IPv6 link-local addresses (like fe80::1) repeat across them.
+#
+# The IPv4 table is read from /proc/net/arp and the IPv6 table (which has no such file) is asked of
+# the kernel directly over netlink, as are the events that report changes to either table. Nothing
+# is forked.
+#
+# Each neighbour carries its flags and HW type as hex strings, as /proc/net/arp has them (for IPv6
+# neighbours they're derived from the neighbour state and the interface as the kernel does for
+# /proc/net/arp), and a sort key (the address family then the packed address from inet_pton) so
+# that addresses of both families sort together, numerically.
+#
+# Not a script in its own right, it is imported by the scripts that need it, so it must be installed
+# alongside them (with its .py extension intact).
+
+import os
+import socket
+import struct
+from collections import namedtuple, OrderedDict
+
+ARP = "/proc/net/arp"
+NO_MAC = "00:00:00:00:00:00"
+
+# From linux/netlink.h, linux/rtnetlink.h and linux/neighbour.h
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_NEWNEIGH = 28
+RTM_DELNEIGH = 29
+RTM_GETNEIGH = 30
+RTMGRP_NEIGH = 0x4
+NDA_DST = 1
+NDA_LLADDR = 2
+NUD_INCOMPLETE = 0x01
+NUD_FAILED = 0x20
+NUD_NOARP = 0x40
+NUD_PERMANENT = 0x80
+
+NLMSGHDR = struct.Struct("=IHHII")  # length, type, flags, sequence, PID
+NDMSG = struct.Struct("=BBHiHBB")  # family, pad, pad, interface index, state, flags, type
+RTATTR = struct.Struct("=HH")  # length, type
+
+Neighbour = namedtuple("Neighbour", ["family", "IP", "MAC", "device", "HWtype", "flags", "key"])
+
+def neighbour(family, IP, MAC, device, HWtype, flags):
+	'''
+	Returns a Neighbour, with its sort key (IPv4 before IPv6, then numerically by address).
+	'''
+	return Neighbour(family, IP, MAC, device, HWtype, flags, (family == socket.AF_INET6, socket.inet_pton(family, IP)))
+
+def resolved(neighbour):
+	'''
+	True if the neighbour's MAC is known (it's not still being, or failed to be, resolved)
+	'''
+	return neighbour.flags != "0x0" and neighbour.MAC != NO_MAC
+
+class Interfaces(dict):
+	'''
+	A table of interface indexes to (name, HW type), from /sys/class/net, reread when an index is
+	missing (as when an interface came up since it was last read).
+	'''
+	def __missing__(self, index):
+		for name in os.listdir("/sys/class/net"):
+			try:
+				with open("/sys/class/net/%s/ifindex" % name) as f:
+					ifindex = int(f.read())
+				with open("/sys/class/net/%s/type" % name) as f:
+					self[ifindex] = (name, "0x%x" % int(f.read()))
+			except (IOError, ValueError):
+				pass
+		return self.get(index, ("?", "0x0"))
+
+def read_arp(path=ARP):
+	'''
+	Returns a list of the IPv4 neighbours in /proc/net/arp (or the given file in that format)
+	'''
+	with open(path) as arp:
+		lines = arp.read().splitlines()[1:]  # Skipping the header line
+
+	neighbours = []
+	for line in lines:
+		# IP address, HW type, Flags, HW address, Mask, Device
+		fields = line.split()
+		neighbours.append(neighbour(socket.AF_INET, fields[0], fields[3].upper(), fields[5], fields[1], fields[2]))
+	return neighbours
+
+def parse(data, interfaces):
+	'''
+	Parses netlink neighbour messages in data, yielding (kind, Neighbour) for each, kind being
+	RTM_NEWNEIGH or RTM_DELNEIGH. Yields (NLMSG_DONE, None) at the end of a dump.
+	'''
+	offset = 0
+	while offset + NLMSGHDR.size <= len(data):
+		(length, kind, nl_flags, sequence, PID) = NLMSGHDR.unpack_from(data, offset)
+		if length < NLMSGHDR.size:
+			break
+
+		if kind in (NLMSG_DONE, NLMSG_ERROR):
+			yield (NLMSG_DONE, None)
+		elif kind in (RTM_NEWNEIGH, RTM_DELNEIGH):
+			(family, pad1, pad2, ifindex, state, nd_flags, nd_type) = NDMSG.unpack_from(data, offset + NLMSGHDR.size)
+			# Entries that need no resolution (multicast addresses and the like) aren't neighbours
+			# (ip neigh doesn't list them either)
+			if family in (socket.AF_INET, socket.AF_INET6) and not state & NUD_NOARP:
+				attributes = {}
+				position = offset + NLMSGHDR.size + NDMSG.size
+				while position + RTATTR.size <= offset + length:
+					(rta_length, rta_type) = RTATTR.unpack_from(data, position)
+					if rta_length < RTATTR.size:
+						break
+					attributes[rta_type] = data[position + RTATTR.size:position + rta_length]
+					position += (rta_length + 3) & ~3
+
+				if NDA_DST in attributes:
+					IP = socket.inet_ntop(family, attributes[NDA_DST])
+					lladdr = attributes.get(NDA_LLADDR, "")
+					MAC = ":".join("%02X" % ord(byte) for byte in lladdr) if lladdr else NO_MAC
+					# As the kernel reports them in /proc/net/arp
+					flags = 0 if state & (NUD_INCOMPLETE | NUD_FAILED) or not state else 0x2
+					if state & NUD_PERMANENT:
+						flags |= 0x4
+					(device, HWtype) = interfaces[ifindex]
+					yield (kind, neighbour(family, IP, MAC, device, HWtype, "0x%x" % flags))
+
+		offset += (length + 3) & ~3
+
+def open_socket(family=socket.AF_UNSPEC, watch=False):
+	'''
+	Returns a netlink socket that a dump of the neighbour table of the given family (or both) has
+	been asked of, and if watch is True, that is subscribed to neighbour events (before the dump is
+	asked for, so that none are missed between the two).
+	'''
+	sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, 0)  # NETLINK_ROUTE
+	sock.bind((0, RTMGRP_NEIGH if watch else 0))
+	request = NDMSG.pack(family, 0, 0, 0, 0, 0, 0)
+	sock.send(NLMSGHDR.pack(NLMSGHDR.size + len(request), RTM_GETNEIGH, NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + request)
+	return sock
+
+def dump(family, interfaces=None):
+	'''
+	Returns a list of the neighbours of the given family (or both) asked of the kernel
+	'''
+	if interfaces is None:
+		interfaces = Interfaces()
+
+	neighbours = []
+	sock = open_socket(family)
+	try:
+		done = False
+		while not done:
+			for (kind, neighbour) in parse(sock.recv(65536), interfaces):
+				if kind == NLMSG_DONE:
+					done = True
+				elif kind == RTM_NEWNEIGH:
+					neighbours.append(neighbour)
+	finally:
+		sock.close()
+	return neighbours
+
+class Store(object):
+	'''
+	The neighbours of both families, by device and IP (in the order added) and indexed by MAC.
+	'''
+	def __init__(self, neighbours=[]):
+		self.neighbours = OrderedDict()  # (device, IP): Neighbour
+		self.MACs = {}  # MAC: set of (device, IP)
+		for neighbour in neighbours:
+			self.add(neighbour)
+
+	@staticmethod
+	def key(neighbour):
+		'''
+		The key of a neighbour in the store, (device, IP)
+		'''
+		return (neighbour.device, neighbour.IP)
+
+	def __len__(self):
+		return len(self.neighbours)
+
+	def __contains__(self, key):
+		return key in self.neighbours
+
+	def __getitem__(self, key):
+		return self.neighbours[key]
+
+	def __iter__(self):
+		return self.neighbours.itervalues()
+
+	def add(self, neighbour):
+		'''
+		Adds (or updates) a neighbour, returning the one it replaced (the one with the same device
+		and IP, or None)
+		'''
+		key = self.key(neighbour)
+		previous = self.remove(key)
+		self.neighbours[key] = neighbour
+		if neighbour.MAC != NO_MAC:
+			self.MACs.setdefault(neighbour.MAC, set()).add(key)
+		return previous
+
+	def remove(self, key):
+		'''
+		Removes a neighbour by key (device, IP), returning it (or None if there was none)
+		'''
+		neighbour = self.neighbours.pop(key, None)
+		if not neighbour is None and neighbour.MAC in self.MACs:
+			self.MACs[neighbour.MAC].discard(key)
+			if not self.MACs[neighbour.MAC]:
+				del self.MACs[neighbour.MAC]
+		return neighbour
+
+	def IPs(self, MAC):
+		'''
+		Returns the IPs (of both families, on any device) that a MAC has, as a set
+		'''
+		return set(IP for (device, IP) in self.MACs.get(MAC, ()))
@@ -3,20 +3,38 @@
 # Accepts a MAC or IP address as an argument and tries to find a name that is mapped to that
 # MAC or IP on the current router. 
 #
-# Uses MACnames -j and IPnames -j and dig as needed: 
+# Uses lannames (served by namesd if it's running) and reverse DNS (via namecache) as needed: 
+#
+# An IP with no name of its own is named by its MAC if it's in the neighbour tables (which is how
+# IPv6 addresses, which DHCP and the configs rarely name, are mostly named).
 
 import re
-import os
 import sys
-import subprocess
 import socket
-import json
-
-devnull = open(os.devnull, 'w')
+import lannames
+import namecache
+import neighbours
 
 def isMAC(address):
 	return re.match("[0-9A-F]{2}([-:])[0-9A-F]{2}(\\1[0-9A-F]{2}){4}$", address.upper())
 
+def neighbourMAC(IP):
+	'''
+	Returns the MAC of a neighbour with the given IP (IPv4 or IPv6), or None if it's not a neighbour
+	'''
+	family = socket.AF_INET6 if ":" in IP else socket.AF_INET
+	try:
+		# inet_aton for IPv4, as isIP accepts its short forms (10.1 and the like)
+		packed = socket.inet_pton(family, IP) if family == socket.AF_INET6 else socket.inet_aton(IP)
+		table = neighbours.read_arp() if family == socket.AF_INET else neighbours.dump(family)
+	except (IOError, socket.error):
+		return None
+
+	for neighbour in table:
+		if neighbour.key[1] == packed and neighbours.resolved(neighbour):
+			return neighbour.MAC
+	return None
+
 def isIP(address):
 	try:
 		socket.inet_aton(address)
@@ -35,16 +53,23 @@ self = sys.argv[0]
 address = sys.argv[1].upper() if len(sys.argv) > 1 else None
 
 if isMAC(address):
-	names = json.loads(subprocess.check_output(["MACnames", "-j"], stderr=devnull))
-	if address in names:
-		print names[address]
+	name = lannames.lookup("MAC", address)
+	if not name is None:
+		print name
 elif isIP(address):
-	names = json.loads(subprocess.check_output(["IPnames", "-j"], stderr=devnull))
-	if address in names:
-		print names[address]
-	else:
-		name = subprocess.check_output(["dig", "+short", "-x", address], stderr=devnull).replace(".\n","\n").strip()
+	name = lannames.lookup("IP", address)
+	if name is None:
+		MAC = neighbourMAC(address)
+		if not MAC is None:
+			name = lannames.lookup("MAC", MAC)
+
+	if not name is None:
 		print name
+	else:
+		cache = namecache.NameCache()
+		name = namecache.reverse_names(cache, [address])[address]
+		cache.close()
+		print "" if name == "unknown" else name
 else:
 	print "Must specify a MAC or IP address"
 	sys.exit(1)
\ No newline at end of file
@@ -1,66 +1,177 @@
 #!/usr/bin/python
 #
 # Prints /proc/net/arp, prepended with a column naming the device if possible,
-# Uses MACnames -j and IPnames -j to build reference tables for names
+# Uses lannames to build reference tables for names (in process, from one read of the configs)
 #
 # This was an effort to reproduce LuCI's Routes page with a CLI command.
 # It's not quite the same though. /proc/net/arp has some entries LuCI doesn't display.
 # And the whole point of the exercise was to display names in the list which LuCI does not (at present)
+#
+# Both neighbour tables are reported, IPv4 (the ARP cache) and IPv6 (the NDP cache, which the kernel
+# reports in the same form) unless -4 or -6 asks for one only. They're held in one store (from
+# neighbours) indexed by MAC, so that a device's IPv6 addresses can be named by its IPv4 address when
+# its MAC has no name, and so sorting and the summary span both.
+#
+# With --watch it keeps running, holding the tables in memory and updating them from the kernel's
+# neighbour events (over netlink) rather than re-reading them, and prints an event for each change:
+#
+#	add			an IP appeared in the table (the entries present when watching starts are reported as adds)
+#	remove		an IP left the table (or its entry failed, the device no longer answering)
+#	changed		an IP moved to a different MAC on the same device (which is also what ARP spoofing looks like)
+#
+# Entries that are still being resolved (no MAC yet) are not reported until they are.
 
-import argparse, os, sys, json, fileinput, subprocess, socket
+import argparse, sys, json, socket, time
+import lannames
+import neighbours
 
-def decodeFlags(hexstr):
+# The ARP flags, from https://github.com/openwrt/linux/blob/master/include/uapi/linux/if_arp.h#L127
+ARP_FLAGS = [(0x2, "complete"), (0x4, "permanent"), (0x8, "publish"), (0x10, "has trailers"), (0x20, "use netmask"), (0x40, "don't publish")]
+
+# The ARP hardware types, from https://github.com/wireshark/wireshark/blob/master/epan/dissectors/packet-arp.c
+HW_TYPES = ["NET/ROM",
+			"Ethernet",
+			"Experimental ethernet",
+			"AX.25",
+			"ProNET",
+			"Chaos",
+			"IEEE 802",
+			"ARCNET",
+			"Hyperchannel",
+			"Lanstar",
+			"Autonet",
+			"Localtalk",
+			"LocalNet",
+			"Ultra link",
+			"SMDS",
+			"Frame Relay",
+			"ATM",
+			"HDLC",
+			"Fibre Channel",
+			"ATM (RFC 2225)",
+			"Serial Line",
+			"ATM",
+			"MIL-STD-188-220",
+			"Metricom STRIP",
+			"IEEE 1394.1995",
+			"MAPOS",
+			"Twinaxial",
+			"EUI-64" ]
+
+class DecodeTable(dict):
 	'''
-	decodes a hex string (e.g. most typically "0x2") into an ARP flags descriptor using clues found here: 
-		https://github.com/openwrt/linux/blob/master/include/uapi/linux/if_arp.h#L127
+	A table of hex strings (as found in /proc/net/arp) to their descriptions. Only a handful of
+	distinct values turn up in an ARP table, so each is decoded once, when first seen.
 	'''
-	hexint = int(hexstr, 16)
-	bitmap = {0x2: "complete", 0x4: "permanent", 0x8: "publish", 0x10: "has trailers", 0x20: "use netmask", 0x40: "don't publish"}
-	flags = []
-	for bit in bitmap:
-		if hexint & bit:
-			flags += [bitmap[bit]]
-			
-	if len(flags) == 0:
-		return "incomplete"
-	else:
-		return ", ".join(flags)
+	def __init__(self, decode):
+		self.decode = decode
 
-def decodeHWtype(hexstr):
+	def __missing__(self, hexstr):
+		self[hexstr] = description = self.decode(int(hexstr, 16))
+		return description
+
+def decodeFlags(hexint):
+	'''
+	decodes ARP flags (e.g. most typically 0x2) into an ARP flags descriptor
+	'''
+	flags = [name for (bit, name) in ARP_FLAGS if hexint & bit]
+	return ", ".join(flags) if flags else "incomplete"
+
+def decodeHWtype(hexint):
 	'''
-	decodes a hex string (e.g. most typically "0x1") into a ARP HW descriptor using clues found here: 
-		https://github.com/wireshark/wireshark/blob/master/epan/dissectors/packet-arp.c
+	decodes an ARP HW type (e.g. most typically 0x1) into a ARP HW descriptor
 	'''
-	hexint = int(hexstr, 16)
-	hwmap = ["NET/ROM", 
-			 "Ethernet", 
-			 "Experimental ethernet", 
-			 "AX.25", 
-			 "ProNET", 
-			 "Chaos", 
-			 "IEEE 802", 
-			 "ARCNET", 
-			 "Hyperchannel",
-			 "Lanstar",
-			 "Autonet",
-			 "Localtalk",
-			 "LocalNet",
-			 "Ultra link",
-			 "SMDS",
-			 "Frame Relay",
-			 "ATM",
-			 "HDLC",
-			 "Fibre Channel",
-			 "ATM (RFC 2225)",
-			 "Serial Line",
-			 "ATM",
-			 "MIL-STD-188-220",
-			 "Metricom STRIP",
-			 "IEEE 1394.1995",
-			 "MAPOS",
-			 "Twinaxial",
-			 "EUI-64" ]
-	return hwmap[hexint]
+	return HW_TYPES[hexint] if hexint < len(HW_TYPES) else "0x%x" % hexint
+
+Flags_decoded = DecodeTable(decodeFlags)
+HWtypes_decoded = DecodeTable(decodeHWtype)
+
+NAMES_CHECK = 10  # How often (seconds) to check whether the name tables need rebuilding when watching
+
+class Names(object):
+	'''
+	Names devices by MAC (or failing that IP) from the lannames tables, and when watching checks now
+	and then whether the tables' sources changed, rebuilding them only if so.
+	'''
+	def __init__(self):
+		self.signature = None
+		self.checked = None
+
+	def name(self, MAC, IP, store=None):
+		'''
+		Returns the name of the device with this MAC and IP. If neither is named and there's a store
+		of neighbours, tries the other IPs (of either family) the device has.
+		'''
+		if self.checked is None or time.time() - self.checked > NAMES_CHECK:
+			self.checked = time.time()
+			signature = lannames.sources_signature()
+			if signature != self.signature:
+				self.signature = signature
+				tables = lannames.tables()
+				self.MACnames = tables["MAC"]
+				self.IPnames = tables["IP"]
+
+		if MAC in self.MACnames:
+			return self.MACnames[MAC]
+		elif IP in self.IPnames:
+			return self.IPnames[IP]
+
+		if not store is None:
+			for other_IP in store.IPs(MAC):
+				if other_IP in self.IPnames:
+					return self.IPnames[other_IP]
+
+		return "<unknown>"
+
+def watch(FMT):
+	'''
+	Prints an event (add, remove or changed) for each change in the neighbour tables until interrupted.
+	'''
+	names = Names()
+	interfaces = neighbours.Interfaces()
+	store = neighbours.Store()
+
+	def emit(event, neighbour, old_MAC=""):
+		name = names.name(neighbour.MAC, neighbour.IP, store)
+		HWtype = HWtypes_decoded[neighbour.HWtype]
+		Flags = Flags_decoded[neighbour.flags]
+		if args.json:
+			fields = {"event": event, "time": time.time(), "name": name, "IP": neighbour.IP, "MAC": neighbour.MAC, "HWtype": HWtype, "Device": neighbour.device, "Flags": Flags}
+			if old_MAC:
+				fields["old_MAC"] = old_MAC
+			print json.dumps(fields, sort_keys=True)
+		else:
+			vals = [event, name, neighbour.IP, neighbour.MAC]
+			if args.HWtype:
+				vals += [HWtype]
+			if args.Device:
+				vals += [neighbour.device]
+			if args.Flags:
+				vals += [Flags]
+			print FMT % tuple(vals + [old_MAC])
+		sys.stdout.flush()
+
+	sock = neighbours.open_socket(family, watch=True)
+	try:
+		while True:
+			for (kind, neighbour) in neighbours.parse(sock.recv(65536), interfaces):
+				if kind == neighbours.NLMSG_DONE or not neighbour.family in families:
+					continue
+
+				if kind == neighbours.RTM_DELNEIGH or not neighbours.resolved(neighbour):
+					if store.key(neighbour) in store:
+						previous = store.remove(store.key(neighbour))
+						emit("remove", neighbour._replace(MAC=previous.MAC))
+				else:
+					previous = store.add(neighbour)
+					if previous is None:
+						emit("add", neighbour)
+					elif previous.MAC != neighbour.MAC:
+						emit("changed", neighbour, previous.MAC)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		sock.close()
 
 # Parse arguments
 
@@ -79,7 +190,7 @@ class OrderArgs(argparse.Action):
 			setattr(namespace, self.dest, len(order))
 
 parser = argparse.ArgumentParser(description='Report "routes" in the same sense as the LuCI page of that name.\nThis is basically a presentation of the routers ARP cache.',
-                                 epilog = "Augments the ARP cache with device names.\nThese are provided by MACnames and IPnames which must be installed as well.",
+                                 epilog = "Augments the ARP cache with device names.\nThese are provided by lannames which must be installed as well.",
                                  formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=20))
 
 parser.add_argument('-t', '--HWtype', action='store_true', help='Include the hardware type in the output.')
@@ -97,6 +208,10 @@ corj = parser.add_mutually_exclusive_group()
 corj.add_argument('-c', '--csv', action='store_true', help='Print output in CSV format')
 corj.add_argument('-j', '--json', action='store_true', help='Print output in JSON format')
 parser.add_argument('-H', '--Header', action='store_true', help='Print header line')
+parser.add_argument('-4', '--IPv4', action='store_const', dest='Family', const=4, help='Report IPv4 neighbours (the ARP cache) only.')
+parser.add_argument('-6', '--IPv6', action='store_const', dest='Family', const=6, help='Report IPv6 neighbours (the NDP cache) only.')
+parser.add_argument('-A', '--ARP', default=neighbours.ARP, help='The ARP table to read (default: %(default)s)')
+parser.add_argument('-w', '--watch', action='store_true', help='Keep watching the neighbour tables, printing an event (add, remove or changed) for each change.')
 
 args = parser.parse_args()
 
@@ -108,12 +223,23 @@ if hasattr(args, 'order'):
 if args.FlagSort:
 	args.Flags = True
 
-ARP = "/proc/net/arp"
+family = {4: socket.AF_INET, 6: socket.AF_INET6}.get(args.Family, socket.AF_UNSPEC)
+families = (socket.AF_INET, socket.AF_INET6) if family == socket.AF_UNSPEC else (family,)
+
+names = Names()
 
-devnull = open(os.devnull, 'w')
+# The neighbours we're reporting (unless watching, when they're read as events)
+store = neighbours.Store()
+if not args.watch:
+	if socket.AF_INET in families:
+		for neighbour in neighbours.read_arp(args.ARP):
+			store.add(neighbour)
+	if socket.AF_INET6 in families:
+		for neighbour in neighbours.dump(socket.AF_INET6):
+			store.add(neighbour)
 
-MACnames = json.loads(subprocess.check_output(["MACnames", "-j"], stderr=devnull))
-IPnames = json.loads(subprocess.check_output(["IPnames", "-j"], stderr=devnull))
+# IPv6 addresses are rather wider than IPv4 addresses
+IPwidth = max([17] + [len(neighbour.IP) + 2 for neighbour in store]) if not args.watch else (17 if family == socket.AF_INET else 41)
 
 result = {}
 
@@ -131,7 +257,7 @@ if not args.json:
 		if args.Flags:
 			FMT += ", %s"
 	else:
-		FMT = "%-25s %-17s %-22s"
+		FMT = "%-25s %-" + str(IPwidth) + "s %-22s"
 		if args.HWtype:
 			FMT += " %-12s"
 		if args.Device:
@@ -139,73 +265,72 @@ if not args.json:
 		if args.Flags:
 			FMT += "  %-s"
 
-for line in fileinput.input(ARP):
-	if fileinput.isfirstline():
-		if not args.json:
-			vals = ["HW name", "IP address", "HW address (MAC)"]
-			if args.HWtype:
-				vals += ["HW type"]
-			if args.Device:
-				vals += ["Device"]
-			if args.Flags:
-				vals += ["Flags"]
+	vals = ["HW name", "IP address", "HW address (MAC)"]
+	if args.HWtype:
+		vals += ["HW type"]
+	if args.Device:
+		vals += ["Device"]
+	if args.Flags:
+		vals += ["Flags"]
 
-			header = FMT % tuple(vals)
-	else:
-		fields = line.split()
-		
-		# The ARP Cache has these fields. LUCI only lists some IP, MAC and Device which it call sInterface
-		IP = fields[0]
-		HWtype = decodeHWtype(fields[1])
-		Flags = decodeFlags(fields[2])
-		MAC = fields[3].upper()
-		Mask = fields[4]
-		Device = fields[5]
-		
-		MACtest = MAC.strip(":0") 
-		if len(MACtest) == 0:
-			count_missing_MAC += 1
-
-		if MAC in MACnames:
-			name = MACnames[MAC]
-		elif IP in IPnames:
-			name = IPnames[IP]
+	header = FMT % tuple(vals)
+
+if args.watch:
+	if not args.json:
+		FMT = ("%s, " if args.csv else "%-8s ") + FMT + (", %s" if args.csv else "  %s")
+		if args.Header:
+			print FMT % tuple(["Event"] + vals + ["Previous MAC"])
+	watch(None if args.json else FMT)
+	sys.exit()
+
+for (order, neighbour) in enumerate(store):
+	# The ARP Cache has these fields. LUCI only lists some IP, MAC and Device which it call sInterface
+	IP = neighbour.IP
+	HWtype = HWtypes_decoded[neighbour.HWtype]
+	Flags = Flags_decoded[neighbour.flags]
+	MAC = neighbour.MAC
+	Device = neighbour.device
+
+	MACtest = MAC.strip(":0") 
+	if len(MACtest) == 0:
+		count_missing_MAC += 1
+
+	name = names.name(MAC, IP, store)
+	if name == "<unknown>":
+		count_missing_name += 1
+	
+	FlagList = Flags.split(", ")
+	for Flag in FlagList:
+		if Flag in count_flags:
+			count_flags[Flag] += 1
 		else:
-			name = "<unknown>"
-			count_missing_name += 1
-		
-		FlagList = Flags.split(", ")
-		for Flag in FlagList:
-			if Flag in count_flags:
-				count_flags[Flag] += 1
-			else:
-				count_flags[Flag] = 1			
-					
-		keys = []
-		for key in sortkeys:
-			if key == "IPsort":
-				keys += [socket.inet_aton(IP)]
-			elif key == "MACsort":
-				keys += [MAC]
-			elif key == "NameSort":
-				keys += [name]
-			elif key == "FlagSort":
-				keys += [Flags]
-			
-		keys += [fileinput.filelineno()]
-		
-		vals = [name, IP, MAC]
-		if args.HWtype:
-			vals += [HWtype]
-		if args.Device:
-			vals += [Device]
-		if args.Flags:
-			vals += [Flags]
+			count_flags[Flag] = 1			
+				
+	keys = []
+	for key in sortkeys:
+		if key == "IPsort":
+			keys += [neighbour.key]
+		elif key == "MACsort":
+			keys += [MAC]
+		elif key == "NameSort":
+			keys += [name]
+		elif key == "FlagSort":
+			keys += [Flags]
 		
-		if args.json:
-			result[tuple(keys)] = tuple(vals)
-		else:
-			result[tuple(keys)] = FMT % tuple(vals)
+	keys += [order]
+	
+	vals = [name, IP, MAC]
+	if args.HWtype:
+		vals += [HWtype]
+	if args.Device:
+		vals += [Device]
+	if args.Flags:
+		vals += [Flags]
+	
+	if args.json:
+		result[tuple(keys)] = tuple(vals)
+	else:
+		result[tuple(keys)] = FMT % tuple(vals)
 
 output = []	
 if args.Header and not args.json:
@@ -228,6 +353,9 @@ else:
 
 if args.Summary and not args.json:
 	print "%d total routes." % count
+	if len(families) > 1:
+		IPv6_count = sum(1 for neighbour in store if neighbour.family == socket.AF_INET6)
+		print "%d IPv4 and %d IPv6." % (count - IPv6_count, IPv6_count)
 	if count_missing_name > 0: 
 		print "%d with no identifiable name." % count_missing_name
 	if count_missing_MAC > 0: 
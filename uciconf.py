@@ -0,0 +1,117 @@
+#
+# A snapshot loader for uci configurations.
+#
+# Reading a config with one "uci get" per option forks a process for every value we want, and
+# walking dhcp.@host[i] that way costs three forks per host. On a router with a few hundred static
+# leases that's thousands of processes and seconds of CPU on a modest ARM core.
+#
+# This reads a whole config with a single "uci show" and holds it in memory, so that scripts can
+# look up sections and options as often as they like for free.
+#
+# Not a script in its own right, it is imported by the scripts that need it, so it must be installed
+# alongside them (with its .py extension intact).
+
+import os
+import subprocess
+import shlex
+from collections import OrderedDict
+
+devnull = open(os.devnull, 'w')
+
+def unquote(value):
+	'''
+	Converts a value as printed by "uci show" into a string, or a list of strings for uci lists.
+
+	Recent versions of uci quote values ('value' or 'one' 'two' for lists, with embedded quotes
+	escaped as '\'') older versions print them raw.
+	'''
+	if not value.startswith("'"):
+		return value
+
+	try:
+		values = shlex.split(value)
+	except ValueError:
+		return value.strip("'")
+
+	if len(values) == 1:
+		return values[0]
+	else:
+		return values
+
+def parse(lines, config=None):
+	'''
+	Parses the output of "uci show" into an ordered dict of sections keyed on section name.
+
+	Each section is a dict of its options with a few extra keys (named as uci names them in its own
+	JSON output):
+		.name  - the section name ("@type[i]" for anonymous sections)
+		.type  - the section type
+		.index - the position of the section amongst sections of the same type (so @type[.index] addresses it)
+
+	If config is specified only lines for that config are parsed.
+	'''
+	sections = OrderedDict()
+	counts = {}
+
+	for line in lines:
+		line = line.rstrip("\n")
+		if not "=" in line:
+			continue
+
+		key, value = line.split("=", 1)
+		parts = key.split(".", 2)
+
+		if len(parts) < 2 or (config and parts[0] != config):
+			continue
+
+		name = parts[1]
+
+		if len(parts) == 2:
+			# A section declaration: config.section=type
+			stype = unquote(value)
+			index = counts.get(stype, 0)
+			counts[stype] = index + 1
+			sections[name] = {".name": name, ".type": stype, ".index": index}
+		elif name in sections:
+			sections[name][parts[2]] = unquote(value)
+
+	return sections
+
+def show(config):
+	'''
+	Returns a snapshot of a uci config (as described for parse()) using one "uci show" call.
+
+	Returns an empty dict if the config does not exist or uci is not available.
+	'''
+	try:
+		output = subprocess.check_output(["uci", "-q", "show", config], stderr=devnull)
+	except (OSError, subprocess.CalledProcessError):
+		return OrderedDict()
+
+	return parse(output.splitlines(), config)
+
+def sections(snapshot, stype):
+	'''
+	Returns a list of the sections of a given type in a snapshot, in uci order (so that the
+	list index matches the uci @type[index] syntax).
+	'''
+	return [section for section in snapshot.itervalues() if section[".type"] == stype]
+
+def option(section, name, default=None):
+	'''
+	Returns an option from a section as a string, with lists joined by spaces as "uci get" would do it.
+	'''
+	value = section.get(name, default)
+	if isinstance(value, list):
+		value = " ".join(value)
+	return value
+
+def values(section, name):
+	'''
+	Returns an option from a section as a list of strings (empty if the option is not set). Lists
+	are returned as is, and unquoted options (older uci) are split on white space.
+	'''
+	value = section.get(name, [])
+	if not isinstance(value, list):
+		value = value.split()
+	return value
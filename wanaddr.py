@@ -0,0 +1,153 @@
+#!/usr/bin/python
+#
+# Prints the WAN addresses of this OpenWRT router, asking the kernel directly (over netlink) rather
+# than parsing the output of ip addr. Optionally (-w) waits for them to be assigned, reporting them
+# the instant they are, which is what the hotplug path (log_wanip.sh) wants on an ifup when the
+# WAN interface may not have its addresses yet.
+#
+# Prints the IPv4 address on one line and the IPv6 address on the next (an empty line for either
+# family if the interface has no such address), or just one of them with -4 or -6.
+#
+# Only global addresses are reported (so not the IPv6 link-local address the WAN interface has).
+# On a point to point link (like PPPoE) the local address is reported, not the peer's.
+
+import os, sys, argparse, socket, struct, select, time
+
+WAN_INTERFACE = "pppoe-wan"
+
+# From linux/netlink.h and linux/rtnetlink.h
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+RT_SCOPE_UNIVERSE = 0
+
+NLMSGHDR = struct.Struct("=IHHII")  # length, type, flags, sequence, PID
+IFADDRMSG = struct.Struct("=BBBBI")  # family, prefix length, flags, scope, interface index
+RTATTR = struct.Struct("=HH")  # length, type
+
+FAMILIES = {4: socket.AF_INET, 6: socket.AF_INET6}
+
+parser = argparse.ArgumentParser(description='Print the WAN addresses of this router (waiting for them to be assigned with -w).',
+                                 formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=25))
+
+parser.add_argument('-4', '--IPv4', action='store_const', dest='Family', const=4, help='Print the IPv4 address only')
+parser.add_argument('-6', '--IPv6', action='store_const', dest='Family', const=6, help='Print the IPv6 address only')
+parser.add_argument('-i', '--Interface', default=WAN_INTERFACE, help='The WAN interface (default: %(default)s)')
+parser.add_argument('-w', '--Wait', action='store_true', help='Wait for the addresses to be assigned if they are not yet')
+parser.add_argument('-t', '--Timeout', type=float, default=1800, help='With -w, give up waiting after this many seconds (default: %(default)s)')
+
+args = parser.parse_args()
+
+
+def align(length):
+    return (length + 3) & ~3
+
+
+def interface_index(name):
+    # The index of the named interface, or None if it doesn't exist (yet)
+    try:
+        with open("/sys/class/net/%s/ifindex" % name) as f:
+            return int(f.read())
+    except (IOError, ValueError):
+        return None
+
+
+def addresses(data, interface):
+    '''
+    Parses netlink messages (RTM_NEWADDR) in data, yielding (family, address) for each global address
+    on the named interface. Yields (None, None) at the end of a dump.
+    '''
+    index = None
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        (length, kind, flags, sequence, PID) = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+
+        if kind in (NLMSG_DONE, NLMSG_ERROR):
+            yield (None, None)
+        elif kind == RTM_NEWADDR:
+            (family, prefix, ifa_flags, scope, ifindex) = IFADDRMSG.unpack_from(data, offset + NLMSGHDR.size)
+
+            # The interface may only just have come up so we look its index up when we need it
+            if index is None:
+                index = interface_index(interface)
+
+            if ifindex == index and scope == RT_SCOPE_UNIVERSE:
+                attributes = {}
+                position = offset + NLMSGHDR.size + IFADDRMSG.size
+                while position + RTATTR.size <= offset + length:
+                    (rta_length, rta_type) = RTATTR.unpack_from(data, position)
+                    if rta_length < RTATTR.size:
+                        break
+                    attributes[rta_type] = data[position + RTATTR.size:position + rta_length]
+                    position += align(rta_length)
+
+                address = attributes.get(IFA_LOCAL, attributes.get(IFA_ADDRESS))
+                if address:
+                    yield (family, socket.inet_ntop(family, address))
+
+        offset += align(length)
+
+
+def wan_addresses(families, interface, wait, timeout):
+    '''
+    Returns a dict of family: address for the requested families (AF_INET, AF_INET6), any that the
+    interface has no address for missing. If wait is True, waits (up to timeout seconds) for the
+    missing ones to be assigned.
+    '''
+    groups = (RTMGRP_IPV4_IFADDR if socket.AF_INET in families else 0) | (RTMGRP_IPV6_IFADDR if socket.AF_INET6 in families else 0)
+
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, 0)  # NETLINK_ROUTE
+    try:
+        # Subscribe to address events before asking for the current addresses, so none are missed
+        # between the two.
+        sock.bind((0, groups if wait else 0))
+
+        request = IFADDRMSG.pack(socket.AF_UNSPEC if len(families) > 1 else families[0], 0, 0, 0, 0)
+        sock.send(NLMSGHDR.pack(NLMSGHDR.size + len(request), RTM_GETADDR, NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + request)
+
+        found = {}
+        dumped = False
+        deadline = time.time() + timeout
+        while True:
+            if dumped and (not wait or all(family in found for family in families)):
+                break
+
+            remaining = deadline - time.time()
+            if dumped and remaining <= 0:
+                break
+            if dumped and not select.select([sock], [], [], remaining)[0]:
+                break
+
+            for (family, address) in addresses(sock.recv(65536), interface):
+                if family is None:
+                    dumped = True
+                elif family in families and not family in found:
+                    found[family] = address
+    finally:
+        sock.close()
+
+    return found
+
+
+families = [FAMILIES[args.Family]] if args.Family else [socket.AF_INET, socket.AF_INET6]
+
+try:
+    found = wan_addresses(families, args.Interface, args.Wait, args.Timeout)
+except socket.error as e:
+    print >> sys.stderr, "Cannot read the addresses of {}: {}".format(args.Interface, e)
+    sys.exit(2)
+
+for family in families:
+    print found.get(family, "")
+
+if args.Wait and not all(family in found for family in families):
+    sys.exit(1)
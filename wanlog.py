@@ -0,0 +1,254 @@
+#!/usr/bin/python
+#
+# Reports (and records) the history of WAN IP changes that log_wanip.sh keeps.
+#
+# The log is an append only store of one JSON record per line, each recording a change of the WAN
+# IPs with both families, the reason and the time (seconds since the epoch):
+#   {"time": 1700000000, "wanip4": "203.0.113.7", "wanip6": "2001:db8::7", "reason": "ifup"}
+#
+# An IP that's unknown is null. Lines in the older text form (one IP per line, IPv4 or IPv6):
+#   dd/mm/YYYY HH:MM:SS, IP, reason
+# can still be read, so logs written before the store was structured need no conversion.
+#
+# Alongside the log is an index (the log file name with .idx appended) of fixed size records, one
+# per line, each being the offset of the line in the log and its time in seconds since the epoch
+# (two little endian 32 bit unsigned ints). With it the last N changes of either family, and how
+# long each IP was held, are found by reading the log from the end, record by record, only as far
+# back as needed however long the log has grown.
+#
+# The index is kept up to date as records are appended (with -c or -a) and if lines were appended
+# without it (or the log was truncated or replaced) it's brought up to date before use. It's only
+# ever written by update_index, holding a lock on the log (the one appends are made under, here and
+# by index.php), so each line is indexed once whichever reader or writer gets to it first.
+
+import os, sys, argparse, json, struct, time, fcntl
+
+LOG_FILE = '/mnt/sda1/log/ddns/wan_ip.log'
+
+RECORD = struct.Struct("<II")  # Offset of the line in the log, its time (epoch seconds)
+BLOCK = 64  # Index records to read at a time when reading the log backwards
+
+FAMILIES = (("wanip4", "IPv4"), ("wanip6", "IPv6"))
+
+parser = argparse.ArgumentParser(description='Report the history of WAN IP changes from the WAN IP log.',
+                                 formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=20))
+
+parser.add_argument('-f', '--File', default=LOG_FILE, help='The WAN IP log (default: %(default)s).')
+parser.add_argument('-n', '--Lines', type=int, help='Report only the last N changes (of each family) (default: all of them).')
+parser.add_argument('-4', '--IPv4', action='store_const', dest='Family', const='wanip4', help='Report IPv4 changes only.')
+parser.add_argument('-6', '--IPv6', action='store_const', dest='Family', const='wanip6', help='Report IPv6 changes only.')
+parser.add_argument('-c', '--Change', nargs=3, metavar=('IPv4', 'IPv6', 'REASON'), help='Record a change of WAN IPs in the log (an IP of "unknown" or "" is recorded as unknown).')
+parser.add_argument('-a', '--Append', action='store_true', help='Append the lines on stdin to the log (and its index) instead of reporting.')
+parser.add_argument('-r', '--Reindex', action='store_true', help='Rebuild the index from the log.')
+parser.add_argument('-j', '--json', action='store_true', help='Print the changes in JSON format')
+
+args = parser.parse_args()
+
+
+def duration_formatted(seconds, suffixes=['y', 'w', 'd', 'h', 'm', 's'], separator=' '):
+    # Turns an amount of seconds into a human-readable amount of time (like wanip -h did)
+    time = []
+    parts = [(suffixes[0], 60 * 60 * 24 * 7 * 52),
+             (suffixes[1], 60 * 60 * 24 * 7),
+             (suffixes[2], 60 * 60 * 24),
+             (suffixes[3], 60 * 60),
+             (suffixes[4], 60),
+             (suffixes[5], 1)]
+
+    for suffix, length in parts:
+        value = int(seconds // length)
+        if value > 0 or length == 1:
+            time.append('%d%s' % (value, suffix))
+            seconds = seconds % length
+
+    return separator.join(time)
+
+
+def time_formatted(epoch):
+    return time.strftime("%d/%m/%Y %H:%M:%S", time.localtime(epoch))
+
+
+def parse_line(line):
+    '''
+    The record a log line holds as a dict of time, wanip4, wanip6 and reason, or None if it holds
+    none. A text line has only the family of its IP (the other is absent, not unknown).
+    '''
+    if line.startswith("{"):
+        try:
+            record = json.loads(line)
+            record["time"] = int(record["time"])
+            return record
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    # The time has a fixed layout (dd/mm/YYYY HH:MM:SS) so we can slice it, much faster than strptime.
+    try:
+        when = int(time.mktime((int(line[6:10]), int(line[3:5]), int(line[0:2]),
+                                int(line[11:13]), int(line[14:16]), int(line[17:19]), 0, 0, -1)))
+    except (ValueError, OverflowError):
+        return None
+
+    fields = [field.strip() for field in line[19:].split(",", 2)] + ["", ""]
+    return {"time": when, "wanip6" if ":" in fields[1] else "wanip4": fields[1] or None, "reason": fields[2]}
+
+
+def log_time(line):
+    # The time of a log line (seconds since the epoch), or None if it holds no record
+    record = parse_line(line)
+    return None if record is None else record["time"]
+
+
+def index_file(log_file):
+    return log_file + ".idx"
+
+
+def update_index(log_file, rebuild=False):
+    '''
+    Brings the index of log_file up to date, indexing any lines not yet indexed (or all of them if
+    the log has been truncated or replaced, or rebuild is True). Returns the number of records.
+    '''
+    path = index_file(log_file)
+    with open(log_file, "rb") as log:
+        # The index is closed (and flushed) before the log, and so before the lock is released
+        fcntl.flock(log, fcntl.LOCK_EX)
+        with open(path, "r+b" if os.path.exists(path) else "w+b") as index:
+            index.seek(0, os.SEEK_END)
+            count = index.tell() // RECORD.size
+
+            start = 0
+            if count and not rebuild:
+                # The log is indexed up to the end of the last line indexed, if it's still there
+                index.seek((count - 1) * RECORD.size)
+                (offset, when) = RECORD.unpack(index.read(RECORD.size))
+                log.seek(offset)
+                line = log.readline()
+                if line.endswith("\n") and log_time(line) == when:
+                    start = log.tell()
+                else:
+                    count = 0
+            else:
+                count = 0
+
+            index.seek(count * RECORD.size)
+            index.truncate()
+
+            log.seek(start)
+            offset = start
+            for line in log:
+                if not line.endswith("\n"):
+                    break  # Still being written
+                when = log_time(line)
+                if not when is None:
+                    index.write(RECORD.pack(offset, when))
+                    count += 1
+                offset += len(line)
+
+    return count
+
+
+def append(log_file, lines):
+    # Appends lines to the log (under its lock) and then indexes them
+    with open(log_file, "ab") as log:
+        fcntl.flock(log, fcntl.LOCK_EX)
+        log.write("".join(line.rstrip("\n") + "\n" for line in lines))
+    update_index(log_file)
+
+
+def backwards(log_file):
+    # Yields the records in the log, latest first, reading the index a block at a time
+    count = update_index(log_file)
+    with open(index_file(log_file), "rb") as index, open(log_file, "rb") as log:
+        while count > 0:
+            first = max(0, count - BLOCK)
+            index.seek(first * RECORD.size)
+            data = index.read((count - first) * RECORD.size)
+            for i in range(len(data) - RECORD.size, -1, -RECORD.size):
+                (offset, when) = RECORD.unpack_from(data, i)
+                log.seek(offset)
+                record = parse_line(log.readline())
+                if not record is None:
+                    yield record
+            count = first
+
+
+def history(log_file, family, lines=None):
+    '''
+    Returns the last lines (or all) changes of one family (wanip4 or wanip6) in the log as a list
+    of dicts with the time, the IP changed to, the reason and the previous IP and how long it was
+    held, oldest first. Reads the log from the end only as far back as it must.
+    '''
+    if lines is not None and lines <= 0:
+        return []
+
+    # The records that changed the family's IP, latest first. A record with the same IP as the one
+    # before it still counts (as a reconnect) unless it was logged for a change of the other family.
+    # We need one change more than we report (for the previous IP and how long it was held), and
+    # each record is only known to count once we've read the one before it.
+    other = "wanip6" if family == "wanip4" else "wanip4"
+    found = []
+    later = None
+    complete = False
+    for record in backwards(log_file):
+        if not record.get(family):
+            continue
+        if later is not None and (later[family] != record[family] or later.get(other) == record.get(other)):
+            found.append(later)
+            if lines is not None and len(found) == lines + 1:
+                complete = True
+                break
+        later = record
+    else:
+        if later is not None:
+            found.append(later)
+    found.reverse()
+
+    changes = []
+    previous = None
+    for record in found:
+        when = record["time"]
+        changes.append({"time": time_formatted(when), "epoch": when, "IP": record[family], "reason": record.get("reason", ""),
+                        "previous": "unknown" if previous is None else previous[1],
+                        "held": None if previous is None else when - previous[0]})
+        previous = (when, record[family])
+
+    if complete:
+        changes = changes[1:]
+    elif lines is not None:
+        changes = changes[-lines:]
+
+    return changes
+
+
+def change_line(wanip4, wanip6, reason):
+    # A log line recording a change of WAN IPs now
+    known = lambda IP: None if IP in ("", "unknown") else IP
+    return json.dumps({"time": int(time.time()), "wanip4": known(wanip4), "wanip6": known(wanip6), "reason": reason}, sort_keys=True)
+
+
+if args.Change:
+    append(args.File, [change_line(*args.Change)])
+elif args.Append:
+    append(args.File, sys.stdin.readlines())
+elif args.Reindex:
+    print "Indexed %d lines" % update_index(args.File, rebuild=True)
+else:
+    families = [(family, name) for (family, name) in FAMILIES if args.Family in (None, family)]
+    try:
+        histories = [(name, history(args.File, family, args.Lines)) for (family, name) in families]
+    except IOError as e:
+        print >> sys.stderr, "Cannot read the WAN IP log: {}".format(e)
+        sys.exit(1)
+
+    if args.json:
+        print json.dumps(dict(histories))
+    else:
+        for (name, changes) in histories:
+            if len(histories) > 1:
+                print "%s:" % name
+
+            for change in changes:
+                held = "an unknown time" if change["held"] is None else duration_formatted(change["held"])
+                print '%-15s for %17s until %19s. Changed to: %-15s Reason: %s' % (change["previous"], held, change["time"], change["IP"], change["reason"])
+
+            if changes:
+                print '%-15s for %17s until now.' % (changes[-1]["IP"], duration_formatted(time.time() - changes[-1]["epoch"]))
@@ -1,43 +1,64 @@
 #!/usr/bin/python
 #
-# Scans all the system logs for wan up and down messages to report teh time between them
+# Scans all the system logs for wan up and down messages to report teh time between them: the
+# outages, their mean time between failures and to repair, and the link's availability overall and
+# per day, week or month.
 #
 # A Work in progres, is being rewrritten currently
+#
+# Keeps an index of the log files it has scanned (see index_file) so that each run only scans the
+# lines logged since the last.
 
-import re, json, subprocess, os, argparse, gzip
+import re, json, subprocess, os, argparse, gzip, time, heapq, calendar, hashlib
 from datetime import datetime, timedelta
 
+try:
+    import multiprocessing
+    cpu_count = multiprocessing.cpu_count()
+except (ImportError, NotImplementedError):
+    multiprocessing = None
+    cpu_count = 1
+
 messages_file = 'messages'
 
 messages_file_RE = messages_file + '[-.]?(?P<num>[0-9]+)?(\.gz)?'
 
+devnull = open(os.devnull, 'w')
+
+parser = argparse.ArgumentParser(description='Report WAN up times as they appear in the system log file.',
+                                 formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=20))
+
+parser.add_argument('-l', '--Logs', action='store_true', help='List the link up and down messages found in the log files.')
+parser.add_argument('-L', '--LogSummary', action='store_true', help='Print a summary of the message log file.')
+parser.add_argument('-T', '--Test', action='store_true', help='Print a summary of the message log files.')
+parser.add_argument('-w', '--Warnings', action='store_true', help='Show parser warnings (supressed by default)')
+parser.add_argument('-r', '--Rescan', action='store_true', help='Ignore the index of log files already scanned and scan them all again.')
+parser.add_argument('-j', '--Jobs', type=int, default=cpu_count, help='Log files to scan at once, in parallel processes (default: %d, the number of CPUs).' % cpu_count)
+parser.add_argument('-d', '--LogDir', action='append', help='Look for log files in this directory (can be repeated) rather than the standard places.')
+parser.add_argument('-I', '--Index', default='/srv/wan/wantimes.json', help='The index of log files scanned (default: %(default)s).')
+parser.add_argument('-t', '--Timeline', action='store_true', help='List every up and down period found.')
+parser.add_argument('-p', '--Period', choices=['day', 'week', 'month'], help='Report availability per day, week or month.')
+parser.add_argument('-n', '--Longest', type=int, default=5, help='How many of the longest outages to list (default: %(default)s).')
+
+args = parser.parse_args()
+
 # Check the USB mounted disk first for log files.
 # if it can't be found try the standard /var/log.
 # This assumes logging is configure by default to
 # mounted USB drive on the router.
 found_messages = False
-log_dirs_to_check = ['/mnt/sda1/log', "/var/log"]
+log_dirs_to_check = args.LogDir or ['/mnt/sda1/log', "/var/log"]
 log_dirs = []
 
 for log_dir in log_dirs_to_check:
+    if not os.path.isdir(log_dir):
+        continue
     for file_name in os.listdir(log_dir):
         if re.match(messages_file_RE, file_name):
             found_messages = True
             log_dirs.append(log_dir)
             break
 
-devnull = open(os.devnull, 'w')
-
-parser = argparse.ArgumentParser(description='Report WAN up times as they appear in the system log file.',
-                                 formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=20))
-
-parser.add_argument('-l', '--Logs', action='store_true', help='Dump the actual log file entries found.')
-parser.add_argument('-L', '--LogSummary', action='store_true', help='Print a summary of the message log file.')
-parser.add_argument('-T', '--Test', action='store_true', help='Print a summary of the message log files.')
-parser.add_argument('-w', '--Warnings', action='store_true', help='Show parser warnings (supressed by default)')
-
-args = parser.parse_args()
-
 # A sample message stream of the sort we want to summarise
 # 2017-05-29T00:09:32+10:00 notice netifd[]: Interface 'wan' has link connectivity
 # 2017-05-29T00:09:32+10:00 notice netifd[]: Interface 'wan' is setting up now
@@ -81,16 +102,6 @@ def displaymatch(match):
     return '<Match: %r, groups=%r>' % (match.group(), match.groups())
 
 
-def add_time_offet(time, offset):
-    # offset is in log format of [+-]hh:mm
-    match = re.match(r"(?P<dir>[+-])(?P<hours>\d\d):(?P<mins>\d\d)", offset)
-    delta = timedelta(hours=int(match.group("hours")), minutes=int(match.group("mins")))
-    if match.group("dir") == "+":
-        return time + delta
-    else:
-        return time - delta
-
-
 def get_wan_status():
     try:
         status = subprocess.check_output(["ubus", "call", "network.interface.wan", "status"], stderr=devnull)
@@ -138,8 +149,198 @@ def duration_formatted(seconds, suffixes=['y', 'w', 'd', 'h', 'm', 's'], add_s=F
     return separator.join(time)
 
 
-went_up = None
-went_down = None
+# Have observed two log file patterns. The time format seems to have altered at some point, from
+# 2017-05-29T00:09:32+10:00 (local time with its UTC offset) to 2017-05-29 00:09:32 (local time).
+log_pattern = r"(?P<time>\d\d\d\d-\d\d-\d\d[ T]\d\d:\d\d\:\d\d(?:[+-]\d\d:\d\d)?)\s+(?P<type>\w*)\s+(?P<process>[\w()./\-]*)\[(?P<pid>\d*)\]: (?P<message>.*)$"
+time_pattern = "%Y-%m-%d %H:%M:%S"
+up_pattern = r"Network device .*wan.* link is up"
+down_pattern = r"Network device .*wan.* link is down"
+
+log_RE = re.compile(log_pattern)
+up_RE = re.compile(up_pattern)
+down_RE = re.compile(down_pattern)
+
+# An index of the log files scanned so far, so that on each run we only need to scan what's been
+# logged since the last. Keyed on device and inode (which survive the renaming of log rotation)
+# each entry records the size, mtime and offset scanned to of the file and the up/down events
+# found in it so far. An inode can be reused (by a new log once a rotated one is deleted) so each
+# entry also records a fingerprint of the file (a hash of its first bytes, up to FINGERPRINT of
+# them, as far as it was scanned) and a file that doesn't match it is scanned afresh.
+index_file = args.Index
+index_version = 3
+
+FINGERPRINT = 1024
+
+
+def parse_log_time(log_time):
+    # Returns the log time as seconds since the epoch, so that durations are right across daylight
+    # saving changes. The log time has a fixed layout (time_pattern, maybe with a UTC offset) so we
+    # can slice it, which is much faster than strptime.
+    fields = (int(log_time[0:4]), int(log_time[5:7]), int(log_time[8:10]),
+              int(log_time[11:13]), int(log_time[14:16]), int(log_time[17:19]), 0, 0, -1)
+    if len(log_time) > 19:
+        offset = int(log_time[20:22]) * 3600 + int(log_time[23:25]) * 60
+        return calendar.timegm(fields) - (offset if log_time[19] == "+" else -offset)
+    else:
+        return int(time.mktime(fields))
+
+
+def scan_log(log_file, events, complete=False):
+    # Appends (time, "up" or "down") to events for each link up or down message in log_file.
+    # Returns the number of bytes scanned, which stops short of an incomplete last line (still
+    # being written) unless the file is complete.
+    scanned = 0
+    for line in log_file:
+        if not complete and not line.endswith("\n"):
+            break
+
+        scanned += len(line)
+
+        # A cheap test that rejects almost all lines before we try the regular expressions
+        if "netifd" in line:
+            match = log_RE.match(line)
+
+            if match and match.group("type") == "notice" and match.group("process") == "netifd":
+                log_msg = match.group("message")
+                if up_RE.match(log_msg):
+                    events.append((match.group("time"), "up"))
+                elif down_RE.match(log_msg):
+                    events.append((match.group("time"), "down"))
+
+    return scanned
+
+
+def load_index():
+    try:
+        with open(index_file) as f:
+            index = json.load(f)
+        # An index written by a version that recognised different log lines is no use to us
+        return index["files"] if index.get("version") == index_version else {}
+    except (IOError, ValueError, KeyError, AttributeError):
+        return {}
+
+
+def save_index(index):
+    # Write a new index and move it into place, so a concurrent run never reads half an index
+    try:
+        index_dir = os.path.dirname(index_file)
+        if not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        with open(index_file + ".tmp", "w") as f:
+            json.dump({"version": index_version, "files": index}, f)
+        os.rename(index_file + ".tmp", index_file)
+    except (IOError, OSError):
+        pass  # No worries, we'll just scan everything again next time
+
+
+def fingerprint(file, length):
+    # A hash of the first length bytes of a file, with the length, as [length, hash]
+    with open(file, 'rb') as f:
+        head = f.read(length)
+    return [len(head), hashlib.sha1(head).hexdigest()]
+
+
+def scan_file(job):
+    # Scans one log file (job being the file name, offset to start at, its size and whether it's
+    # compressed) and returns the offset scanned to and the events found. A function in its own
+    # right so that worker processes can run it.
+    (file, start, size, compressed) = job
+    events = []
+    if compressed:
+        log_file = gzip.open(file)
+        scan_log(log_file, events, complete=True)
+        scanned = size
+    else:
+        log_file = open(file, 'rb')
+        log_file.seek(start)
+        scanned = start + scan_log(log_file, events)
+    log_file.close()
+    return (scanned, events)
+
+
+def scan_files(jobs):
+    # Runs scan_file on each job, returning the results in the same order. Rotated logs are
+    # independent of one another, so if there's more than one to scan they're scanned in parallel
+    # (decompressing them is most of the work, and a process per CPU keeps them all busy).
+    processes = min(args.Jobs, len(jobs))
+    if multiprocessing is None or processes < 2:
+        return [scan_file(job) for job in jobs]
+
+    try:
+        pool = multiprocessing.Pool(processes)
+    except (OSError, ImportError):
+        return [scan_file(job) for job in jobs]  # No semaphores on this system (no /dev/shm)
+
+    try:
+        # The timeout on get() keeps Ctrl-C working (a plain map() can't be interrupted)
+        return pool.map_async(scan_file, jobs, 1).get(365 * 86400)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def scan_logs(log_files):
+    # Returns a list of (time, "up" or "down") events from all the log files, scanning only the
+    # parts of them not already in the index.
+    index = {} if args.Rescan else load_index()
+    new_index = {}
+    entries = []
+    jobs = []
+
+    for file in log_files:
+        try:
+            stat = os.stat(file)
+        except OSError:
+            continue
+
+        key = "%d:%d" % (stat.st_dev, stat.st_ino)
+        compressed = file.endswith('.gz')
+        entry = index.get(key)
+
+        try:
+            same_file = entry and fingerprint(file, entry["fingerprint"][0]) == entry["fingerprint"]
+        except (IOError, KeyError, TypeError):
+            same_file = False
+
+        if same_file and entry["compressed"] == compressed:
+            if compressed:
+                # Compressed logs don't change, if this one has it's fully indexed
+                fresh = entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+                start = None if fresh else 0
+            else:
+                # Plain logs grow, scan only what's been added (unless it's been truncated)
+                start = entry["offset"] if stat.st_size >= entry["offset"] else 0
+        else:
+            start = 0
+
+        if start == 0 or entry is None:
+            entry = {"offset": 0, "events": []}
+
+        if start is not None and (start == 0 or stat.st_size > start):
+            jobs.append((entry, (file, start, stat.st_size, compressed)))
+
+        entry.update({"file": file, "compressed": compressed, "size": stat.st_size, "mtime": stat.st_mtime})
+        new_index[key] = entry
+        entries.append(entry)
+
+    results = scan_files([job for (entry, job) in jobs])
+    for ((entry, job), (scanned, new_events)) in zip(jobs, results):
+        entry["offset"] = scanned
+        entry["events"] = entry["events"] + new_events
+        try:
+            entry["fingerprint"] = fingerprint(job[0], min(FINGERPRINT, job[2] if job[3] else scanned))
+        except IOError:
+            entry["fingerprint"] = [0, None]  # Never matches, so it's scanned afresh next time
+
+    # Files no longer present drop out of the index
+    save_index(new_index)
+
+    # In log file order, so that the result is the same however the files were scanned
+    events = []
+    for entry in entries:
+        events += [tuple(event) for event in entry["events"]]
+
+    return events
 
 
 def read_messages():
@@ -153,12 +354,6 @@ def read_messages():
     log_files = sorted(message_files, key=lambda f: os.path.basename(f), reverse=True)
     # log_files.reverse()
 
-    # Have observed two log file patterns. The time format seems to have altered at some point.
-    log_pattern = r"(?P<time>\d\d\d\d-\d\d-\d\d \d\d:\d\d\:\d\d)\s+(?P<type>\w*)\s+(?P<process>[\w()./\-]*)\[(?P<pid>\d*)\]: (?P<message>.*)$"
-    time_pattern = "%Y-%m-%d %H:%M:%S"
-    up_pattern = r"Network device .*wan.* link is up"
-    down_pattern = r"Network device .*wan.* link is down"
-
     # If testing just scan files and report how often these REs match
     if args.Test:
         # Print line_counts, recognised log format counts and  and match counts
@@ -176,7 +371,7 @@ def read_messages():
             for line in log_file:
                 lines += 1
 
-                match = re.match(log_pattern, line)
+                match = log_RE.match(line)
 
                 if match:
                     recognised += 1
@@ -184,129 +379,105 @@ def read_messages():
                         matched += 1
 
                         log_msg = match.group("message")
-                        if re.match(up_pattern, log_msg):
+                        if up_RE.match(log_msg):
                             ups += 1
-                        elif re.match(down_pattern, log_msg):
+                        elif down_RE.match(log_msg):
                             downs += 1
 
             print file, lines, "lines, ", recognised, "recognised", matched, "matched", ups, "ups", downs, "downs"
 
-    # Else build a time keyed dict on link up and down messages.
-    else:
-        updown = {}
-        for file in log_files:
-            if file.endswith('.gz'):
-                log_file = gzip.open(file)
-            else:
-                log_file = open(file)
-
-            for line in log_file:
-                match = re.match(log_pattern, line)
-
-                if not match is None:
-                    # Extract the time
-                    log_time = match.group("time")
-
-                    # Parse it
-                    log_time = datetime.strptime(log_time, time_pattern)
-
-                    # And the log message
-                    log_msg = match.group("message")
-
-                    if match.group("type") == "notice" and match.group("process") == "netifd":
-                        if re.match(up_pattern, log_msg):
-                            updown[log_time] = "up"
-                        elif re.match(down_pattern, log_msg):
-                            updown[log_time] = "down"
+        return []
 
-        # Now walk the sorted keys and report
-        for time in sorted(updown.keys()):
-            print time, updown[time]
-
-    exit()
+    # Else return the link up and down messages in time order (stable, so that of two at the same
+    # time the one logged last stays last).
+    else:
+        events = [(parse_log_time(log_time), state) for (log_time, state) in scan_logs(log_files)]
+        events.sort(key=lambda event: event[0])
+        return events
+
+
+
+def timeline(events):
+    # Pairs the up and down events into a sequence of (start, end, state) periods, state being
+    # "up" or "down" and end None for the current period. Repeats of the current state (as when
+    # the link is reported up twice, say by two wan devices) don't start a new period.
+    current = None
+    for (when, state) in events:
+        if current is None:
+            current = (when, state)
+        elif state != current[1]:
+            yield (current[0], when, current[1])
+            current = (when, state)
+        elif args.Warnings:
+            print "Warning: Link went %s at %s when it was not %s!" % (state, time_formatted(when), "up" if state == "down" else "down")
+
+    if not current is None:
+        yield (current[0], None, current[1])
+
+
+def period_of(when, period):
+    # The period (day, week or month) that a time falls in, as a label and the time it ends
+    start = datetime.fromtimestamp(when).replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "day":
+        end = start + timedelta(days=1)
+    elif period == "week":
+        start -= timedelta(days=start.weekday())
+        end = start + timedelta(days=7)
+    else:
+        start = start.replace(day=1)
+        end = (start + timedelta(days=31)).replace(day=1)
+    return (start.strftime("%Y-%m-%d" if period != "month" else "%Y-%m"), int(time.mktime(end.timetuple())))
 
-    # Then scan the messages log for down and up reports
-    count = 0
 
-    # Build a time keyed dict of messages first
-    output = []
-    for file in log_files:
-        if file.endswith('.gz'):
-            log_file = gzip.open(log_dir + '/' + file)
-        else:
-            log_file = open(log_dir + '/' + file)
-
-        file_line = 0
-        link_up = False
-        have_state = False
-        for line in log_file:
-            file_line += 1
-
-            pattern = 0
-            match = re.match(log_pattern1, line)
-            if not match is None:
-                pattern = 1
-            else:
-                match = re.match(log_pattern2, line)
-                if not match is None:
-                    pattern = 2
-
-            if not match is None:
-                count += 1
-
-                # Timezone offset if present
-                log_time = match.group("time")
-
-                # Get the log time
-                if pattern == 1:
-                    log_time = datetime.strptime(log_time, "%Y-%m-%d %H:%M:%S")
-                elif pattern == 2:
-                    off_pattern = r'([+-]\d\d:\d\d$)'
-                    off_time = re.search(off_pattern, log_time).group(1)
-                    log_time = re.sub(off_pattern, '', log_time)
-                    log_time = datetime.strptime(log_time, "%Y-%m-%dT%H:%M:%S")
-                    log_time = add_time_offet(log_time, off_time)
-
-                # And the log message
-                log_msg = match.group("message")
+def statistics(periods, now, period=None, longest=5):
+    # One pass over the timeline, totalling the time up and down (overall and for each period if
+    # asked), counting the outages and keeping the longest of them.
+    stats = {"up": 0, "down": 0, "failures": 0, "repairs": 0, "start": None, "end": now,
+             "periods": {}, "longest": []}
 
-                if count == 1:
-                    log_first = log_time
+    for (start, end, state) in periods:
+        if stats["start"] is None:
+            stats["start"] = start
 
-                if match.group("type") == "notice" and match.group("process") == "netifd":
-                    if args.Logs:
-                        print line.strip()
+        stop = now if end is None else end
+        stats[state] += stop - start
 
-                    if (log_msg == "Interface 'wan' is now up"):
-                        if not link_up:
-                            link_up = True
-                            went_up = log_time
-                        elif have_state and args.Warnings:
-                            print "Warning: Link went up when it was not down!"
+        if state == "down":
+            stats["failures"] += 1
+            if not end is None:
+                stats["repairs"] += 1
 
-                        have_state = True
+            # A small heap of the longest outages, the shortest of them on top ready to be replaced
+            outage = (stop - start, start, end)
+            if len(stats["longest"]) < longest:
+                heapq.heappush(stats["longest"], outage)
+            elif outage > stats["longest"][0]:
+                heapq.heapreplace(stats["longest"], outage)
 
-                    elif (log_msg == "Interface 'wan' is now down"):
-                        if link_up:
-                            link_up = False
-                            went_down = log_time
-                            was_up_for = went_down - went_up
-                            output += ["Link was up for %s until %s" % (was_up_for, datetime.strftime(went_down, "%c"))]
-                        elif have_state and args.Warnings:
-                            print "Warning: Link went down when it was not up!"
+        # Split the period over the days, weeks or months it spans
+        if period:
+            counts = stats["periods"]
+            first = True
+            while start < stop:
+                (label, period_end) = period_of(start, period)
+                if not label in counts:
+                    counts[label] = {"up": 0, "down": 0, "outages": 0}
+                counts[label][state] += min(stop, period_end) - start
+                if state == "down" and first:
+                    counts[label]["outages"] += 1
+                first = False
+                start = period_end
 
-                        have_state = True
+    stats["longest"] = sorted(stats["longest"], reverse=True)
+    return stats
 
-            elif len(line.strip()) > 0 and args.Warnings:
-                print "Warning: Ill formed log line in \"%s\" (line %s) was ignored:\n\t%s" % (file, file_line, line)
 
-    log_last = log_time
+def availability(up, down):
+    return 100.0 * up / (up + down) if up + down > 0 else 100.0
 
-    # Report a summary of the system log file first if asked
-    if args.LogSummary:
-        print "System log has %s entries, spanning %s between %s and %s" % (count, duration_formatted((log_last - log_first).total_seconds()), log_first, log_last)
 
-    return output
+def time_formatted(when):
+    return datetime.fromtimestamp(when).strftime("%c")
 
 
 # Then report the known up time
@@ -315,14 +486,53 @@ if wan_status:
     up_time = datetime.now() - timedelta(seconds=wan_status["uptime"])
     print "Link has been up for %s since %s (from current WAN status)" % (duration_formatted(wan_status["uptime"]), datetime.strftime(up_time, "%c"))
 
-# Read the logged messages producing "output"
+# Then the outages found in the system log files
 if found_messages:
-    output = read_messages()
-
-    # And finally the uptimes from the system log file
-    if len(output) > 0:
-        print "\n".join(output)
-
-    if ((went_down is None and not went_up is None) or went_up > went_down):
-        was_up_for = duration_formatted((datetime.now() - went_up).total_seconds())
-        print "Link has (apparently) been up for %s since %s (from system message log)" % (was_up_for, datetime.strftime(went_up, "%c"))
+    events = read_messages()
+
+    if events:
+        now = int(time.time())
+        periods = list(timeline(events))
+
+        if args.Logs:
+            for (when, state) in events:
+                print "Link went %s at %s" % (state, time_formatted(when))
+            print
+
+        # Report a summary of the system log file first if asked
+        if args.LogSummary:
+            print "System log has %s link up and down messages, spanning %s between %s and %s" % (
+                len(events), duration_formatted(events[-1][0] - events[0][0]), time_formatted(events[0][0]), time_formatted(events[-1][0]))
+
+        if args.Timeline:
+            for (start, end, state) in periods:
+                if end is None:
+                    print "Link has (apparently) been %s for %s since %s (from system message log)" % (state, duration_formatted(now - start), time_formatted(start))
+                else:
+                    print "Link was %s for %s until %s" % (state, duration_formatted(end - start), time_formatted(end))
+            print
+
+        stats = statistics(periods, now, args.Period, args.Longest)
+        failures = stats["failures"]
+        repairs = stats["repairs"]
+
+        print "Over %s since %s:" % (duration_formatted(now - stats["start"]), time_formatted(stats["start"]))
+        print "\t%d outages, %s down in total" % (failures, duration_formatted(stats["down"]))
+        print "\tAvailability: %.3f%%" % availability(stats["up"], stats["down"])
+        if failures:
+            print "\tMean time between failures: %s" % duration_formatted(stats["up"] / failures)
+        if repairs:
+            # Of the outages that are over (one still under way hasn't been repaired yet)
+            repair_time = stats["down"] - (now - periods[-1][0] if periods[-1][2] == "down" else 0)
+            print "\tMean time to repair: %s" % duration_formatted(repair_time / repairs)
+
+        if stats["longest"]:
+            print "\nLongest outages:"
+            for (duration, start, end) in stats["longest"]:
+                print "\t%s from %s%s" % (duration_formatted(duration), time_formatted(start), "" if end else " (still down)")
+
+        if args.Period:
+            print "\nAvailability by %s:" % args.Period
+            for label in sorted(stats["periods"]):
+                counts = stats["periods"][label]
+                print "\t%-10s %8.3f%% %4d outages, %s down" % (label, availability(counts["up"], counts["down"]), counts["outages"], duration_formatted(counts["down"]))